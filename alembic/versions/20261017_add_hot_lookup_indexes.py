@@ -0,0 +1,57 @@
+"""add composite/partial indexes for hot per-user lookups
+
+On Postgres the indexes are built CONCURRENTLY (outside the migration
+transaction), so the tables stay writable while they build.
+
+Revision ID: 20261017_add_hot_lookup_indexes
+Revises: 20261017_add_user_tariffs_status_ended_at
+Create Date: 2026-10-17
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_hot_lookup_indexes"
+down_revision = "20261017_add_user_tariffs_status_ended_at"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, extra create_index kwargs)
+_INDEXES = [
+    ("ix_user_tariffs_user_status_ended_at", "user_tariffs", ["user_id", "status", "ended_at"], {}),
+    (
+        "ix_vpn_peers_user_active_created_at",
+        "vpn_peers",
+        ["user_id", "active", "created_at"],
+        {"postgresql_where": sa.text("active"), "sqlite_where": sa.text("active = 1")},
+    ),
+]
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def upgrade():
+    if _is_postgres():
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with op.get_context().autocommit_block():
+            for name, table, columns, kw in _INDEXES:
+                op.create_index(
+                    name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw
+                )
+        return
+    for name, table, columns, kw in _INDEXES:
+        op.create_index(name, table, columns, **kw)
+
+
+def downgrade():
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            for name, table, _columns, _kw in reversed(_INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+        return
+    for name, table, _columns, _kw in reversed(_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,45 @@
+"""add iap_products: app store product id -> tariff mapping
+
+Replaces the hardcoded ProductIdToTariffMapper dicts. The table starts empty:
+the old mapping pointed at fixed tariff ids that need not exist, so products
+are mapped by an admin (PUT /tariffs/{tariff_id}/products/{product_id}).
+
+Revision ID: 20261017_add_iap_products
+Revises: 20261017_add_payments_provider_unique
+Create Date: 2026-10-17
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_iap_products"
+down_revision = "20261017_add_payments_provider_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "iap_products",
+        sa.Column("product_id", sa.String(), primary_key=True),
+        sa.Column(
+            "tariff_id",
+            sa.Integer(),
+            sa.ForeignKey("tariffs.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+    )
+    op.create_index("ix_iap_products_tariff_id", "iap_products", ["tariff_id"])
+
+
+def downgrade():
+    op.drop_index("ix_iap_products_tariff_id", table_name="iap_products")
+    op.drop_table("iap_products")
@@ -0,0 +1,56 @@
+"""add ip_pools and ip_allocations for WireGuard address allocation
+
+Revision ID: 20261017_add_ip_pools
+Revises: 20250928_add_wg_config_encrypted
+Create Date: 2026-10-17
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_ip_pools"
+down_revision = "20250928_add_wg_config_encrypted"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ip_pools",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("cidr", sa.String(), nullable=False, unique=True),
+        sa.Column("next_offset", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+    )
+    op.create_index("ix_ip_pools_id", "ip_pools", ["id"])
+    op.create_table(
+        "ip_allocations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "pool_id",
+            sa.Integer(),
+            sa.ForeignKey("ip_pools.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("address", sa.String(), nullable=False, unique=True),
+        sa.Column("in_use", sa.Boolean(), nullable=False, server_default=sa.true()),
+    )
+    op.create_index("ix_ip_allocations_id", "ip_allocations", ["id"])
+    op.create_index("ix_ip_allocations_pool_free", "ip_allocations", ["pool_id", "in_use"])
+    # Existing vpn_peers addresses are not backfilled: the allocator skips
+    # addresses already used by a peer and keeps them reserved.
+
+
+def downgrade():
+    op.drop_index("ix_ip_allocations_pool_free", table_name="ip_allocations")
+    op.drop_index("ix_ip_allocations_id", table_name="ip_allocations")
+    op.drop_table("ip_allocations")
+    op.drop_index("ix_ip_pools_id", table_name="ip_pools")
+    op.drop_table("ip_pools")
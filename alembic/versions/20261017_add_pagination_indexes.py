@@ -0,0 +1,32 @@
+"""add (created_at, id) indexes for keyset pagination
+
+Revision ID: 20261017_add_pagination_indexes
+Revises: 20261017_add_vpn_peers_updated_at
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_pagination_indexes"
+down_revision = "20261017_add_vpn_peers_updated_at"
+branch_labels = None
+depends_on = None
+
+_INDEXES = [
+    ("ix_vpn_peers_created_at_id", "vpn_peers", ["created_at", "id"]),
+    ("ix_vpn_peers_user_created_at_id", "vpn_peers", ["user_id", "created_at", "id"]),
+    ("ix_payments_created_at_id", "payments", ["created_at", "id"]),
+    ("ix_payments_user_created_at_id", "payments", ["user_id", "created_at", "id"]),
+    ("ix_tariffs_created_at_id", "tariffs", ["created_at", "id"]),
+]
+
+
+def upgrade():
+    for name, table, columns in _INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _columns in reversed(_INDEXES):
+        op.drop_index(name, table_name=table)
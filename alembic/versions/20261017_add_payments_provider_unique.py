@@ -0,0 +1,59 @@
+"""unique (provider, provider_payment_id) on payments for idempotent ingestion
+
+Provider retries used to create duplicate rows; they are removed first,
+keeping the oldest row of each (provider, provider_payment_id). Rows without
+a provider payment id are not affected (NULLs never conflict). On Postgres the
+index is built CONCURRENTLY.
+
+Revision ID: 20261017_add_payments_provider_unique
+Revises: 20261017_add_hot_lookup_indexes
+Create Date: 2026-10-17
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_payments_provider_unique"
+down_revision = "20261017_add_hot_lookup_indexes"
+branch_labels = None
+depends_on = None
+
+_NAME = "uix_payments_provider_payment_id"
+_COLUMNS = ["provider", "provider_payment_id"]
+
+
+def upgrade():
+    op.execute(
+        sa.text(
+            "DELETE FROM payments WHERE provider_payment_id IS NOT NULL AND EXISTS ("
+            "SELECT 1 FROM payments AS older"
+            " WHERE older.provider = payments.provider"
+            " AND older.provider_payment_id = payments.provider_payment_id"
+            " AND older.id < payments.id)"
+        )
+    )
+    if op.get_bind().dialect.name == "postgresql":
+        # commit the cleanup first: CREATE INDEX CONCURRENTLY needs its own transaction
+        with op.get_context().autocommit_block():
+            op.create_index(
+                _NAME,
+                "payments",
+                _COLUMNS,
+                unique=True,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        return
+    op.create_index(_NAME, "payments", _COLUMNS, unique=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.drop_index(
+                _NAME, table_name="payments", postgresql_concurrently=True, if_exists=True
+            )
+        return
+    op.drop_index(_NAME, table_name="payments")
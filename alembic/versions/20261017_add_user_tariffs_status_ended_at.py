@@ -0,0 +1,22 @@
+"""add (status, ended_at) index on user_tariffs for the expiry sweep
+
+Revision ID: 20261017_add_user_tariffs_status_ended_at
+Revises: 20261017_add_pagination_indexes
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_user_tariffs_status_ended_at"
+down_revision = "20261017_add_pagination_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_user_tariffs_status_ended_at", "user_tariffs", ["status", "ended_at"])
+
+
+def downgrade():
+    op.drop_index("ix_user_tariffs_status_ended_at", table_name="user_tariffs")
@@ -0,0 +1,38 @@
+"""add updated_at to vpn_peers for incremental reconciliation
+
+Revision ID: 20261017_add_vpn_peers_updated_at
+Revises: 20261017_add_ip_pools
+Create Date: 2026-10-17
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_add_vpn_peers_updated_at"
+down_revision = "20261017_add_ip_pools"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite cannot add a column with a non-constant default, so add it
+    # nullable, backfill from created_at, then tighten it.
+    with op.batch_alter_table("vpn_peers") as batch_op:
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE vpn_peers SET updated_at = created_at")
+    with op.batch_alter_table("vpn_peers") as batch_op:
+        batch_op.alter_column(
+            "updated_at",
+            existing_type=sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        )
+        batch_op.create_index("ix_vpn_peers_updated_at", ["updated_at"])
+
+
+def downgrade():
+    with op.batch_alter_table("vpn_peers") as batch_op:
+        batch_op.drop_index("ix_vpn_peers_updated_at")
+        batch_op.drop_column("updated_at")
@@ -0,0 +1,28 @@
+"""let revoked vpn_peers release their address
+
+Revision ID: 20261017_vpn_peers_wg_ip_nullable
+Revises: 20261017_add_email_outbox
+Create Date: 2026-10-17
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_vpn_peers_wg_ip_nullable"
+down_revision = "20261017_add_email_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("vpn_peers") as batch_op:
+        batch_op.alter_column("wg_ip", existing_type=sa.String(), nullable=True)
+
+
+def downgrade():
+    # revoked peers without an address cannot be represented any more
+    op.execute("DELETE FROM vpn_peers WHERE wg_ip IS NULL")
+    with op.batch_alter_table("vpn_peers") as batch_op:
+        batch_op.alter_column("wg_ip", existing_type=sa.String(), nullable=False)
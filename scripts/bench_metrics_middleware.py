@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Measure the per-request cost of the Prometheus middleware (vpn_api/metrics.py).
+
+The application is called directly as an ASGI app (no HTTP client or server
+in between) with the same synthetic requests, once with its middleware stack
+built without MetricsMiddleware and once as configured; the difference of
+the medians is what the middleware adds to every request. Because endpoint
+timings are noisy compared to that difference, the middleware is also timed
+around a no-op ASGI app, which isolates its own cost.
+
+Usage:
+  python scripts/bench_metrics_middleware.py --requests 20000 --path /
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+_db = Path(tempfile.gettempdir()) / f"vpn_api_bench_{os.getpid()}.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db.as_posix()}")
+os.environ.setdefault("DEV_INIT_DB", "1")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+from vpn_api.main import app  # noqa: E402
+from vpn_api.metrics import MetricsMiddleware  # noqa: E402
+
+
+def _scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(_message):
+    pass
+
+
+async def measure(asgi, path: str, total: int) -> list[float]:
+    for _ in range(min(500, total)):  # warm up
+        await asgi(_scope(path), _receive, _send)
+    samples = []
+    for _ in range(total):
+        scope = _scope(path)
+        started = time.perf_counter()
+        await asgi(scope, _receive, _send)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 2),
+        "p95_us": round(samples[int(len(samples) * 0.95)] * 1e6, 2),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+    }
+
+
+async def _noop(_scope, _receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _rebuild(user_middleware: list) -> None:
+    app.user_middleware = user_middleware
+    # Starlette builds the stack lazily on the next call
+    app.middleware_stack = None
+
+
+async def run(total: int, path: str) -> dict:
+    configured = list(app.user_middleware)
+    _rebuild([m for m in configured if m.cls is not MetricsMiddleware])
+    try:
+        bare = await measure(app, path, total)
+    finally:
+        _rebuild(configured)
+    wrapped = await measure(app, path, total)
+    without, with_metrics = _summary(bare), _summary(wrapped)
+    noop = _summary(await measure(_noop, path, total))
+    noop_wrapped = _summary(await measure(MetricsMiddleware(_noop), path, total))
+    return {
+        "path": path,
+        "requests": total,
+        "without_middleware": without,
+        "with_middleware": with_metrics,
+        "overhead_p50_us": round(with_metrics["p50_us"] - without["p50_us"], 2),
+        "isolated_overhead_p50_us": round(noop_wrapped["p50_us"] - noop["p50_us"], 2),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--requests", type=int, default=20000)
+    p.add_argument("--path", default="/")
+    args = p.parse_args()
+    try:
+        result = asyncio.run(run(args.requests, args.path))
+    finally:
+        if _db.exists():
+            _db.unlink()
+    for k, v in result.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
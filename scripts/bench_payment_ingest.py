@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Measure payment event ingestion throughput (vpn_api/payment_ingest.py).
+
+Synthetic provider events go through the admin import endpoint in process
+(full ASGI stack, request validation included) against a SQLite file
+database, in three passes over the same payment ids:
+
+  insert      every event is new (pending)
+  replay      the same events again: all conflicts, nothing changes
+  transition  every payment moves pending -> completed
+
+For comparison, ``--baseline`` events are also created one per request via
+the old single-row ``POST /payments/``.
+
+Usage:
+  python scripts/bench_payment_ingest.py --events 100000 --request-size 10000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+_db = Path(tempfile.gettempdir()) / f"vpn_api_bench_{os.getpid()}.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db.as_posix()}")
+os.environ.setdefault("DEV_INIT_DB", "1")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("PROMOTE_SECRET", "bench-promote")
+os.environ.setdefault("PAYMENT_INGEST_MAX_EVENTS", "1000000")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from vpn_api.main import app  # noqa: E402
+
+
+def admin_headers(client: TestClient) -> dict:
+    email = f"bench-payments-{os.getpid()}@example.com"
+    r = client.post("/auth/register", json={"email": email, "password": "benchpass"})
+    client.post(
+        "/auth/admin/promote",
+        params={"user_id": r.json()["id"], "secret": os.environ["PROMOTE_SECRET"]},
+    )
+    r = client.post("/auth/login", json={"email": email, "password": "benchpass"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def ingest(client: TestClient, headers: dict, events: list, request_size: int) -> dict:
+    totals = {"applied": 0, "ignored": 0}
+    started = time.perf_counter()
+    for i in range(0, len(events), request_size):
+        payload = {"provider": "bench", "events": events[i : i + request_size]}
+        r = client.post("/payments/import", json=payload, headers=headers)
+        assert r.status_code == 200, r.text
+        for k in totals:
+            totals[k] += r.json()[k]
+    elapsed = time.perf_counter() - started
+    return {**totals, "seconds": round(elapsed, 3), "events_per_s": round(len(events) / elapsed)}
+
+
+def single_row(client: TestClient, headers: dict, total: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(total):
+        r = client.post(
+            "/payments/",
+            json={"user_id": None, "amount": "1.00", "provider": "bench"},
+            headers=headers,
+        )
+        assert r.status_code == 200, r.text
+    elapsed = time.perf_counter() - started
+    return {"seconds": round(elapsed, 3), "events_per_s": round(total / elapsed)}
+
+
+def run(total: int, request_size: int, baseline: int) -> dict:
+    events = [
+        {"provider_payment_id": f"bench_{i}", "status": "pending", "amount": "1.00"}
+        for i in range(total)
+    ]
+    with TestClient(app) as client:
+        headers = admin_headers(client)
+        result = {"events": total, "request_size": request_size}
+        result["insert"] = ingest(client, headers, events, request_size)
+        result["replay"] = ingest(client, headers, events, request_size)
+        for e in events:
+            e["status"] = "completed"
+        result["transition"] = ingest(client, headers, events, request_size)
+        if baseline:
+            result["single_row_post"] = single_row(client, headers, baseline)
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--events", type=int, default=100000)
+    p.add_argument("--request-size", type=int, default=10000, help="events per import request")
+    p.add_argument("--baseline", type=int, default=2000, help="single-row POSTs to time (0: skip)")
+    args = p.parse_args()
+    try:
+        result = run(args.events, args.request_size, args.baseline)
+    finally:
+        if _db.exists():
+            _db.unlink()
+    for k, v in result.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
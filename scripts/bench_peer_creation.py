@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Measure POST /vpn_peers/self throughput against a stubbed wg-easy.
+
+The wg-easy controller is replaced by an in-process stub that sleeps for a
+configurable latency per call, so the numbers reflect how many remote
+creations a single worker can keep in flight at once.
+
+Usage:
+  python scripts/bench_peer_creation.py --concurrency 50 --requests 200 --latency-ms 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+_db = Path(tempfile.gettempdir()) / f"vpn_api_bench_{os.getpid()}.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db.as_posix()}")
+os.environ.setdefault("DEV_INIT_DB", "1")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ["WG_KEY_POLICY"] = "wg-easy"
+os.environ.setdefault("WG_EASY_URL", "http://wg-easy.stub")
+os.environ.setdefault("WG_EASY_PASSWORD", "stub")
+
+import httpx  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+
+os.environ.setdefault("CONFIG_ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from vpn_api import peers  # noqa: E402
+from vpn_api.main import app  # noqa: E402
+
+
+def install_stub(latency: float):
+    counter = {"n": 0}
+
+    async def fake_create(url, password, name):
+        await asyncio.sleep(latency)
+        counter["n"] += 1
+        return {"id": f"cid-{counter['n']}", "publicKey": f"pub-{name}"}
+
+    async def fake_config(url, password, client_id):
+        await asyncio.sleep(latency)
+        n = int(client_id.split("-")[1])
+        return (
+            f"[Interface]\nPrivateKey = priv-{n}\nAddress = 10.8.{n // 250}.{n % 250 + 2}/32\n"
+            "[Peer]\nAllowedIPs = 0.0.0.0/0\n"
+        ).encode()
+
+    peers._create_wg_easy_client = fake_create
+    peers._get_wg_easy_client_config = fake_config
+
+
+async def prepare_users(client: httpx.AsyncClient, count: int) -> list[dict]:
+    tariff = await client.post("/tariffs/", json={"name": f"bench-{time.time()}", "price": 1})
+    tariff_id = tariff.json()["id"]
+    headers = []
+    for i in range(count):
+        email = f"bench{i}-{os.getpid()}@example.com"
+        await client.post("/auth/register", json={"email": email, "password": "benchpass"})
+        r = await client.post("/auth/login", json={"email": email, "password": "benchpass"})
+        h = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        await client.post("/auth/subscribe", json={"tariff_id": tariff_id}, headers=h)
+        headers.append(h)
+    return headers
+
+
+async def run(concurrency: int, total: int, latency: float) -> dict:
+    install_stub(latency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        users = await prepare_users(client, total)
+        sem = asyncio.Semaphore(concurrency)
+        statuses: dict[int, int] = {}
+
+        async def one(h):
+            async with sem:
+                r = await client.post("/vpn_peers/self", json={}, headers=h)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(h) for h in users))
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "stub_latency_ms": latency * 1000,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "statuses": statuses,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--latency-ms", type=float, default=100.0)
+    args = p.parse_args()
+    try:
+        result = asyncio.run(run(args.concurrency, args.requests, args.latency_ms / 1000))
+    finally:
+        if _db.exists():
+            _db.unlink()
+    for k, v in result.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Compare authenticated request latency with and without the principal cache.
+
+The cache lives in vpn_api/principals.py.
+
+Requests go through the full ASGI stack in process against a SQLite file
+database, so the difference is the users lookup that the cache removes
+from every authenticated request.
+
+Usage:
+  python scripts/bench_principal_cache.py --requests 2000 --path /auth/me
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+_db = Path(tempfile.gettempdir()) / f"vpn_api_bench_{os.getpid()}.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db.as_posix()}")
+os.environ.setdefault("DEV_INIT_DB", "1")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from vpn_api.cache import principal_cache  # noqa: E402
+from vpn_api.main import app  # noqa: E402
+
+
+def login(client: TestClient) -> dict:
+    email = f"bench-principal-{os.getpid()}@example.com"
+    client.post("/auth/register", json={"email": email, "password": "benchpass"})
+    r = client.post("/auth/login", json={"email": email, "password": "benchpass"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def measure(client: TestClient, headers: dict, path: str, total: int) -> dict:
+    for _ in range(min(50, total)):  # warm up
+        client.get(path, headers=headers)
+    samples = []
+    for _ in range(total):
+        started = time.perf_counter()
+        r = client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        assert r.status_code == 200, r.text
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95)] * 1000, 3),
+    }
+
+
+def run(total: int, path: str) -> dict:
+    maxsize = principal_cache.maxsize
+    with TestClient(app) as client:
+        headers = login(client)
+        principal_cache.maxsize = 0
+        principal_cache.clear()
+        uncached = measure(client, headers, path, total)
+        principal_cache.maxsize = maxsize or 10000
+        cached = measure(client, headers, path, total)
+    principal_cache.maxsize = maxsize
+    return {
+        "path": path,
+        "requests": total,
+        "without_cache": uncached,
+        "with_cache": cached,
+        "speedup_p50": round(uncached["p50_ms"] / cached["p50_ms"], 2),
+        "principal_cache": principal_cache.stats(),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--path", default="/auth/me")
+    args = p.parse_args()
+    try:
+        result = run(args.requests, args.path)
+    finally:
+        if _db.exists():
+            _db.unlink()
+    for k, v in result.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
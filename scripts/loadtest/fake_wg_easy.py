@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Local stand-in for the wg-easy HTTP API, for load tests.
+
+Implements the endpoints the API uses: POST /api/session, GET and POST
+/api/wireguard/client, DELETE /api/wireguard/client/{id} and
+GET /api/wireguard/client/{id}/configuration. Clients live in memory; keys
+are real X25519 pairs so generated configs parse like the real thing.
+
+Every request waits ``latency_ms`` (gaussian ``jitter_ms``) and fails with
+HTTP 500 with probability ``error_rate``. POST /api/session is exempt from
+error injection so one unlucky login does not fail the whole run.
+
+Usage:
+  python scripts/loadtest/fake_wg_easy.py --port 51821 --latency-ms 20 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from aiohttp import web  # noqa: E402
+
+from vpn_api.wg_keys import generate_keypair  # noqa: E402
+
+
+def make_app(
+    latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed=None
+) -> web.Application:
+    rng = random.Random(seed)
+    clients: dict[str, dict] = {}
+    ids = itertools.count(1)
+    stats = {"requests": 0, "injected_errors": 0}
+
+    @web.middleware
+    async def inject(request, handler):
+        stats["requests"] += 1
+        delay = max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000 if latency_ms else 0.0
+        if delay:
+            await asyncio.sleep(delay)
+        if request.path != "/api/session" and error_rate and rng.random() < error_rate:
+            stats["injected_errors"] += 1
+            return web.json_response({"error": "injected failure"}, status=500)
+        return await handler(request)
+
+    async def session(_request):
+        return web.json_response({"success": True})
+
+    async def list_clients(_request):
+        return web.json_response(
+            [{k: v for k, v in c.items() if not k.startswith("_")} for c in clients.values()]
+        )
+
+    async def create_client(request):
+        body = await request.json()
+        private, public = generate_keypair()
+        n = next(ids)
+        cid = f"fake-{n}"
+        clients[cid] = {
+            "id": cid,
+            "name": body.get("name", ""),
+            "publicKey": public,
+            "address": f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}",
+            "_private": private,
+        }
+        return web.json_response({"success": True, "clientId": cid})
+
+    async def delete_client(request):
+        clients.pop(request.match_info["cid"], None)
+        return web.json_response({"success": True})
+
+    async def configuration(request):
+        c = clients.get(request.match_info["cid"])
+        if c is None:
+            return web.json_response({"error": "client not found"}, status=404)
+        return web.Response(
+            text=(
+                f"[Interface]\nPrivateKey = {c['_private']}\nAddress = {c['address']}/32\n"
+                "DNS = 1.1.1.1\n\n[Peer]\nPublicKey = fake-server-key\n"
+                "AllowedIPs = 0.0.0.0/0\nEndpoint = 127.0.0.1:51820\n"
+            )
+        )
+
+    async def fake_stats(_request):
+        return web.json_response({**stats, "clients": len(clients)})
+
+    app = web.Application(middlewares=[inject])
+    app.router.add_post("/api/session", session)
+    app.router.add_get("/api/wireguard/client", list_clients)
+    app.router.add_post("/api/wireguard/client", create_client)
+    app.router.add_delete("/api/wireguard/client/{cid}", delete_client)
+    app.router.add_get("/api/wireguard/client/{cid}/configuration", configuration)
+    app.router.add_get("/_stats", fake_stats)
+    app["stats"] = stats
+    return app
+
+
+async def start(host: str = "127.0.0.1", port: int = 0, **kwargs) -> tuple[web.AppRunner, str]:
+    """Serve a fake wg-easy on the running loop; return the runner and its base URL."""
+    runner = web.AppRunner(make_app(**kwargs), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_host, bound_port = runner.addresses[0][:2]
+    return runner, f"http://{bound_host}:{bound_port}"
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=51821)
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=None)
+    args = p.parse_args()
+    app = make_app(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""End-to-end load test of the API against a local wg-easy stand-in.
+
+Starts the fake wg-easy (fake_wg_easy.py) in this process and the API under
+uvicorn in a child process, configured with WG_KEY_POLICY=wg-easy. Then
+``--users`` virtual users run the scenario concurrently:
+
+  register -> login -> subscribe -> create peer -> fetch config (x --config-fetches)
+
+Each request is timed per endpoint (method + route template). The report,
+written as JSON to ``--out``, holds count, error count, p50/p95/p99 latency
+and RPS per endpoint. With ``--baseline`` it is compared against an earlier
+report and the exit status is 1 if any endpoint's p95 regressed by more than
+``--max-regression``.
+
+SQLite (a temporary file) is used by default. For Postgres pass
+``--database-url``; the schema must already be migrated (alembic upgrade head).
+
+Usage:
+  python scripts/loadtest/run.py --users 50 --config-fetches 5 --out reports/loadtest.json
+  python scripts/loadtest/run.py --wg-latency-ms 30 --wg-error-rate 0.02 \\
+      --baseline reports/loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(HERE))
+
+import fake_wg_easy  # noqa: E402
+import httpx  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+
+
+class Recorder:
+    def __init__(self, max_retries: int = 3):
+        self.samples: dict[str, list[tuple[float, float, int]]] = {}
+        self.max_retries = max_retries
+        self.retries = 0
+
+    def add(self, endpoint: str, started: float, elapsed: float, status: int) -> None:
+        self.samples.setdefault(endpoint, []).append((started, elapsed, status))
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, path: str, **kw):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, path, **kw)
+                status = r.status_code
+            except httpx.HTTPError:
+                r, status = None, 0
+            self.add(endpoint, started, time.perf_counter() - started, status)
+            # 503 + Retry-After is the API's backpressure (e.g. password hashing
+            # queue full); a well-behaved client waits and tries again
+            retry_after = r.headers.get("retry-after") if r is not None else None
+            if status == 503 and retry_after and attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(float(retry_after))
+                continue
+            break
+        if r is None or r.status_code >= 400:
+            raise ScenarioFailed(endpoint, status)
+        return r
+
+    def report(self) -> dict:
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[1] for s in samples)
+            window = max(s[0] + s[1] for s in samples) - min(s[0] for s in samples)
+            endpoints[endpoint] = {
+                "count": len(samples),
+                "errors": sum(1 for s in samples if not 200 <= s[2] < 400),
+                "p50_ms": _ms(_percentile(latencies, 50)),
+                "p95_ms": _ms(_percentile(latencies, 95)),
+                "p99_ms": _ms(_percentile(latencies, 99)),
+                "max_ms": _ms(latencies[-1]),
+                "rps": round(len(samples) / window, 1) if window > 0 else None,
+            }
+        return endpoints
+
+
+class ScenarioFailed(Exception):
+    def __init__(self, endpoint: str, status: int):
+        super().__init__(f"{endpoint} -> {status}")
+        self.endpoint = endpoint
+        self.status = status
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    # nearest-rank percentile
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+async def user_scenario(
+    client: httpx.AsyncClient, rec: Recorder, n: int, tariff_id: int, config_fetches: int
+) -> None:
+    email = f"lt-{os.getpid()}-{n}@example.com"
+    password = "loadtest-pass"
+    await rec.call(
+        client,
+        "POST /auth/register",
+        "POST",
+        "/auth/register",
+        json={"email": email, "password": password},
+    )
+    r = await rec.call(
+        client,
+        "POST /auth/login",
+        "POST",
+        "/auth/login",
+        json={"email": email, "password": password},
+    )
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    await rec.call(
+        client,
+        "POST /auth/subscribe",
+        "POST",
+        "/auth/subscribe",
+        json={"tariff_id": tariff_id},
+        headers=headers,
+    )
+    await rec.call(
+        client,
+        "POST /vpn_peers/",
+        "POST",
+        "/vpn_peers/",
+        json={"device_name": f"lt-device-{n}"},
+        headers=headers,
+    )
+    for _ in range(config_fetches):
+        await rec.call(
+            client, "GET /vpn_peers/self/config", "GET", "/vpn_peers/self/config", headers=headers
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _app_env(args, wg_url: str, db_url: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=db_url,
+        SECRET_KEY=secrets.token_urlsafe(32),
+        CONFIG_ENCRYPTION_KEY=Fernet.generate_key().decode(),
+        WG_KEY_POLICY="wg-easy",
+        WG_EASY_URL=wg_url,
+        WG_EASY_PASSWORD="loadtest",
+        WG_APPLY_ENABLED="0",
+        PYTHONPATH=str(ROOT),
+    )
+    if db_url.startswith("sqlite"):
+        env["DEV_INIT_DB"] = "1"
+    return env
+
+
+async def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"API process exited with {proc.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("API did not become ready in time")
+
+
+async def run(args) -> dict:
+    runner, wg_url = await fake_wg_easy.start(
+        latency_ms=args.wg_latency_ms,
+        jitter_ms=args.wg_jitter_ms,
+        error_rate=args.wg_error_rate,
+        seed=args.seed,
+    )
+    db_file = None
+    db_url = args.database_url
+    if not db_url:
+        db_file = Path(tempfile.gettempdir()) / f"vpn_api_loadtest_{os.getpid()}.db"
+        db_url = f"sqlite:///{db_file.as_posix()}"
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "vpn_api.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=_app_env(args, wg_url, db_url),
+        # the API prints debug lines to stdout; keep stderr for tracebacks
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        await _wait_ready(base_url, proc)
+        rec = Recorder(args.max_retries)
+        limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            r = await client.post(
+                "/tariffs/",
+                json={"name": f"loadtest-{os.getpid()}", "duration_days": 30, "price": "1.00"},
+            )
+            r.raise_for_status()
+            tariff_id = r.json()["id"]
+
+            failures: dict[str, int] = {}
+
+            async def one(n: int):
+                try:
+                    await user_scenario(client, rec, n, tariff_id, args.config_fetches)
+                except ScenarioFailed as exc:
+                    key = f"{exc.endpoint} -> {exc.status}"
+                    failures[key] = failures.get(key, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(args.users)))
+            elapsed = time.perf_counter() - started
+            fake = (await client.get(f"{wg_url}/_stats")).json()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        await runner.cleanup()
+        if db_file is not None and db_file.exists():
+            db_file.unlink()
+
+    total = sum(len(s) for s in rec.samples.values())
+    return {
+        "meta": {
+            "created_at": datetime.now(UTC).isoformat(timespec="seconds"),
+            "database": db_url.split(":", 1)[0],
+            "users": args.users,
+            "config_fetches": args.config_fetches,
+            "workers": args.workers,
+            "wg_latency_ms": args.wg_latency_ms,
+            "wg_jitter_ms": args.wg_jitter_ms,
+            "wg_error_rate": args.wg_error_rate,
+            "python": platform.python_version(),
+            "host": platform.node(),
+        },
+        "summary": {
+            "requests": total,
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(total / elapsed, 1) if elapsed else None,
+            "retries_after_503": rec.retries,
+            "failed_scenarios": failures,
+            "wg_easy": fake,
+        },
+        "endpoints": rec.report(),
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """List endpoints whose p95 grew by more than ``max_regression`` (a fraction)."""
+    regressions = []
+    for endpoint, current in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before or not before.get("p95_ms"):
+            continue
+        change = current["p95_ms"] / before["p95_ms"] - 1
+        if change > max_regression:
+            regressions.append(
+                f"{endpoint}: p95 {before['p95_ms']} -> {current['p95_ms']} ms (+{change:.0%})"
+            )
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--config-fetches", type=int, default=5)
+    p.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    p.add_argument("--database-url", default=None, help="default: temporary SQLite file")
+    p.add_argument("--wg-latency-ms", type=float, default=20.0)
+    p.add_argument("--wg-jitter-ms", type=float, default=5.0)
+    p.add_argument("--wg-error-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--max-retries", type=int, default=3, help="retries of 503 + Retry-After")
+    p.add_argument("--out", default="reports/loadtest.json")
+    p.add_argument("--baseline", default=None, help="earlier report to compare p95 against")
+    p.add_argument("--max-regression", type=float, default=0.2)
+    args = p.parse_args()
+    # read first: --baseline may name the same file as --out
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    report = asyncio.run(run(args))
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2) + "\n")
+
+    for k, v in report["summary"].items():
+        print(f"{k}: {v}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint}: {stats}")
+    print(f"report: {out}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
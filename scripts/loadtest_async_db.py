@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Show request concurrency of the async DB path beyond the threadpool limit.
+
+Fires ``--concurrency`` simultaneous requests at a sync route (GET /tariffs/,
+sync Session in the threadpool) and at an async route (GET /payments/,
+AsyncSession on the event loop). A per-statement latency is injected into
+SQLite through a trace callback that runs on the thread executing the
+statement, standing in for a network round trip to Postgres without
+blocking the event loop.
+
+The sync route cannot have more statements in flight than the threadpool
+(40 threads) or the sync engine's connection pool (5 + 10 overflow by
+default) allow; the async route is bounded only by --concurrency.
+
+Usage:
+  python scripts/loadtest_async_db.py --concurrency 200 --latency-ms 100
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+_db = Path(tempfile.gettempdir()) / f"vpn_api_loadtest_{os.getpid()}.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db.as_posix()}")
+os.environ.setdefault("DEV_INIT_DB", "1")
+os.environ.setdefault("SECRET_KEY", "loadtest-secret")
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from vpn_api.database import async_engine, engine  # noqa: E402
+from vpn_api.main import app  # noqa: E402
+
+
+class InFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.now = 0
+        self.peak = 0
+        self.latency = 0.0
+
+    def trace(self, _statement):
+        with self._lock:
+            self.now += 1
+            self.peak = max(self.peak, self.now)
+        time.sleep(self.latency)
+        with self._lock:
+            self.now -= 1
+
+
+def install_latency(counter: InFlight) -> None:
+    @event.listens_for(engine, "connect")
+    def _sync_connect(dbapi_conn, _record):
+        dbapi_conn.set_trace_callback(counter.trace)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _async_connect(dbapi_conn, _record):
+        dbapi_conn.await_(dbapi_conn.driver_connection.set_trace_callback(counter.trace))
+
+    # drop connections opened before the hook (schema creation at import)
+    engine.dispose()
+
+
+async def blast(client: httpx.AsyncClient, path: str, headers: dict, total: int) -> dict:
+    statuses: dict[int, int] = {}
+
+    async def one():
+        r = await client.get(path, headers=headers)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed_s": round(elapsed, 3), "rps": round(total / elapsed, 1), "statuses": statuses}
+
+
+async def run(concurrency: int, latency: float) -> dict:
+    counter = InFlight()
+    install_latency(counter)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        email = f"loadtest-{os.getpid()}@example.com"
+        await client.post("/auth/register", json={"email": email, "password": "loadtestpass"})
+        r = await client.post("/auth/login", json={"email": email, "password": "loadtestpass"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        # warm the principal cache so each request issues one statement
+        await client.get("/payments/", headers=headers)
+
+        results = {}
+        for label, path in (("sync /tariffs/", "/tariffs/"), ("async /payments/", "/payments/")):
+            counter.latency, counter.peak = latency, 0
+            results[label] = await blast(client, path, headers, concurrency)
+            results[label]["peak_statements_in_flight"] = counter.peak
+            counter.latency = 0.0
+    await async_engine.dispose()
+    return results
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--concurrency", type=int, default=200)
+    p.add_argument("--latency-ms", type=float, default=100.0)
+    args = p.parse_args()
+    try:
+        result = asyncio.run(run(args.concurrency, args.latency_ms / 1000))
+    finally:
+        if _db.exists():
+            _db.unlink()
+    for k, v in result.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env bash
+# Apply a batch of peer adds/removes to the local WireGuard interface with a
+# single `wg set` call. Operations are read from stdin, one per line:
+#   add <peer_public_key> <allowed_ips>
+#   remove <peer_public_key>
+# Prints "ok <op> <peer_public_key>" for every applied operation.
+# Usage: wg_batch.sh <iface> < ops.txt
+set -euo pipefail
+iface="$1"
+
+if ! ip link show "$iface" >/dev/null 2>&1; then
+  echo "wireguard interface $iface not found" >&2
+  exit 3
+fi
+
+args=()
+applied=()
+while read -r op peer_pub allowed_ips; do
+  [ -z "${op:-}" ] && continue
+  if [ -z "${peer_pub:-}" ]; then
+    echo "missing public key for $op" >&2
+    exit 2
+  fi
+  case "$op" in
+    add)
+      # `wg set ... allowed-ips` on an existing peer just updates it, so no
+      # `wg show | grep` existence check is needed
+      args+=(peer "$peer_pub" allowed-ips "${allowed_ips:-0.0.0.0/0}")
+      ;;
+    remove)
+      # removing an absent peer is a no-op for wg
+      args+=(peer "$peer_pub" remove)
+      ;;
+    *)
+      echo "unknown op: $op" >&2
+      exit 2
+      ;;
+  esac
+  applied+=("ok $op $peer_pub")
+done
+
+if [ "${#args[@]}" -gt 0 ]; then
+  wg set "$iface" "${args[@]}"
+  printf '%s\n' "${applied[@]}"
+fi
@@ -0,0 +1,28 @@
+"""Admin-only operational endpoints."""
+
+from fastapi import APIRouter, Depends
+
+from vpn_api import cache, models, passwords
+from vpn_api.auth import require_admin
+from vpn_api.database import async_engine, engine
+from vpn_api.db_pool import pool_stats
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/cache")
+def cache_stats(_admin: models.User = Depends(require_admin)):
+    """Size and hit/miss counters of the in-process caches of this worker."""
+    return cache.all_stats()
+
+
+@router.get("/password-hashing")
+def password_hashing_stats(_admin: models.User = Depends(require_admin)):
+    """Queue depth and counters of the password hashing process pool."""
+    return passwords.hasher.stats()
+
+
+@router.get("/db-pool")
+def db_pool_stats(_admin: models.User = Depends(require_admin)):
+    """Occupancy and checkout wait counters of this worker's connection pools."""
+    return {"sync": pool_stats(engine), "async": pool_stats(async_engine.sync_engine)}
@@ -4,6 +4,7 @@ Contains registration, login, user lookup and admin utilities. This module
 is exercised by unit and integration tests.
 """
 
+import logging
 import os
 from datetime import UTC, datetime, timedelta
 from typing import Optional
@@ -11,20 +12,23 @@ from typing import Optional
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from vpn_api import models, schemas
-from vpn_api.database import get_db
+from vpn_api.cache import invalidate_principal
+from vpn_api.database import AsyncSessionLocal, get_async_db, get_db
+from vpn_api.entitlements import get_entitlement
+from vpn_api.passwords import HashingSaturated, hasher, needs_rehash
+from vpn_api.principals import load_principal
 
 # email verification flow removed: no external email sending
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
-# Prefer pbkdf2_sha256 to avoid bcrypt's 72-byte input limit and any CI
-# platform-dependent bcrypt backend issues. Keep bcrypt_sha256 and bcrypt
-# as fallbacks so existing hashes remain verifiable.
-pwd_context = CryptContext(schemes=["pbkdf2_sha256", "bcrypt_sha256", "bcrypt"], deprecated="auto")
 
 
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -44,13 +48,46 @@ def validate_password(password: str):
     return True
 
 
-def get_password_hash(password: str):
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503, detail="Server busy, retry later", headers={"Retry-After": "1"}
+    )
+
+
+async def get_password_hash(password: str):
     validate_password(password)
-    return pwd_context.hash(password)
+    try:
+        return await hasher.ahash(password)
+    except HashingSaturated as err:
+        raise _hashing_busy() from err
 
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain[:72], hashed)
+async def verify_password(plain, hashed):
+    try:
+        return await hasher.averify(plain[:72], hashed)
+    except HashingSaturated as err:
+        raise _hashing_busy() from err
+
+
+async def _rehash_password(user_id: int, email: str, plain: str, old_hash: str) -> None:
+    """Upgrade a hash made with outdated parameters; runs after the login response."""
+    try:
+        new_hash = await hasher.ahash(plain)
+    except HashingSaturated:
+        return  # try again on a later login
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(
+                update(models.User)
+                .where(models.User.id == user_id, models.User.hashed_password == old_hash)
+                .values(hashed_password=new_hash)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception("[AUTH] rehash failed for user_id=%s", user_id)
+            return
+    invalidate_principal(email)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -87,7 +124,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         400: {"description": "Validation error or already exists"},
     },
 )
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a user.
 
     Provide `email` and `password` (password is required). Newly created users
@@ -96,14 +133,14 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     separate endpoint.
     """
     # legacy registration (username+password) remains supported via existing route
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await _user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     # Require password on this route; email-only flow should use
     # /auth/register/email.
     if not user.password:
         raise HTTPException(status_code=400, detail="Password is required for registration")
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await get_password_hash(user.password)
     new_user = models.User(email=user.email, hashed_password=hashed_pw)
     # Make newly registered users active by default so POST /auth/register
     # immediately yields an account capable of authenticating and using
@@ -111,11 +148,11 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     new_user.status = "active"
     db.add(new_user)
     try:
-        db.commit()
+        await db.commit()
     except IntegrityError as err:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="User already exists or DB error") from err
-    db.refresh(new_user)
+    await db.refresh(new_user)
     return new_user
 
 
@@ -124,22 +161,23 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     summary="Start email registration (creates verified active user)",
     responses={200: {"description": "Returns access token for convenience"}},
 )
-def email_register(
-    payload: schemas.RegisterIn, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+async def email_register(
+    payload: schemas.RegisterIn,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Start email verification flow: create user record (if missing), generate code and email it.
 
     Returns a generic success message to avoid leaking account existence.
     """
     # Simplified flow: create user if missing and mark as verified immediately
-    db_user = db.query(models.User).filter(models.User.email == payload.email).first()
+    db_user = await _user_by_email(db, payload.email)
     if not db_user:
         db_user = models.User(email=payload.email)
         db.add(db_user)
     db_user.is_verified = True
     db_user.status = "active"
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     # return access token for convenience
     token = create_access_token({"sub": db_user.email})
     return {"access_token": token, "token_type": "bearer"}
@@ -157,8 +195,12 @@ def email_register(
         }
     },
 )
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def login(
+    user: schemas.UserLogin,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
+    db_user = await _user_by_email(db, user.email)
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
@@ -168,8 +210,16 @@ def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
         if user.password not in (None, ""):
             raise HTTPException(status_code=401, detail="Invalid credentials")
     else:
-        if not verify_password(user.password, db_user.hashed_password):
+        if not await verify_password(user.password, db_user.hashed_password):
             raise HTTPException(status_code=401, detail="Invalid credentials")
+        if needs_rehash(db_user.hashed_password):
+            background_tasks.add_task(
+                _rehash_password,
+                db_user.id,
+                db_user.email,
+                user.password[:72],
+                db_user.hashed_password,
+            )
     token = create_access_token({"sub": db_user.email})
     return {"access_token": token, "token_type": "bearer"}
 
@@ -181,7 +231,14 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def _user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+):
     if not SECRET_KEY:
         raise RuntimeError("SECRET_KEY must be set in environment variables to validate tokens")
     credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
@@ -192,7 +249,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError as err:
         raise credentials_exception from err
-    user = get_user_by_email(db, email)
+    user = await db.run_sync(load_principal, email)
     if user is None:
         raise credentials_exception
     # models.User.status is an Enum; compare to its value
@@ -205,8 +262,15 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     return user
 
 
-def get_current_user_optional(
-    token: str | None = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)
+def require_admin(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """Dependency for admin-only routes."""
+    if not getattr(current_user, "is_admin", False):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return current_user
+
+
+async def get_current_user_optional(
+    token: str | None = Depends(oauth2_scheme_optional), db: AsyncSession = Depends(get_async_db)
 ):
     """Return user if token provided and valid, otherwise return None."""
     if not token:
@@ -218,19 +282,18 @@ def get_current_user_optional(
             return None
     except Exception:
         return None
-    user = get_user_by_email(db, email)
-    return user
+    return await db.run_sync(load_principal, email)
 
 
 @router.get("/me", response_model=schemas.UserOut)
-def me(current_user: models.User = Depends(get_current_user)):
+async def me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 
 @router.get("/me/subscription")
-def get_user_subscription(
+async def get_user_subscription(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get current active subscription for the authenticated user.
 
@@ -239,45 +302,33 @@ def get_user_subscription(
     - null if no active subscription
 
     """
-    # Query for active UserTariff
     now = datetime.now(UTC)
-    active_subscription = (
-        db.query(models.UserTariff, models.Tariff)
-        .join(models.Tariff)
-        .filter(
-            models.UserTariff.user_id == current_user.id,
-            models.UserTariff.status == "active",
-        )
-        .first()
-    )
-
-    if not active_subscription:
+    entitlement = await db.run_sync(get_entitlement, current_user.id, now)
+    if entitlement is None:
         return None
 
-    user_tariff, tariff = active_subscription
-
     # Calculate days remaining
     days_remaining = None
-    if user_tariff.ended_at:
-        delta = (user_tariff.ended_at - now).days
+    if entitlement.ended_at:
+        delta = (entitlement.ended_at - now).days
         days_remaining = max(0, delta)
     else:
         # Lifetime subscription
         days_remaining = 36500
 
     return {
-        "id": user_tariff.id,
+        "id": entitlement.user_tariff_id,
         "user_id": current_user.id,
-        "tariff_id": tariff.id,
-        "tariff_name": tariff.name,
-        "status": user_tariff.status,
-        "durationDays": tariff.duration_days,
-        "duration_days": tariff.duration_days,
-        "price": str(tariff.price),
-        "started_at": user_tariff.started_at,
-        "ended_at": user_tariff.ended_at,
+        "tariff_id": entitlement.tariff_id,
+        "tariff_name": entitlement.tariff_name,
+        "status": entitlement.status,
+        "durationDays": entitlement.duration_days,
+        "duration_days": entitlement.duration_days,
+        "price": str(entitlement.price),
+        "started_at": entitlement.started_at,
+        "ended_at": entitlement.ended_at,
         "days_remaining": days_remaining,
-        "is_lifetime": user_tariff.ended_at is None,
+        "is_lifetime": entitlement.ended_at is None,
     }
 
 
@@ -313,9 +364,9 @@ def assign_tariff(
 
 
 @router.post("/subscribe")
-def user_subscribe(
+async def user_subscribe(
     assign: schemas.AssignTariff,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """Activate tariff for the authenticated user (for testing/demo purposes).
@@ -323,22 +374,13 @@ def user_subscribe(
     In production, this would be called after successful payment verification.
     """
     # Check tariff exists
-    db_tariff = db.query(models.Tariff).filter(models.Tariff.id == assign.tariff_id).first()
+    db_tariff = await db.get(models.Tariff, assign.tariff_id)
     if not db_tariff:
         raise HTTPException(status_code=404, detail="Tariff not found")
 
     # Check if user already has an active subscription
     now = datetime.now(UTC)
-    existing_active = (
-        db.query(models.UserTariff)
-        .filter(
-            models.UserTariff.user_id == current_user.id,
-            models.UserTariff.status == "active",
-            (models.UserTariff.ended_at.is_(None)) | (models.UserTariff.ended_at > now),
-        )
-        .first()
-    )
-    if existing_active:
+    if await db.run_sync(get_entitlement, current_user.id, now) is not None:
         raise HTTPException(status_code=400, detail="already_has_active_subscription")
 
     # Create new UserTariff record
@@ -355,8 +397,8 @@ def user_subscribe(
     if current_user.status != "active":
         current_user.status = "active"
 
-    db.commit()
-    db.refresh(user_tariff)
+    await db.commit()
+    await db.refresh(user_tariff)
 
     return {
         "msg": "subscription activated",
@@ -368,10 +410,10 @@ def user_subscribe(
 
 
 @router.post("/admin/promote")
-def promote_user(
+async def promote_user(
     user_id: int,
     secret: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User | None = Depends(get_current_user_optional),
 ):
     """Promote a user to admin.
@@ -388,11 +430,11 @@ def promote_user(
         if not getattr(current_user, "is_admin", False):
             raise HTTPException(status_code=403, detail="Admin privileges required to promote")
 
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     db_user.is_admin = True
     # make admin active so they can use protected admin endpoints immediately
     db_user.status = "active"
-    db.commit()
+    await db.commit()
     return {"msg": "user promoted", "user_id": user_id}
@@ -0,0 +1,45 @@
+"""Settings for the microbenchmarks in this directory (pytest-benchmark).
+
+The benchmarks are skipped in ordinary test runs; run them explicitly:
+
+  pytest vpn_api/benchmarks --benchmark-only --benchmark-save=baseline
+  pytest vpn_api/benchmarks --benchmark-only --benchmark-compare
+
+Runs are stored in ``vpn_api/benchmarks/.baselines`` unless
+``--benchmark-storage`` is given. ``--benchmark-compare`` without an explicit
+``--benchmark-compare-fail`` fails any benchmark whose median is more than
+``BENCH_MAX_REGRESSION`` percent (default 25) slower than the saved run.
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+BENCH_DIR = Path(__file__).resolve().parent
+BENCH_STORAGE = BENCH_DIR / ".baselines"
+BENCH_MAX_REGRESSION = int(os.getenv("BENCH_MAX_REGRESSION", "25"))
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # runs before pytest-benchmark reads its options (its hook is trylast);
+    # only applies when this directory is passed on the command line
+    opt = config.option
+    if not hasattr(opt, "benchmark_storage"):
+        return
+    if opt.benchmark_storage == "file://./.benchmarks":
+        opt.benchmark_storage = BENCH_STORAGE.as_uri()
+    if opt.benchmark_compare and not opt.benchmark_compare_fail:
+        from pytest_benchmark.utils import parse_compare_fail
+
+        opt.benchmark_compare_fail = [parse_compare_fail(f"median:{BENCH_MAX_REGRESSION}%")]
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("benchmark_only", False) or config.getoption("benchmark_enable", False):
+        return
+    skip = pytest.mark.skip(reason="microbenchmark; run with --benchmark-only")
+    for item in items:
+        if BENCH_DIR in Path(item.path).parents:
+            item.add_marker(skip)
@@ -0,0 +1,80 @@
+"""Microbenchmarks of helpers that run on every request or every provisioning."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from cryptography.fernet import Fernet
+from jose import jwt
+
+from vpn_api import auth, crypto, passwords, peers, wg_keys
+
+PRIVATE_KEY = "oK56DE9Ue9zK76rAc8pBl6opph+1v36lm7cXXsQKrQM="
+
+
+@pytest.fixture
+def encryption_key(monkeypatch):
+    monkeypatch.setenv("CONFIG_ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+
+@pytest.fixture
+def wg_quick_config():
+    return peers._build_wg_quick_config(PRIVATE_KEY, "10.8.0.17/32", "0.0.0.0/0")
+
+
+def test_build_wg_quick_config(benchmark):
+    cfg = benchmark(peers._build_wg_quick_config, PRIVATE_KEY, "10.8.0.17/32", "0.0.0.0/0")
+    assert "Address = 10.8.0.17/24" in cfg
+
+
+def test_parse_wg_quick_config(benchmark, wg_quick_config):
+    meta = benchmark(peers._parse_wg_quick_config, wg_quick_config)
+    assert meta["private_key"] == PRIVATE_KEY
+
+
+def test_encrypt_text(benchmark, encryption_key, wg_quick_config):
+    token = benchmark(crypto.encrypt_text, wg_quick_config)
+    assert crypto.decrypt_text(token) == wg_quick_config
+
+
+def test_decrypt_text(benchmark, encryption_key, wg_quick_config):
+    token = crypto.encrypt_text(wg_quick_config)
+    assert benchmark(crypto.decrypt_text, token) == wg_quick_config
+
+
+def test_create_access_token(benchmark):
+    token = benchmark(auth.create_access_token, {"sub": "bench@example.com"})
+    assert token.count(".") == 2
+
+
+def test_decode_access_token(benchmark):
+    # the decode done by get_current_user on every authenticated request
+    token = auth.create_access_token({"sub": "bench@example.com"})
+    payload = benchmark(jwt.decode, token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    assert payload["sub"] == "bench@example.com"
+
+
+def test_verify_password(benchmark):
+    # what login awaits: pbkdf2 at configured rounds, run through the hashing pool
+    hashed = passwords.pwd_context.hash("bench-password")
+    with asyncio.Runner() as runner:
+        ok = benchmark(lambda: runner.run(auth.verify_password("bench-password", hashed)))
+    assert ok
+
+
+def test_generate_wg_keypair(benchmark):
+    private, public = benchmark(wg_keys.generate_keypair)
+    assert wg_keys.derive_public_key(private) == public
+
+
+def test_peer_generate_wg_keypair(benchmark, monkeypatch):
+    # create_peer's entry point with a warm pre-generated pool; a fixed stock
+    # and no background refill keep every round on the same code path
+    rounds = 2000
+    pool = wg_keys.KeyPool(size=0, low_water=0)
+    pool._keys.extend(wg_keys.generate_keypairs(rounds + 1))
+    monkeypatch.setattr(peers, "key_pool", pool)
+    private, public = benchmark.pedantic(peers._generate_wg_keypair, rounds=rounds)
+    assert wg_keys.derive_public_key(private) == public
@@ -0,0 +1,126 @@
+"""Small in-process caches with TTL, LRU bounds and hit/miss counters.
+
+Each API worker keeps its own copy; invalidation hooks are called from the
+routes that change the underlying rows, and the TTL bounds staleness for
+changes made by other workers or out of band.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+CONFIG_CACHE_SIZE = int(os.getenv("CONFIG_CACHE_SIZE", "10000"))
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", "300"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+IAP_RECEIPT_CACHE_SIZE = int(os.getenv("IAP_RECEIPT_CACHE_SIZE", "10000"))
+IAP_RECEIPT_CACHE_TTL = float(os.getenv("IAP_RECEIPT_CACHE_TTL", "3600"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float, name: str = ""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches ``predicate``; returns how many."""
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+# Decrypted wg-quick configs keyed by (peer_id, sha256(ciphertext)): a changed
+# ciphertext can never be served from a stale entry.
+config_cache = TTLCache(CONFIG_CACHE_SIZE, CONFIG_CACHE_TTL, name="peer_config")
+# Authenticated users keyed by JWT subject (email).
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, name="principal")
+# IAP receipt validation results keyed by (bundle id, sha256(receipt)); entries
+# never outlive the purchase's expires_date (vpn_api.iap_validator).
+receipt_cache = TTLCache(IAP_RECEIPT_CACHE_SIZE, IAP_RECEIPT_CACHE_TTL, name="iap_receipt")
+# Caches owned by other modules, listed in `all_stats` too.
+_registered: list[TTLCache] = []
+
+
+def config_cache_key(peer_id: int, ciphertext: str) -> tuple[int, str]:
+    return peer_id, hashlib.sha256(ciphertext.encode("utf-8")).hexdigest()
+
+
+def invalidate_peer_config(peer_id: int) -> None:
+    config_cache.pop_where(lambda key: key[0] == peer_id)
+
+
+def invalidate_principal(subject: str) -> None:
+    principal_cache.pop(subject)
+
+
+def register(cache: TTLCache) -> TTLCache:
+    """Report ``cache`` in `all_stats` (``GET /admin/cache`` and metrics)."""
+    _registered.append(cache)
+    return cache
+
+
+def all_stats() -> dict:
+    caches = (config_cache, principal_cache, receipt_cache, *_registered)
+    return {c.name: c.stats() for c in caches}
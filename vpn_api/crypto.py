@@ -1,28 +1,52 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 from typing import Optional
 
 from cryptography.fernet import Fernet, InvalidToken
 
+from vpn_api.metrics import CRYPTO_LATENCY, track
+
+
+@lru_cache(maxsize=4)
+def _fernet_for(key: str) -> Fernet:
+    return Fernet(key.encode())
+
 
 def _get_fernet() -> Fernet:
+    # The env lookup stays per call so a rotated key takes effect; parsing the
+    # key and building the Fernet instance happens once per distinct key.
     key = os.getenv("CONFIG_ENCRYPTION_KEY")
     if not key:
         raise RuntimeError("CONFIG_ENCRYPTION_KEY is not set")
-    return Fernet(key.encode() if isinstance(key, str) else key)
+    return _fernet_for(key)
+
+
+def encryption_configured() -> bool:
+    """Whether ``CONFIG_ENCRYPTION_KEY`` is set, so configs can be stored."""
+    return bool(os.getenv("CONFIG_ENCRYPTION_KEY"))
 
 
 def encrypt_text(plaintext: str) -> str:
     f = _get_fernet()
-    token = f.encrypt(plaintext.encode("utf-8"))
+    with track(CRYPTO_LATENCY, operation="encrypt"):
+        token = f.encrypt(plaintext.encode("utf-8"))
     return token.decode("utf-8")
 
 
+def encrypt_texts(plaintexts: list[str]) -> list[str]:
+    """Encrypt many values with a single Fernet instance."""
+    f = _get_fernet()
+    with track(CRYPTO_LATENCY, operation="encrypt"):
+        return [f.encrypt(p.encode("utf-8")).decode("utf-8") for p in plaintexts]
+
+
 def decrypt_text(token: str) -> Optional[str]:
     try:
         f = _get_fernet()
-        data = f.decrypt(token.encode("utf-8"))
+        with track(CRYPTO_LATENCY, operation="decrypt"):
+            data = f.decrypt(token.encode("utf-8"))
         return data.decode("utf-8")
     except (InvalidToken, Exception):
         return None
@@ -2,7 +2,12 @@ import os
 from pathlib import Path
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from vpn_api.db_pool import instrumented
 
 # Единый путь к тестовой локальной БД внутри пакета
 default_db_path = Path(__file__).resolve().parent / "test.db"
@@ -10,14 +15,67 @@ default_db_path = Path(__file__).resolve().parent / "test.db"
 default_db_url = f"sqlite:///{default_db_path.as_posix()}"
 DB_URL = os.getenv("DATABASE_URL", default_db_url)
 
+# Параметры пула соединений (на каждый engine: синхронный и асинхронный)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# сколько секунд ждать свободное соединение до ошибки
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# пересоздавать соединения старше N секунд (-1 — никогда)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# проверять соединение перед выдачей: после рестарта Postgres вместо 500 — переподключение
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+
+
+def _pool_kwargs(pool_cls, name: str) -> dict:
+    return {
+        "poolclass": instrumented(pool_cls, name),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
 if DB_URL.startswith("sqlite"):
-    engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+    engine = create_engine(
+        DB_URL, connect_args={"check_same_thread": False}, **_pool_kwargs(QueuePool, "sync")
+    )
 else:
-    engine = create_engine(DB_URL)
+    engine = create_engine(DB_URL, **_pool_kwargs(QueuePool, "sync"))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Асинхронные драйверы для того же DATABASE_URL: asyncpg для Postgres, aiosqlite локально.
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"no async driver configured for {backend!r}; set ASYNC_DATABASE_URL")
+    parsed = parsed.set(drivername=_ASYNC_DRIVERS[backend])
+    if backend == "postgresql" and "sslmode" in parsed.query:
+        # asyncpg понимает ssl=<mode> вместо libpq-параметра sslmode
+        query = dict(parsed.query)
+        query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(query=query)
+    return parsed.render_as_string(hide_password=False)
+
+
+ASYNC_DB_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DB_URL)
+if ASYNC_DB_URL.startswith("sqlite"):
+    # Соединения aiosqlite живут в отдельных (не daemon) потоках и привязаны к
+    # циклу событий; для файла SQLite открыть соединение дёшево, поэтому без пула.
+    async_engine = create_async_engine(ASYNC_DB_URL, poolclass=NullPool)
+else:
+    async_engine = create_async_engine(ASYNC_DB_URL, **_pool_kwargs(AsyncAdaptedQueuePool, "async"))
+# expire_on_commit=False: после commit атрибуты не перечитываются неявно
+# (ленивая загрузка в async-сессии невозможна), при необходимости — refresh().
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 # Dependency для FastAPI
 def get_db():
@@ -26,3 +84,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,105 @@
+"""Connection pools that report checkout wait time.
+
+`instrumented` derives a pool class that times every checkout (the wait for a
+free connection, plus connect time when the pool opens a new one) and logs a
+warning when a checkout takes longer than ``DB_POOL_SLOW_CHECKOUT_MS``. The
+counters live on the derived class, so they survive ``engine.dispose()``,
+which replaces the pool with a fresh instance of the same class.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Checkouts slower than this are logged as warnings, milliseconds.
+DB_POOL_SLOW_CHECKOUT_MS = float(os.getenv("DB_POOL_SLOW_CHECKOUT_MS", "100"))
+
+
+class PoolMetrics:
+    def __init__(self, name: str, slow_checkout_ms: float = DB_POOL_SLOW_CHECKOUT_MS):
+        self.name = name
+        self.slow_checkout_ms = slow_checkout_ms
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow = 0
+        self.timeouts = 0
+
+    def record(self, waited: float, pool: QueuePool, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if timed_out:
+                self.timeouts += 1
+            slow = waited * 1000 >= self.slow_checkout_ms
+            if slow:
+                self.slow += 1
+        if slow:
+            logger.warning(
+                "slow db pool checkout: %.1f ms (pool=%s in_use=%d overflow=%d timed_out=%s)",
+                waited * 1000,
+                self.name,
+                pool.checkedout(),
+                max(pool.overflow(), 0),
+                timed_out,
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_wait_seconds_total": round(self.wait_total, 6),
+                "checkout_wait_seconds_max": round(self.wait_max, 6),
+                "slow_checkouts": self.slow,
+                "checkout_timeouts": self.timeouts,
+            }
+
+
+def instrumented(pool_cls: type[QueuePool], name: str, **metrics_kwargs) -> type[QueuePool]:
+    """Return a subclass of ``pool_cls`` that records checkout wait time."""
+
+    class InstrumentedPool(pool_cls):
+        metrics = PoolMetrics(name, **metrics_kwargs)
+
+        def _do_get(self):
+            started = time.perf_counter()
+            timed_out = False
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                timed_out = True
+                raise
+            finally:
+                self.metrics.record(time.perf_counter() - started, self, timed_out)
+
+    InstrumentedPool.__name__ = InstrumentedPool.__qualname__ = f"Instrumented{pool_cls.__name__}"
+    return InstrumentedPool
+
+
+def pool_stats(engine: Engine) -> dict:
+    """Report the occupancy of ``engine``'s pool and its checkout counters."""
+    pool: Pool = engine.pool
+    stats: dict = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            in_use=pool.checkedout(),
+            idle=pool.checkedin(),
+            # overflow() starts at -size; only connections beyond size count
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.stats())
+    return stats
@@ -0,0 +1,295 @@
+"""Durable outbound email queue, drained over one long-lived SMTP session.
+
+Mail used to go out from ``BackgroundTasks`` inside the web worker, over a
+new connection (EHLO, STARTTLS, login) per message, and was lost whenever
+the process restarted. Now:
+
+* `enqueue` adds an ``email_outbox`` row to the caller's session, so a
+  message is committed together with the change that caused it;
+* `OutboxWorker` claims due rows in batches of ``EMAIL_OUTBOX_BATCH``
+  (``FOR UPDATE SKIP LOCKED`` on Postgres, so API workers never claim the
+  same row) by pushing their ``next_attempt_at`` forward by a lease, then
+  sends them through a `SmtpSession`;
+* `SmtpSession` keeps one authenticated connection for many messages: it is
+  probed with NOOP after ``SMTP_NOOP_AFTER`` idle seconds, reopened when the
+  server dropped it and recycled after ``SMTP_MAX_MESSAGES_PER_CONNECTION``
+  messages;
+* a failed message is retried with exponential backoff, at most
+  ``EMAIL_MAX_ATTEMPTS`` times; a 5xx answer fails it at once. When the SMTP
+  server cannot be reached, the pass stops without using up attempts.
+
+A worker that dies mid-batch leaves its rows to be claimed again once the
+lease runs out, so delivery is at least once.
+"""
+
+import asyncio
+import logging
+import os
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from vpn_api import mail_service, models
+from vpn_api.auth import require_admin
+from vpn_api.database import SessionLocal, get_db
+from vpn_api.metrics import EMAILS, SMTP_COMMAND, SMTP_FAILURES, track
+
+logger = logging.getLogger(__name__)
+
+# Seconds between drain passes; 0 disables the background worker.
+EMAIL_OUTBOX_INTERVAL = float(os.getenv("EMAIL_OUTBOX_INTERVAL", "5"))
+EMAIL_OUTBOX_BATCH = int(os.getenv("EMAIL_OUTBOX_BATCH", "100"))
+# How long claimed messages stay invisible to other workers.
+EMAIL_OUTBOX_LEASE = float(os.getenv("EMAIL_OUTBOX_LEASE", "300"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE = float(os.getenv("EMAIL_RETRY_BASE", "30"))
+EMAIL_RETRY_MAX = float(os.getenv("EMAIL_RETRY_MAX", "3600"))
+SMTP_NOOP_AFTER = float(os.getenv("SMTP_NOOP_AFTER", "30"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+
+router = APIRouter(prefix="/admin/email-outbox", tags=["admin"])
+
+_outbox = models.EmailOutbox.__table__
+
+
+class SmtpUnavailable(Exception):
+    """The SMTP server could not be reached or refused the session."""
+
+
+def enqueue(db: Session, to_email: str, subject: str, body: str) -> models.EmailOutbox:
+    """Queue a message in ``db``'s transaction; it is sent after the caller commits."""
+    message = models.EmailOutbox(
+        to_email=to_email, subject=subject, body=body, next_attempt_at=datetime.now(UTC)
+    )
+    db.add(message)
+    return message
+
+
+def enqueue_verification_email(db: Session, to_email: str, code: str) -> models.EmailOutbox:
+    return enqueue(db, to_email, *mail_service.verification_email(code))
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before the next try of a message that failed ``attempts`` times."""
+    return min(EMAIL_RETRY_BASE * 2 ** (attempts - 1), EMAIL_RETRY_MAX)
+
+
+def is_permanent(exc: Exception) -> bool:
+    """Whether the server rejected the message itself (5xx), so retrying is pointless."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _msg in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPResponseException) and 500 <= exc.smtp_code < 600
+
+
+class SmtpSession:
+    """One authenticated SMTP connection reused across messages (not thread safe)."""
+
+    def __init__(
+        self,
+        noop_after: float = SMTP_NOOP_AFTER,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+    ):
+        self.noop_after = noop_after
+        self.max_messages = max_messages
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._sent = 0
+        self._last_used = 0.0
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None and self._sent >= self.max_messages:
+            self.close()
+        if self._smtp is not None and time.monotonic() - self._last_used >= self.noop_after:
+            try:
+                with track(SMTP_COMMAND, SMTP_FAILURES, command="noop"):
+                    code, _msg = self._smtp.noop()
+            except OSError:
+                code = None
+            if code != 250:
+                logger.info("[MAIL] SMTP connection went stale, reconnecting")
+                self._discard()
+        if self._smtp is None:
+            cfg = mail_service._get_smtp_config()
+            try:
+                with track(SMTP_COMMAND, SMTP_FAILURES, command="connect"):
+                    self._smtp = mail_service.connect_smtp(cfg)
+            except OSError as err:
+                raise SmtpUnavailable(f"{cfg['host']}:{cfg['port']}: {err}") from err
+            self._sent = 0
+        return self._smtp
+
+    def send(self, message) -> None:
+        """Send an ``EmailMessage``; reconnect once if the server dropped the connection."""
+        for retry in (False, True):
+            smtp = self._connection()
+            try:
+                with track(SMTP_COMMAND, SMTP_FAILURES, command="send"):
+                    smtp.send_message(message)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # answered by the server: the connection itself is fine
+                self._last_used = time.monotonic()
+                raise
+            except OSError:
+                self._discard()
+                if retry:
+                    raise
+                continue
+            self._sent += 1
+            self._last_used = time.monotonic()
+            return
+
+    def _discard(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.close()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        """Say QUIT and drop the connection."""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except OSError:
+                logger.debug("[MAIL] QUIT failed", exc_info=True)
+        self._discard()
+
+
+@dataclass
+class DrainReport:
+    claimed: int = 0
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    # the SMTP server was unreachable; the remaining claimed messages were released
+    deferred: int = 0
+
+
+class OutboxWorker:
+    def __init__(self, smtp: Optional[SmtpSession] = None, batch: int = EMAIL_OUTBOX_BATCH):
+        self.smtp = smtp or SmtpSession()
+        self.batch = batch
+        # one drain at a time: the admin endpoint and the loop share the SMTP session
+        self._lock = threading.Lock()
+
+    def _claim(self, db: Session, now: datetime) -> list:
+        rows = db.execute(
+            select(
+                _outbox.c.id,
+                _outbox.c.to_email,
+                _outbox.c.subject,
+                _outbox.c.body,
+                _outbox.c.attempts,
+            )
+            .where(_outbox.c.status == "pending", _outbox.c.next_attempt_at <= now)
+            .order_by(_outbox.c.next_attempt_at)
+            .limit(self.batch)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if rows:
+            db.execute(
+                update(_outbox)
+                .where(_outbox.c.id.in_([r.id for r in rows]))
+                .values(next_attempt_at=now + timedelta(seconds=EMAIL_OUTBOX_LEASE))
+            )
+        db.commit()
+        return rows
+
+    def _record(self, db: Session, row, exc: Optional[Exception]) -> str:
+        """Store the outcome of one send; return "sent", "retried" or "failed"."""
+        now = datetime.now(UTC)
+        if exc is None:
+            values, result = {"status": "sent", "sent_at": now, "last_error": None}, "sent"
+        else:
+            # claimed rows are leased to this worker: nobody else changes attempts
+            attempts = row.attempts + 1
+            values = {"attempts": attempts, "last_error": str(exc)[:1000]}
+            if is_permanent(exc) or attempts >= EMAIL_MAX_ATTEMPTS:
+                values["status"], result = "failed", "failed"
+            else:
+                values["next_attempt_at"] = now + timedelta(seconds=retry_delay(attempts))
+                result = "retried"
+        db.execute(update(_outbox).where(_outbox.c.id == row.id).values(**values))
+        db.commit()
+        EMAILS.labels(result).inc()
+        return result
+
+    def _release(self, db: Session, ids: list[int]) -> None:
+        retry_at = datetime.now(UTC) + timedelta(seconds=EMAIL_RETRY_BASE)
+        db.execute(update(_outbox).where(_outbox.c.id.in_(ids)).values(next_attempt_at=retry_at))
+        db.commit()
+
+    def drain_once(self, now: Optional[datetime] = None) -> DrainReport:
+        """Send every message due at ``now``, batch after batch."""
+        report = DrainReport()
+        with self._lock, SessionLocal() as db:
+            while True:
+                rows = self._claim(db, now or datetime.now(UTC))
+                report.claimed += len(rows)
+                for i, row in enumerate(rows):
+                    message = mail_service.build_message(row.to_email, row.subject, row.body)
+                    try:
+                        if not mail_service.dry_run():
+                            self.smtp.send(message)
+                        exc = None
+                    except SmtpUnavailable as err:
+                        logger.warning("[MAIL] SMTP unavailable, deferring the outbox: %s", err)
+                        self._release(db, [r.id for r in rows[i:]])
+                        report.deferred = len(rows) - i
+                        return report
+                    except Exception as err:
+                        logger.warning("[MAIL] sending message %s failed: %s", row.id, err)
+                        exc = err
+                    result = self._record(db, row, exc)
+                    setattr(report, result, getattr(report, result) + 1)
+                if len(rows) < self.batch:
+                    break
+        if report.claimed:
+            logger.info(
+                "[MAIL] drained outbox: sent=%d retried=%d failed=%d",
+                report.sent,
+                report.retried,
+                report.failed,
+            )
+        return report
+
+    async def run_once(self) -> DrainReport:
+        return await run_in_threadpool(self.drain_once)
+
+    async def run_forever(self, interval: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[MAIL] outbox pass failed")
+            await asyncio.sleep(interval)
+
+    def close(self) -> None:
+        with self._lock:
+            self.smtp.close()
+
+
+outbox_worker = OutboxWorker()
+
+
+@router.get("")
+def outbox_stats(db: Session = Depends(get_db), _admin: models.User = Depends(require_admin)):
+    """Count queued messages by status."""
+    rows = db.execute(select(_outbox.c.status, func.count()).group_by(_outbox.c.status))
+    return dict(rows.all())
+
+
+@router.post("/drain")
+async def drain_now(_admin: models.User = Depends(require_admin)):
+    """Send every due message now."""
+    return await outbox_worker.run_once()
@@ -0,0 +1,145 @@
+"""Per-user entitlement (active subscription) lookups.
+
+The current subscription of a user is cached in process as an immutable
+snapshot (`subscription_cache`), so the hot peer/config
+endpoints and ``/auth/me/subscription`` do no database work on a hit:
+
+* an entry never outlives its subscription: its TTL is cut to ``ended_at``
+  and a cached snapshot is re-checked against the clock on every read;
+* every committed ORM change to ``user_tariffs`` (subscribe, admin
+  assignment, payment completion, ...) drops the affected users' entries,
+  and editing or deleting a tariff drops all of them. Writes made outside this
+  process (or with Core UPDATE statements) are bounded by
+  ``SUBSCRIPTION_CACHE_TTL``.
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from decimal import Decimal
+from itertools import chain
+from typing import Optional
+
+from sqlalchemy import Select, event, select
+from sqlalchemy.orm import Session
+
+from vpn_api import models
+from vpn_api.cache import TTLCache, register
+
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000"))
+SUBSCRIPTION_CACHE_TTL = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "60"))
+
+_MISS = object()
+_ALL = object()
+_PENDING_KEY = "entitlement_invalidations"
+
+# Current subscription snapshots keyed by user id (None: no subscription).
+subscription_cache = register(
+    TTLCache(SUBSCRIPTION_CACHE_SIZE, SUBSCRIPTION_CACHE_TTL, name="subscription")
+)
+
+
+def invalidate_subscription(user_id: int) -> None:
+    subscription_cache.pop(user_id)
+
+
+@dataclass(frozen=True)
+class Entitlement:
+    user_tariff_id: int
+    tariff_id: int
+    tariff_name: str
+    duration_days: int
+    price: Decimal
+    status: str
+    started_at: datetime
+    ended_at: Optional[datetime]
+
+    def is_active(self, now: datetime) -> bool:
+        return self.ended_at is None or self.ended_at > now
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they are stored as UTC
+    return value if value.tzinfo is not None else value.replace(tzinfo=UTC)
+
+
+def current_subscription_stmt(user_id: int, now: datetime) -> Select:
+    """Select the user's current (user_tariff, tariff) pair, best first.
+
+    Served by the ``(user_id, status, ended_at)`` index on ``user_tariffs``.
+    """
+    return (
+        select(models.UserTariff, models.Tariff)
+        .join(models.Tariff)
+        .where(
+            models.UserTariff.user_id == user_id,
+            models.UserTariff.status == "active",
+            (models.UserTariff.ended_at.is_(None)) | (models.UserTariff.ended_at > now),
+        )
+        # lifetime subscriptions first, then the one that lasts longest
+        .order_by(models.UserTariff.ended_at.is_(None).desc(), models.UserTariff.ended_at.desc())
+        .limit(1)
+    )
+
+
+def _load(db: Session, user_id: int, now: datetime) -> Optional[Entitlement]:
+    row = db.execute(current_subscription_stmt(user_id, now)).first()
+    if row is None:
+        return None
+    user_tariff, tariff = row
+    return Entitlement(
+        user_tariff_id=user_tariff.id,
+        tariff_id=tariff.id,
+        tariff_name=tariff.name,
+        duration_days=tariff.duration_days,
+        price=tariff.price,
+        status=user_tariff.status,
+        started_at=user_tariff.started_at,
+        ended_at=as_utc(user_tariff.ended_at) if user_tariff.ended_at else None,
+    )
+
+
+def get_entitlement(
+    db: Session, user_id: int, now: Optional[datetime] = None
+) -> Optional[Entitlement]:
+    """Return the user's current subscription, or None when there is none."""
+    now = now or datetime.now(UTC)
+    cached = subscription_cache.get(user_id, _MISS)
+    if cached is not _MISS and (cached is None or cached.is_active(now)):
+        return cached
+    entitlement = _load(db, user_id, now)
+    ttl = None
+    if entitlement is not None and entitlement.ended_at is not None:
+        ttl = min(subscription_cache.ttl, (entitlement.ended_at - now).total_seconds())
+    subscription_cache.set(user_id, entitlement, ttl=ttl)
+    return entitlement
+
+
+def has_active_subscription(db: Session, user_id: int) -> bool:
+    return get_entitlement(db, user_id) is not None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, _flush_context) -> None:
+    changed = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.UserTariff):
+            changed.add(obj.user_id)
+        elif isinstance(obj, models.Tariff) and obj not in session.new:
+            changed.add(_ALL)
+    if changed:
+        # a rolled back transaction leaves these behind; invalidating a few
+        # extra entries on the next commit is harmless
+        session.info.setdefault(_PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if _ALL in pending:
+        subscription_cache.clear()
+        return
+    for user_id in pending:
+        invalidate_subscription(user_id)
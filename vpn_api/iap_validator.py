@@ -1,15 +1,47 @@
 """Receipt validation for Apple IAP and Google Play.
 
 This module provides classes for validating in-app purchase receipts
-from Apple and Google, mapping product IDs to tariff IDs, and extracting
-purchase information.
+from Apple and Google, mapping product IDs to tariff IDs (through the
+in-memory `vpn_api.product_catalog`), and extracting purchase information.
+
+Apple receipts are checked with `IapValidator`, an async client on one
+long-lived keep-alive aiohttp session (`iap_validator`, closed by the app
+lifespan):
+
+* results are cached by receipt hash (`vpn_api.cache.receipt_cache`) and a
+  cached purchase never outlives its ``expires_date_ms``; concurrent checks
+  of the same receipt share one request to Apple, so a restore storm after an
+  app update costs one verifyReceipt call per receipt, not per launch;
+* receipts go to production first and are retried against the sandbox when
+  Apple answers 21007 (sandbox receipt), or the other way round on 21008;
+* definitive rejections are cached for ``IAP_RECEIPT_NEGATIVE_TTL`` seconds,
+  transient failures (network errors, 21005, 21009, 211xx) are not cached.
 """
 
+import asyncio
+import hashlib
+import logging
 import os
-from datetime import datetime
-from typing import ClassVar, Dict, Optional
+import time
+from datetime import UTC, datetime
+from typing import Dict, Optional
 
-import requests
+from vpn_api.cache import receipt_cache
+from vpn_api.metrics import IAP_VERIFY_FAILURES, IAP_VERIFY_LATENCY, track
+from vpn_api.product_catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+IAP_HTTP_TIMEOUT = float(os.getenv("IAP_HTTP_TIMEOUT", "10"))
+IAP_HTTP_POOL_LIMIT = int(os.getenv("IAP_HTTP_POOL_LIMIT", "20"))
+# How long a definitively rejected receipt (or an expired purchase) is cached.
+IAP_RECEIPT_NEGATIVE_TTL = float(os.getenv("IAP_RECEIPT_NEGATIVE_TTL", "60"))
+
+_MISS = object()
+# verifyReceipt statuses
+_SANDBOX_RECEIPT = 21007
+_PRODUCTION_RECEIPT = 21008
+_TRANSIENT = {21005, 21009}
 
 
 class IapValidator:
@@ -19,8 +51,40 @@ class IapValidator:
     APPLE_SANDBOX_URL = "https://sandbox.itunes.apple.com/verifyReceipt"
     APPLE_PRODUCTION_URL = "https://buy.itunes.apple.com/verifyReceipt"
 
-    @staticmethod
-    def validate_apple_receipt(receipt: str, bundle_id: str) -> Optional[Dict]:
+    def __init__(
+        self,
+        production_url: Optional[str] = None,
+        sandbox_url: Optional[str] = None,
+        session=None,
+    ):
+        self.production_url = production_url or self.APPLE_PRODUCTION_URL
+        self.sandbox_url = sandbox_url or self.APPLE_SANDBOX_URL
+        # endpoint tried first; the other one is the 21007/21008 fallback
+        self.primary_url = os.getenv("APPLE_RECEIPT_URL") or self.production_url
+        self._session = session
+        self._owns_session = session is None
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    def _get_session(self):
+        # created lazily: an aiohttp session must be made inside the running loop
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=IAP_HTTP_POOL_LIMIT),
+                timeout=aiohttp.ClientTimeout(total=IAP_HTTP_TIMEOUT),
+            )
+            self._owns_session = True
+        return self._session
+
+    async def close(self) -> None:
+        for task in list(self._inflight.values()):
+            task.cancel()
+        sess, self._session = self._session, None
+        if sess is not None and self._owns_session:
+            await sess.close()
+
+    async def validate_apple_receipt(self, receipt: str, bundle_id: str) -> Optional[Dict]:
         """Validate an Apple IAP receipt.
 
         Args:
@@ -28,54 +92,109 @@ class IapValidator:
             bundle_id: Bundle ID of the app (e.g., "com.example.vpn")
 
         Returns:
-            Dict with keys: transaction_id, product_id, purchase_date, expiry_date, is_valid
+            Dict with keys: transaction_id, product_id, purchase_date, expiry_date,
+            environment, is_valid
             None if validation fails
 
         """
-        url = os.getenv("APPLE_RECEIPT_URL", IapValidator.APPLE_SANDBOX_URL)
-
+        key = (bundle_id, hashlib.sha256(receipt.encode()).hexdigest())
+        cached = receipt_cache.get(key, _MISS)
+        if cached is not _MISS:
+            return cached
+        task = self._inflight.get(key)
+        if task is None:
+            # the check runs in its own task: cancelling any one request,
+            # including the one that started it, leaves the others waiting
+            task = asyncio.create_task(self._verify_and_cache(key, receipt, bundle_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    async def _verify_and_cache(self, key: tuple, receipt: str, bundle_id: str) -> Optional[Dict]:
+        result, ttl = await self._verify_apple(receipt, bundle_id)
+        if ttl:
+            receipt_cache.set(key, result, ttl=ttl)
+        return result
+
+    def _finished(self, key: tuple, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # retrieved here so a check nobody waits for any more does not log a warning
+            task.exception()
+
+    def _environment(self, url: str) -> str:
+        return "sandbox" if url == self.sandbox_url else "production"
+
+    async def _post(self, url: str, payload: dict) -> dict:
+        labels = {"environment": self._environment(url)}
+        with track(IAP_VERIFY_LATENCY, IAP_VERIFY_FAILURES, **labels):
+            async with self._get_session().post(url, json=payload) as resp:
+                resp.raise_for_status()
+                # Apple answers with text/plain on some errors
+                return await resp.json(content_type=None)
+
+    async def _verify_apple(self, receipt: str, bundle_id: str) -> tuple[Optional[Dict], float]:
+        """Ask Apple about ``receipt``; return the result and how long to cache it."""
         payload = {
             "receipt-data": receipt,
             "password": os.getenv("APPLE_APP_SECRET", ""),
             "exclude-old-transactions": False,
         }
-
+        url = self.primary_url
         try:
-            resp = requests.post(url, json=payload, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-
-            if data.get("status") != 0:
-                return None  # Receipt invalid
-
-            # Extract latest transaction
-            receipt_info = data.get("latest_receipt_info") or data.get("receipt", {}).get(
-                "in_app", []
-            )
-
-            if not receipt_info:
-                return None
-
-            latest = receipt_info[-1] if isinstance(receipt_info, list) else receipt_info
-
-            purchase_date_ms = int(latest.get("purchase_date_ms", 0))
-            expires_date_ms = int(latest.get("expires_date_ms", 0))
-
-            return {
-                "transaction_id": latest.get("transaction_id"),
-                "product_id": latest.get("product_id"),
-                "purchase_date": datetime.fromtimestamp(purchase_date_ms / 1000),
-                "expiry_date": (
-                    datetime.fromtimestamp(expires_date_ms / 1000) if expires_date_ms else None
-                ),
-                "is_valid": True,
+            data = await self._post(url, payload)
+            status = data.get("status")
+            fallback = {
+                _SANDBOX_RECEIPT: self.sandbox_url,
+                _PRODUCTION_RECEIPT: self.production_url,
             }
+            if fallback.get(status, url) != url:
+                url = fallback[status]
+                data = await self._post(url, payload)
+                status = data.get("status")
         except Exception as e:
-            print(f"Apple receipt validation error: {e}")
-            return None
-
-    @staticmethod
-    def validate_google_receipt(package_name: str, product_id: str, token: str) -> Optional[Dict]:
+            logger.warning("Apple receipt validation error: %s", e)
+            return None, 0
+
+        if status != 0:
+            transient = status in _TRANSIENT or 21100 <= (status or 0) <= 21199
+            logger.info("Apple rejected receipt: status=%s transient=%s", status, transient)
+            return None, 0 if transient else IAP_RECEIPT_NEGATIVE_TTL
+
+        receipt_bundle = (data.get("receipt") or {}).get("bundle_id")
+        if bundle_id and receipt_bundle and receipt_bundle != bundle_id:
+            logger.warning("Apple receipt is for bundle %r, expected %r", receipt_bundle, bundle_id)
+            return None, IAP_RECEIPT_NEGATIVE_TTL
+
+        # Extract latest transaction
+        receipt_info = data.get("latest_receipt_info") or data.get("receipt", {}).get("in_app", [])
+        if not receipt_info:
+            return None, IAP_RECEIPT_NEGATIVE_TTL
+        latest = receipt_info[-1] if isinstance(receipt_info, list) else receipt_info
+
+        purchase_date_ms = int(latest.get("purchase_date_ms", 0))
+        expires_date_ms = int(latest.get("expires_date_ms", 0))
+        result = {
+            "transaction_id": latest.get("transaction_id"),
+            "product_id": latest.get("product_id"),
+            "purchase_date": datetime.fromtimestamp(purchase_date_ms / 1000, UTC),
+            "expiry_date": (
+                datetime.fromtimestamp(expires_date_ms / 1000, UTC) if expires_date_ms else None
+            ),
+            "environment": self._environment(url),
+            "is_valid": True,
+        }
+        ttl = receipt_cache.ttl
+        if expires_date_ms:
+            remaining = expires_date_ms / 1000 - time.time()
+            # once expired, re-ask soon: the same receipt also carries renewals
+            ttl = min(ttl, remaining) if remaining > 0 else IAP_RECEIPT_NEGATIVE_TTL
+        return result, ttl
+
+    async def validate_google_receipt(
+        self, package_name: str, product_id: str, token: str
+    ) -> Optional[Dict]:
         """Validate a Google Play receipt.
 
         Args:
@@ -99,23 +218,17 @@ class IapValidator:
         return None
 
 
+# App-wide validator; its HTTP session is closed by the FastAPI lifespan in main.py.
+iap_validator = IapValidator()
+
+
 class ProductIdToTariffMapper:
-    """Maps product IDs to tariff IDs and provides tariff information."""
-
-    # Mapping of product IDs to tariff IDs
-    # This should ideally come from the database, but for now we use a static mapping
-    MAPPING: ClassVar = {
-        "com.example.vpn.monthly": 1,  # 30 дней
-        "com.example.vpn.annual": 2,  # 365 дней
-        "com.example.vpn.lifetime": 3,  # Lifetime
-    }
-
-    # Duration in days for each tariff
-    DURATION_MAPPING: ClassVar = {
-        1: 30,  # Monthly
-        2: 365,  # Annual
-        3: 36500,  # Lifetime (~100 years)
-    }
+    """Maps product IDs to tariff IDs and provides tariff information.
+
+    Reads the in-memory product catalog (`vpn_api.product_catalog`), so
+    lookups never query the database; products are mapped to tariffs by an
+    admin (``PUT /tariffs/{tariff_id}/products/{product_id}``).
+    """
 
     @staticmethod
     def get_tariff_id(product_id: str) -> Optional[int]:
@@ -128,7 +241,8 @@ class ProductIdToTariffMapper:
             Tariff ID or None if product_id is not recognized
 
         """
-        return ProductIdToTariffMapper.MAPPING.get(product_id)
+        product = catalog().get(product_id)
+        return product.tariff_id if product is not None else None
 
     @staticmethod
     def get_duration_days(tariff_id: int) -> int:
@@ -138,10 +252,10 @@ class ProductIdToTariffMapper:
             tariff_id: Tariff ID from database
 
         Returns:
-            Duration in days
+            Duration in days (0 if no product grants the tariff)
 
         """
-        return ProductIdToTariffMapper.DURATION_MAPPING.get(tariff_id, 0)
+        return catalog().durations.get(tariff_id, 0)
 
     @staticmethod
     def get_product_ids() -> list:
@@ -151,4 +265,4 @@ class ProductIdToTariffMapper:
             List of product IDs
 
         """
-        return list(ProductIdToTariffMapper.MAPPING.keys())
+        return list(catalog().products)
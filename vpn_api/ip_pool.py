@@ -0,0 +1,252 @@
+"""WireGuard client address allocation from configurable CIDR pools.
+
+Each pool keeps a high-water mark (`ip_pools.next_offset`) of the next host
+offset that was never handed out, and released addresses stay in
+`ip_allocations` with ``in_use = false`` as a free list. Allocation is
+therefore O(1): reuse one free row, or bump the high-water mark. Both steps
+are single conditional UPDATE statements, so concurrent allocators never
+receive the same address; a lost race simply retries.
+"""
+
+import contextlib
+import ipaddress
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from vpn_api import models
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated list of CIDRs, tried in order.
+WG_IP_POOLS = os.getenv("WG_IP_POOLS", "10.8.0.0/24")
+# Host offsets 1..WG_IP_RESERVED of every pool are never handed out
+# (10.8.0.1-10.8.0.19 by default: server address and pre-existing clients).
+WG_IP_RESERVED = int(os.getenv("WG_IP_RESERVED", "19"))
+MAX_ATTEMPTS = 8
+
+_pools = models.IpPool.__table__
+_allocations = models.IpAllocation.__table__
+
+
+class IpPoolExhausted(RuntimeError):
+    """Raised when every configured pool is out of addresses."""
+
+
+def configured_pools() -> list[str]:
+    return [c.strip() for c in WG_IP_POOLS.split(",") if c.strip()]
+
+
+def _network(cidr: str) -> ipaddress.IPv4Network:
+    return ipaddress.IPv4Network(cidr, strict=False)
+
+
+def _first_offset() -> int:
+    return WG_IP_RESERVED + 1
+
+
+def _last_offset(net: ipaddress.IPv4Network) -> int:
+    # exclude the broadcast address
+    return net.num_addresses - 2
+
+
+def _savepoint(db: Session):
+    # SQLite serialises writers on the database lock, so two allocators can
+    # never race on the same row there; pysqlite's SAVEPOINT handling would
+    # also commit the caller's transaction early. Only use savepoints on
+    # backends with real concurrent writers (Postgres).
+    if db.get_bind().dialect.name == "sqlite":
+        return contextlib.nullcontext()
+    return db.begin_nested()
+
+
+# Statements are built once; per-call work is just parameter binding.
+_SELECT_POOL = select(_pools.c.id).where(_pools.c.cidr == bindparam("cidr"))
+_POP_FREE = (
+    update(_allocations)
+    .where(
+        _allocations.c.id.in_(
+            select(_allocations.c.id)
+            .where(_allocations.c.pool_id == bindparam("p_id"), _allocations.c.in_use.is_(False))
+            .limit(bindparam("n"))
+        ),
+        _allocations.c.in_use.is_(False),
+    )
+    .values(in_use=True)
+    .returning(_allocations.c.address)
+)
+_BUMP = (
+    update(_pools)
+    .where(
+        _pools.c.id == bindparam("p_id"),
+        _pools.c.next_offset + bindparam("k") - 1 <= bindparam("last"),
+    )
+    .values(next_offset=_pools.c.next_offset + bindparam("k"))
+    .returning(_pools.c.next_offset)
+)
+_RESERVE = (
+    update(_allocations)
+    .where(_allocations.c.address == bindparam("addr"), _allocations.c.in_use.is_(False))
+    .values(in_use=True)
+)
+_EXISTING = select(_allocations.c.address).where(
+    _allocations.c.address.in_(bindparam("addrs", expanding=True))
+)
+_RELEASE = (
+    update(_allocations)
+    .where(_allocations.c.address.in_(bindparam("addrs", expanding=True)))
+    .where(_allocations.c.in_use.is_(True))
+    .values(in_use=False)
+)
+_LEGACY_PEERS = select(models.VpnPeer.__table__.c.wg_ip).where(
+    models.VpnPeer.__table__.c.wg_ip.in_(bindparam("wg_ips", expanding=True))
+)
+# keep IN (...) lists well under SQLite's bound-parameter limit
+_CHUNK = 500
+
+
+def _chunks(items: list[str]):
+    for i in range(0, len(items), _CHUNK):
+        yield items[i : i + _CHUNK]
+
+
+def _ensure_pool(db: Session, cidr: str) -> int:
+    cidr = str(_network(cidr))
+    pool_id = db.execute(_SELECT_POOL, {"cidr": cidr}).scalar()
+    if pool_id is not None:
+        return pool_id
+    try:
+        with _savepoint(db):
+            db.execute(insert(_pools).values(cidr=cidr, next_offset=_first_offset()))
+    except IntegrityError:
+        pass  # another worker registered the pool concurrently
+    return db.execute(_SELECT_POOL, {"cidr": cidr}).scalar_one()
+
+
+def _pop_free(db: Session, pool_id: int, n: int) -> list[str]:
+    return list(db.execute(_POP_FREE, {"p_id": pool_id, "n": n}).scalars())
+
+
+def _bump(db: Session, pool_id: int, net: ipaddress.IPv4Network, n: int) -> list[str]:
+    """Advance the high-water mark by up to ``n`` and record the new addresses."""
+    last = _last_offset(net)
+    while n > 0:
+        new = db.execute(_BUMP, {"p_id": pool_id, "k": n, "last": last}).scalar_one_or_none()
+        if new is not None:
+            addresses = [str(net[offset]) for offset in range(new - n, new)]
+            # addresses above the mark may already be taken by `reserve_ip`
+            taken: set[str] = set()
+            for chunk in _chunks(addresses):
+                taken.update(db.execute(_EXISTING, {"addrs": chunk}).scalars())
+            addresses = [a for a in addresses if a not in taken]
+            if addresses:
+                db.execute(
+                    insert(_allocations),
+                    [{"pool_id": pool_id, "address": a, "in_use": True} for a in addresses],
+                )
+            return addresses
+        # not enough room left for n addresses; take what remains
+        n //= 2
+    return []
+
+
+def _taken_by_legacy_peers(db: Session, addresses: list[str]) -> set[str]:
+    # Peers created before the allocator existed are not tracked in
+    # ip_allocations; skip their addresses (leaving them marked in use)
+    # instead of failing on the vpn_peers.wg_ip unique constraint at commit.
+    taken: set[str] = set()
+    for chunk in _chunks([f"{a}/32" for a in addresses]):
+        taken.update(db.execute(_LEGACY_PEERS, {"wg_ips": chunk}).scalars())
+    return {t.split("/", 1)[0] for t in taken}
+
+
+def allocate_ips(db: Session, count: int, pools: Optional[list[str]] = None) -> list[str]:
+    """Reserve ``count`` distinct free addresses, returned as ``a.b.c.d/32``.
+
+    Runs inside the caller's transaction: the allocations become permanent
+    when the caller commits and are undone if it rolls back. The number of
+    statements does not depend on ``count`` or on how full the pools are.
+    """
+    result: list[str] = []
+    for cidr in pools or configured_pools():
+        net = _network(cidr)
+        pool_id = _ensure_pool(db, cidr)
+        races = 0
+        while len(result) < count:
+            want = count - len(result)
+            try:
+                with _savepoint(db):
+                    got = _pop_free(db, pool_id, want)
+                    if len(got) < want:
+                        got += _bump(db, pool_id, net, want - len(got))
+            except IntegrityError:
+                # lost a race on the same address; try again
+                races += 1
+                if races >= MAX_ATTEMPTS:
+                    raise
+                continue
+            if not got:
+                break  # pool exhausted, try the next one
+            legacy = _taken_by_legacy_peers(db, got)
+            result.extend(a for a in got if a not in legacy)
+        if len(result) == count:
+            logger.info("[ALLOC_IP] pool=%s count=%d first=%s", cidr, count, result[0])
+            return [f"{a}/32" for a in result]
+    raise IpPoolExhausted("no free WireGuard addresses left in configured pools")
+
+
+def allocate_ip(db: Session, pools: Optional[list[str]] = None) -> str:
+    """Reserve a single free address; see `allocate_ips`."""
+    return allocate_ips(db, 1, pools)[0]
+
+
+def reserve_ip(db: Session, wg_ip: str, pools: Optional[list[str]] = None) -> bool:
+    """Mark a manually chosen address as in use; return False if it is taken.
+
+    Addresses outside the configured pools, or in a pool's reserved range,
+    are not tracked here; the ``vpn_peers.wg_ip`` unique constraint still
+    guards them.
+    """
+    address = ipaddress.IPv4Address(wg_ip.split("/", 1)[0])
+    for cidr in pools or configured_pools():
+        net = _network(cidr)
+        if address not in net:
+            continue
+        offset = int(address) - int(net.network_address)
+        if not _first_offset() <= offset <= _last_offset(net):
+            return True
+        if _taken_by_legacy_peers(db, [str(address)]):
+            return False
+        pool_id = _ensure_pool(db, cidr)
+        if db.execute(_RESERVE, {"addr": str(address)}).rowcount:
+            return True  # taken from the free list
+        if db.execute(_EXISTING, {"addrs": [str(address)]}).first() is not None:
+            return False  # allocated to another peer
+        # above the high-water mark: record it so the allocator skips it
+        try:
+            with _savepoint(db):
+                db.execute(
+                    insert(_allocations).values(pool_id=pool_id, address=str(address), in_use=True)
+                )
+        except IntegrityError:
+            return False  # reserved concurrently
+        return True
+    return True
+
+
+def release_ips(db: Session, wg_ips: list[Optional[str]]) -> int:
+    """Return addresses to their pools' free lists; unknown addresses are ignored."""
+    addresses = [ip.split("/", 1)[0] for ip in wg_ips if ip]
+    released = 0
+    for chunk in _chunks(addresses):
+        released += db.execute(_RELEASE, {"addrs": chunk}).rowcount
+    return released
+
+
+def release_ip(db: Session, wg_ip: Optional[str]) -> bool:
+    """Return one address to its pool's free list."""
+    return release_ips(db, [wg_ip]) > 0
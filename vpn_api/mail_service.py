@@ -3,8 +3,6 @@ import os
 import smtplib
 from email.message import EmailMessage
 
-from fastapi import BackgroundTasks
-
 logger = logging.getLogger(__name__)
 
 
@@ -18,73 +16,91 @@ def _get_smtp_config():
     }
 
 
-def send_verification_email(to_email: str, code: str):
+def dry_run() -> bool:
     # In test environments we may want to avoid external SMTP. Honor SMTP_DRY_RUN=1
-    if os.getenv("SMTP_DRY_RUN", "0") in ("1", "true", "yes"):
-        logger.debug(
-            "SMTP_DRY_RUN enabled — skipping sending email to %s (code=%s)", to_email, code
-        )
-        return
-    cfg = _get_smtp_config()
-    msg = _prepare_message(to_email, code)
-    try:
-        use_ssl = False
-        # allow explicit SSL when using port 465 or env flag
-        if cfg.get("port") == 465 or os.getenv("SMTP_USE_SSL", "false").lower() in (
-            "1",
-            "true",
-            "yes",
-        ):
-            use_ssl = True
-
-        if use_ssl:
-            # SMTP over SSL
-            with smtplib.SMTP_SSL(cfg["host"], cfg["port"], timeout=10) as s:
-                try:
-                    s.ehlo()
-                except Exception:
-                    logger.debug(
-                        "EHLO failed on SSL connection to %s:%s",
-                        cfg["host"],
-                        cfg["port"],
-                        exc_info=True,
-                    )
-                _attempt_login(s, cfg)
-                s.send_message(msg)
-        else:
-            # plain SMTP with optional STARTTLS
-            with smtplib.SMTP(cfg["host"], cfg["port"], timeout=10) as s:
-                # be explicit: send EHLO and only call starttls if the server advertises it
+    return os.getenv("SMTP_DRY_RUN", "0") in ("1", "true", "yes")
+
+
+def connect_smtp(cfg: dict) -> smtplib.SMTP:
+    """Open an SMTP connection ready to send: EHLO, STARTTLS if offered, login."""
+    use_ssl = False
+    # allow explicit SSL when using port 465 or env flag
+    if cfg.get("port") == 465 or os.getenv("SMTP_USE_SSL", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    ):
+        use_ssl = True
+
+    if use_ssl:
+        # SMTP over SSL
+        s = smtplib.SMTP_SSL(cfg["host"], cfg["port"], timeout=10)
+        try:
+            s.ehlo()
+        except Exception:
+            logger.debug(
+                "EHLO failed on SSL connection to %s:%s",
+                cfg["host"],
+                cfg["port"],
+                exc_info=True,
+            )
+    else:
+        # plain SMTP with optional STARTTLS
+        s = smtplib.SMTP(cfg["host"], cfg["port"], timeout=10)
+        # be explicit: send EHLO and only call starttls if the server advertises it
+        try:
+            s.ehlo()
+            if s.has_extn("starttls"):
                 try:
+                    s.starttls()
                     s.ehlo()
-                    if s.has_extn("starttls"):
-                        try:
-                            s.starttls()
-                            s.ehlo()
-                        except Exception:
-                            # STARTTLS negotiation failed — log full stack and continue without TLS
-                            logger.debug(
-                                "STARTTLS negotiation failed for %s:%s",
-                                cfg["host"],
-                                cfg["port"],
-                                exc_info=True,
-                            )
-                    else:
-                        logger.debug(
-                            "SMTP server %s:%s does not advertise STARTTLS; sending without TLS",
-                            cfg["host"],
-                            cfg["port"],
-                        )
                 except Exception:
-                    # EHLO can fail in odd network cases; log and continue
+                    # STARTTLS negotiation failed — log full stack and continue without TLS
                     logger.debug(
-                        "EHLO/STARTTLS check failed for %s:%s",
+                        "STARTTLS negotiation failed for %s:%s",
                         cfg["host"],
                         cfg["port"],
                         exc_info=True,
                     )
-                _attempt_login(s, cfg)
-                s.send_message(msg)
+            else:
+                logger.debug(
+                    "SMTP server %s:%s does not advertise STARTTLS; sending without TLS",
+                    cfg["host"],
+                    cfg["port"],
+                )
+        except Exception:
+            # EHLO can fail in odd network cases; log and continue
+            logger.debug(
+                "EHLO/STARTTLS check failed for %s:%s",
+                cfg["host"],
+                cfg["port"],
+                exc_info=True,
+            )
+    try:
+        _attempt_login(s, cfg)
+    except Exception:
+        s.close()
+        raise
+    return s
+
+
+def send_verification_email(to_email: str, code: str):
+    """Send one message over a connection of its own.
+
+    Request handlers queue mail with
+    `vpn_api.email_outbox.enqueue_verification_email` instead, in their own
+    transaction: it survives restarts and reuses one SMTP session.
+    """
+    if dry_run():
+        logger.debug(
+            "SMTP_DRY_RUN enabled — skipping sending email to %s (code=%s)", to_email, code
+        )
+        return
+    cfg = _get_smtp_config()
+    msg = _prepare_message(to_email, code)
+    try:
+        with connect_smtp(cfg) as s:
+            s.send_message(msg)
     except Exception:
         # Log details for diagnostics and re-raise so caller knows sending failed
         logger.exception(
@@ -96,15 +112,27 @@ def send_verification_email(to_email: str, code: str):
         raise
 
 
-def _prepare_message(to_email: str, code: str) -> EmailMessage:
+def verification_email(code: str) -> tuple[str, str]:
+    """Return the subject and body of a verification code email."""
+    return (
+        "Your verification code",
+        f"Your verification code: {code}\n\nThis code expires in 10 minutes.",
+    )
+
+
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
     msg = EmailMessage()
-    msg["Subject"] = "Your verification code"
+    msg["Subject"] = subject
     msg["From"] = _get_smtp_config().get("from")
     msg["To"] = to_email
-    msg.set_content(f"Your verification code: {code}\n\nThis code expires in 10 minutes.")
+    msg.set_content(body)
     return msg
 
 
+def _prepare_message(to_email: str, code: str) -> EmailMessage:
+    return build_message(to_email, *verification_email(code))
+
+
 def _attempt_login(server: smtplib.SMTP, cfg: dict):
     if not cfg.get("user"):
         return
@@ -118,7 +146,3 @@ def _attempt_login(server: smtplib.SMTP, cfg: dict):
     except Exception:
         logger.exception("SMTP login failed for %s@%s", cfg.get("user"), cfg.get("host"))
         raise
-
-
-def send_verification_email_background(background_tasks: BackgroundTasks, to_email: str, code: str):
-    background_tasks.add_task(send_verification_email, to_email, code)
@@ -1,13 +1,92 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 
-from vpn_api import models
+from vpn_api import models, product_catalog
+from vpn_api.admin import router as admin_router
 from vpn_api.auth import router as auth_router
-from vpn_api.database import engine
+from vpn_api.database import async_engine, engine
+from vpn_api.email_outbox import EMAIL_OUTBOX_INTERVAL, outbox_worker
+from vpn_api.email_outbox import router as email_outbox_router
+from vpn_api.iap_validator import iap_validator
+from vpn_api.metrics import MetricsMiddleware
+from vpn_api.metrics import router as metrics_router
+from vpn_api.passwords import hasher
+from vpn_api.payment_ingest import router as payment_ingest_router
 from vpn_api.payments import router as payments_router
 from vpn_api.peers import router as peers_router
+from vpn_api.peers_bulk import router as peers_bulk_router
+from vpn_api.product_catalog import PRODUCT_CATALOG_REFRESH_INTERVAL
+from vpn_api.reconciler import WG_RECONCILE_INTERVAL, reconciler
+from vpn_api.reconciler import router as reconcile_router
+from vpn_api.sweeper import SUBSCRIPTION_SWEEP_INTERVAL
+from vpn_api.sweeper import router as sweep_router
+from vpn_api.sweeper import sweeper as subscription_sweeper
 from vpn_api.tariffs import router as tariffs_router
+from vpn_api.wg_easy_adapter import start_shared_client, stop_shared_client
+from vpn_api.wg_host import close_ssh_master, stop_host_queue
+from vpn_api.wg_keys import key_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Один пул соединений к wg-easy на всё время жизни приложения: логин один раз,
+    # keep-alive соединения переиспользуются всеми запросами.
+    wg_url = os.getenv("WG_EASY_URL")
+    wg_pass = os.getenv("WG_EASY_PASSWORD")
+    if wg_url and wg_pass:
+        await start_shared_client(wg_url, wg_pass)
+    # Заранее генерируем пары ключей WireGuard в фоне, чтобы всплеск регистраций
+    # не тратил время на генерацию ключей внутри запроса.
+    key_pool.start()
+    # Каталог продуктов IAP (product_id → тариф) держим в памяти: проверка
+    # покупок не делает запросов к БД. Перечитывается после изменений тарифов
+    # в этом процессе и периодически (изменения из других воркеров).
+    await product_catalog.refresh()
+    catalog_task = None
+    if PRODUCT_CATALOG_REFRESH_INTERVAL > 0:
+        catalog_task = asyncio.create_task(
+            product_catalog.run_forever(PRODUCT_CATALOG_REFRESH_INTERVAL)
+        )
+    # Фоновая сверка пиров: БД, wg-easy и интерфейс на хосте (0 — выключено).
+    reconcile_task = None
+    if WG_RECONCILE_INTERVAL > 0:
+        reconcile_task = asyncio.create_task(reconciler.run_forever(WG_RECONCILE_INTERVAL))
+    # Истечение подписок: помечаем просроченные и отзываем пиры (0 — выключено).
+    sweep_task = None
+    if SUBSCRIPTION_SWEEP_INTERVAL > 0:
+        sweep_task = asyncio.create_task(
+            subscription_sweeper.run_forever(SUBSCRIPTION_SWEEP_INTERVAL)
+        )
+    # Очередь исходящих писем: один воркер держит открытое SMTP-соединение (0 — выключено).
+    outbox_task = None
+    if EMAIL_OUTBOX_INTERVAL > 0:
+        outbox_task = asyncio.create_task(outbox_worker.run_forever(EMAIL_OUTBOX_INTERVAL))
+    try:
+        yield
+    finally:
+        for task in (reconcile_task, sweep_task, catalog_task, outbox_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        await stop_shared_client()
+        # Закрываем SMTP-соединение очереди писем (QUIT).
+        await run_in_threadpool(outbox_worker.close)
+        # Закрываем пул HTTP-соединений к Apple verifyReceipt.
+        await iap_validator.close()
+        # Дожидаемся применения накопленных изменений пиров на хосте.
+        await run_in_threadpool(stop_host_queue)
+        # Закрываем общее (мультиплексированное) SSH-соединение к WG-хосту.
+        await run_in_threadpool(close_ssh_master)
+        # Останавливаем процессы, в которых считаются хэши паролей.
+        await run_in_threadpool(hasher.shutdown)
+        # Закрываем соединения асинхронного движка БД.
+        await async_engine.dispose()
+
 
 app = FastAPI(
     title="VPN Backend",
@@ -18,9 +97,10 @@ app = FastAPI(
         "- /auth — регистрация, логин и управление пользователями\n"
         "- /vpn_peers — CRUD для WireGuard пиров (создание, получение, удаление)\n"
         "- /tariffs — тарифы и назначение тарифов пользователям\n"
-        "- /payments — заглушки для платёжных провайдеров\n"
+        "- /payments — платежи; вебхуки и пакетный импорт событий провайдеров\n"
         "Используйте токен Bearer (JWT) из /auth/login для доступа к защищённым маршрутам."
     ),
+    lifespan=lifespan,
 )
 
 # Примечание: не вызываем автоматически models.Base.metadata.create_all при запуске
@@ -33,8 +113,18 @@ if os.getenv("DEV_INIT_DB") == "1":
 # Подключение роутов
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(tariffs_router, prefix="/tariffs", tags=["tariffs"])
+app.include_router(peers_bulk_router)
 app.include_router(peers_router)
+app.include_router(payment_ingest_router)
 app.include_router(payments_router)
+app.include_router(reconcile_router)
+app.include_router(sweep_router)
+app.include_router(email_outbox_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
+
+# Метрики Prometheus: число запросов, латентность по шаблону маршрута и статусу.
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
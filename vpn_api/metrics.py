@@ -0,0 +1,234 @@
+"""Prometheus metrics: HTTP middleware, domain counters and the /metrics route.
+
+`MetricsMiddleware` is a plain ASGI middleware (no BaseHTTPMiddleware, which
+would copy the request through an extra task). Requests are labelled with the
+route template (``/vpn_peers/{peer_id}``), never the raw path, so label
+cardinality stays bounded; requests that match no route share one label.
+
+Pool, hashing and cache figures already kept by their modules are read at
+scrape time by `AppStatsCollector` instead of being mirrored on every call.
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled.", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to produce the full HTTP response.",
+    ["method", "route", "status"],
+)
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests in flight.", ["method"])
+
+PEERS_CREATED = Counter("vpn_peers_created_total", "Peers created.", ["key_policy"])
+PAYMENT_EVENTS = Counter(
+    "payment_events_total", "Payment provider events ingested.", ["source", "result"]
+)
+WG_EASY_LATENCY = Histogram(
+    "wg_easy_request_duration_seconds", "wg-easy API call duration.", ["operation"]
+)
+WG_EASY_FAILURES = Counter("wg_easy_failures_total", "Failed wg-easy API calls.", ["operation"])
+WG_HOST_COMMAND = Histogram(
+    "wg_host_command_duration_seconds",
+    "Duration of subprocesses run against the WireGuard host.",
+    ["command"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+IAP_VERIFY_LATENCY = Histogram(
+    "iap_verify_receipt_duration_seconds",
+    "Apple verifyReceipt call duration.",
+    ["environment"],
+)
+IAP_VERIFY_FAILURES = Counter(
+    "iap_verify_receipt_failures_total", "Failed Apple verifyReceipt calls.", ["environment"]
+)
+SMTP_COMMAND = Histogram(
+    "smtp_command_duration_seconds",
+    "SMTP connection setup, NOOP health checks and message sends.",
+    ["command"],
+)
+SMTP_FAILURES = Counter("smtp_failures_total", "Failed SMTP commands.", ["command"])
+EMAILS = Counter("emails_total", "Outbox emails by outcome.", ["result"])
+CRYPTO_LATENCY = Histogram(
+    "config_crypto_duration_seconds",
+    "Fernet encrypt/decrypt time of stored peer configs.",
+    ["operation"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+
+
+@contextmanager
+def track(histogram: Histogram, failures: Counter = None, **labels):
+    """Observe the duration of the block; count it in ``failures`` if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if failures is not None:
+            failures.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+def wg_easy_call(operation: str):
+    """Decorate an async wg-easy client method to record latency and failures."""
+
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with track(WG_EASY_LATENCY, WG_EASY_FAILURES, operation=operation):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def route_template(scope) -> str:
+    """Return the matched route as a template, e.g. ``/vpn_peers/{peer_id}``.
+
+    Routes of an included router may carry only their own part of the path,
+    so the prefix is recovered from the request path: whatever precedes the
+    route's own path with the actual parameter values substituted.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None)
+    if template is None:
+        return UNMATCHED_ROUTE
+    path = scope["path"]
+    try:
+        rendered = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    if rendered and path.endswith(rendered):
+        return path[: len(path) - len(rendered)] + template
+    return template
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        # (method, route, status) -> (counter, histogram) children; labels()
+        # takes a lock and builds a key on every call, this is a dict lookup
+        self._children: dict = {}
+
+    def _observe(self, labels: tuple, elapsed: float) -> None:
+        children = self._children.get(labels)
+        if children is None:
+            method, route, status = labels
+            children = (
+                HTTP_REQUESTS.labels(method, route, str(status)),
+                HTTP_LATENCY.labels(method, route, str(status)),
+            )
+            self._children[labels] = children
+        children[0].inc()
+        children[1].observe(elapsed)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        # stays 500 if the app raises before sending a response
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress.dec()
+            self._observe((method, route_template(scope), status), elapsed)
+
+
+class AppStatsCollector:
+    """Expose DB pool, password hashing and cache statistics at scrape time."""
+
+    def collect(self):
+        # imported here: these modules import the database engines
+        from vpn_api import cache, passwords
+        from vpn_api.database import async_engine, engine
+        from vpn_api.db_pool import pool_stats
+
+        in_use = GaugeMetricFamily("db_pool_in_use", "Connections checked out.", labels=["engine"])
+        idle = GaugeMetricFamily("db_pool_idle", "Idle pooled connections.", labels=["engine"])
+        overflow = GaugeMetricFamily(
+            "db_pool_overflow", "Connections open beyond the pool size.", labels=["engine"]
+        )
+        wait = CounterMetricFamily(
+            "db_pool_checkout_wait_seconds",
+            "Time spent waiting for a connection.",
+            labels=["engine"],
+        )
+        wait_max = GaugeMetricFamily(
+            "db_pool_checkout_wait_max_seconds", "Longest checkout wait.", labels=["engine"]
+        )
+        checkouts = CounterMetricFamily("db_pool_checkouts", "Pool checkouts.", labels=["engine"])
+        timeouts = CounterMetricFamily(
+            "db_pool_checkout_timeouts", "Checkouts that timed out.", labels=["engine"]
+        )
+        for name, eng in (("sync", engine), ("async", async_engine.sync_engine)):
+            stats = pool_stats(eng)
+            if "in_use" in stats:
+                in_use.add_metric([name], stats["in_use"])
+                idle.add_metric([name], stats["idle"])
+                overflow.add_metric([name], stats["overflow"])
+            if "checkouts" in stats:
+                wait.add_metric([name], stats["checkout_wait_seconds_total"])
+                wait_max.add_metric([name], stats["checkout_wait_seconds_max"])
+                checkouts.add_metric([name], stats["checkouts"])
+                timeouts.add_metric([name], stats["checkout_timeouts"])
+        yield from (in_use, idle, overflow, wait, wait_max, checkouts, timeouts)
+
+        hashing = passwords.hasher.stats()
+        yield GaugeMetricFamily(
+            "password_hash_in_flight", "Hashing jobs in flight.", value=hashing["in_flight"]
+        )
+        yield CounterMetricFamily(
+            "password_hash_rejected", "Hashing jobs rejected (queue full).", hashing["rejected"]
+        )
+
+        hits = CounterMetricFamily("cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses.", labels=["cache"])
+        size = GaugeMetricFamily("cache_size", "Entries held.", labels=["cache"])
+        for name, stats in cache.all_stats().items():
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name], stats["size"])
+        yield from (hits, misses, size)
+
+
+REGISTRY.register(AppStatsCollector())
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
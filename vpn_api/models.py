@@ -6,10 +6,12 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -54,6 +56,7 @@ class User(Base):
 
 class Tariff(Base):
     __tablename__ = "tariffs"
+    __table_args__ = (Index("ix_tariffs_created_at_id", "created_at", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
@@ -63,12 +66,17 @@ class Tariff(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     user_tariffs = relationship("UserTariff", back_populates="tariff", cascade="all, delete-orphan")
+    iap_products = relationship("IapProduct", back_populates="tariff", cascade="all, delete-orphan")
 
 
 class UserTariff(Base):
     __tablename__ = "user_tariffs"
     __table_args__ = (
         UniqueConstraint("user_id", "tariff_id", "started_at", name="uix_user_tariff_start"),
+        # expiry sweep: active subscriptions ordered by end time
+        Index("ix_user_tariffs_status_ended_at", "status", "ended_at"),
+        # current subscription of a user (vpn_api.entitlements)
+        Index("ix_user_tariffs_user_status_ended_at", "user_id", "status", "ended_at"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -88,6 +96,22 @@ class UserTariff(Base):
 
 class VpnPeer(Base):
     __tablename__ = "vpn_peers"
+    # keyset pagination on (created_at, id), globally and per user
+    __table_args__ = (
+        Index("ix_vpn_peers_created_at_id", "created_at", "id"),
+        Index("ix_vpn_peers_user_created_at_id", "user_id", "created_at", "id"),
+        # newest active peer of a user (GET /vpn_peers/self/config, read backwards);
+        # only active rows are indexed. ``active`` is also a key column: older
+        # SQLite releases otherwise sort instead of reading the index in order.
+        Index(
+            "ix_vpn_peers_user_active_created_at",
+            "user_id",
+            "active",
+            "created_at",
+            postgresql_where=text("active"),
+            sqlite_where=text("active = 1"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(
@@ -99,18 +123,33 @@ class VpnPeer(Base):
     # remote client id so we can remove it later if needed. Kept nullable
     # to remain backwards-compatible with existing rows.
     wg_client_id = Column(String, nullable=True, unique=False)
-    wg_ip = Column(String, nullable=False, unique=True)
+    # Cleared (and returned to the pool) when the sweeper revokes the peer.
+    wg_ip = Column(String, nullable=True, unique=True)
     allowed_ips = Column(String, nullable=True)
     # Encrypted wg-quick config (wg-quick text encrypted with CONFIG_ENCRYPTION_KEY)
     wg_config_encrypted = Column(String, nullable=True)
     active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Bumped on every change; the reconciler uses it as an incremental high-water mark.
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+        index=True,
+    )
 
     user = relationship("User", back_populates="vpn_peers")
 
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_created_at_id", "created_at", "id"),
+        Index("ix_payments_user_created_at_id", "user_id", "created_at", "id"),
+        # one row per provider payment: the conflict target of webhook/import upserts
+        Index("uix_payments_provider_payment_id", "provider", "provider_payment_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(
@@ -124,3 +163,63 @@ class Payment(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="payments")
+
+
+class IapProduct(Base):
+    """An app store product id that grants a tariff (see vpn_api.product_catalog)."""
+
+    __tablename__ = "iap_products"
+
+    product_id = Column(String, primary_key=True)
+    tariff_id = Column(
+        Integer, ForeignKey("tariffs.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    tariff = relationship("Tariff", back_populates="iap_products")
+
+
+class EmailOutbox(Base):
+    """An outbound email, sent by the outbox worker (see vpn_api.email_outbox)."""
+
+    __tablename__ = "email_outbox"
+    # the worker claims due messages: status = 'pending' ordered by next_attempt_at
+    __table_args__ = (Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    # pending -> sent | failed
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # when the message is due; pushed forward while a worker holds it (lease)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class IpPool(Base):
+    """A CIDR block WireGuard client addresses are handed out from."""
+
+    __tablename__ = "ip_pools"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cidr = Column(String, unique=True, nullable=False)
+    # High-water mark: the next host offset inside the network that has never
+    # been handed out. Released addresses go to ip_allocations' free list.
+    next_offset = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class IpAllocation(Base):
+    """An address taken from an IpPool; rows with in_use=False form the free list."""
+
+    __tablename__ = "ip_allocations"
+    __table_args__ = (Index("ix_ip_allocations_pool_free", "pool_id", "in_use"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    pool_id = Column(Integer, ForeignKey("ip_pools.id", ondelete="CASCADE"), nullable=False)
+    address = Column(String, unique=True, nullable=False)
+    in_use = Column(Boolean, nullable=False, default=True)
@@ -0,0 +1,129 @@
+"""Keyset (cursor) pagination on ``(created_at, id)``.
+
+Listings return a plain JSON list as before; when more rows exist the
+``X-Next-Cursor`` response header carries an opaque token for the next
+page. Each page is one index range scan on the ``(created_at, id)``
+composite indexes, however deep the client pages. ``skip`` (offset mode)
+is still accepted for old clients, but it makes the database scan and
+discard every skipped row.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query
+
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: int, descending: bool = False) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "i": row_id, "d": int(descending)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[datetime, int, bool]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["t"]), int(data["i"]), bool(data.get("d"))
+    except Exception as err:
+        raise HTTPException(status_code=400, detail="invalid cursor") from err
+
+
+def _bind_created_at(dialect: str, value: datetime):
+    # SQLite keeps timestamps as text: server defaults are stored without a
+    # fractional part, so compare against the same textual form.
+    if dialect == "sqlite":
+        text = value.strftime("%Y-%m-%d %H:%M:%S")
+        if value.microsecond:
+            text += f".{value.microsecond:06d}"
+        return literal(text)
+    return literal(value)
+
+
+def _keyset(stmt, model, limit: int, cursor: Optional[str], descending: bool, dialect: str):
+    """Restrict a ``Query`` or ``Select`` to the page after ``cursor`` (plus one row)."""
+    key = tuple_(model.created_at, model.id)
+    if cursor:
+        created_at, row_id, cursor_desc = decode_cursor(cursor)
+        if cursor_desc != descending:
+            raise HTTPException(status_code=400, detail="cursor does not match sort order")
+        bound = tuple_(_bind_created_at(dialect, created_at), literal(row_id))
+        stmt = stmt.filter(key < bound if descending else key > bound)
+    if descending:
+        stmt = stmt.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        stmt = stmt.order_by(model.created_at.asc(), model.id.asc())
+    return stmt.limit(limit + 1)
+
+
+def _split(rows: list, limit: int, descending: bool) -> tuple[list, Optional[str]]:
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id, descending)
+
+
+def keyset_page(
+    query: Query,
+    model,
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+) -> tuple[list, Optional[str]]:
+    """Return one page of ``query`` ordered by ``(created_at, id)`` and the next cursor."""
+    dialect = query.session.get_bind().dialect.name
+    rows = _keyset(query, model, limit, cursor, descending, dialect).all()
+    return _split(rows, limit, descending)
+
+
+def paginate(
+    query: Query,
+    model,
+    response: Response,
+    *,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    descending: bool = False,
+) -> list:
+    """Apply keyset pagination (or legacy offset mode when ``skip`` > 0)."""
+    if skip:
+        if cursor:
+            raise HTTPException(status_code=400, detail="use either cursor or skip, not both")
+        return query.offset(skip).limit(limit).all()
+    rows, next_cursor = keyset_page(query, model, limit, cursor, descending)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
+
+
+async def apaginate(
+    db: AsyncSession,
+    stmt: Select,
+    model,
+    response: Response,
+    *,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    descending: bool = False,
+) -> list:
+    """`paginate` for a ``select(model)`` statement run on an `AsyncSession`."""
+    if skip:
+        if cursor:
+            raise HTTPException(status_code=400, detail="use either cursor or skip, not both")
+        return list((await db.scalars(stmt.offset(skip).limit(limit))).all())
+    stmt = _keyset(stmt, model, limit, cursor, descending, db.bind.dialect.name)
+    rows, next_cursor = _split(list((await db.scalars(stmt)).all()), limit, descending)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
@@ -0,0 +1,160 @@
+"""Password hashing in a dedicated, bounded process pool.
+
+pbkdf2 hashing is CPU bound and holds the GIL, so running it in the request
+threadpool lets a burst of logins stall every other sync endpoint of the
+worker. Hash and verify jobs are sent to a small process pool instead; the
+calling thread only waits on the result. At most ``PASSWORD_HASH_MAX_QUEUE``
+jobs may be in flight: beyond that `HashingSaturated` is raised right away
+and the routes answer 503, rather than queueing work clients will have
+given up on.
+
+This module only imports passlib, so pool workers start cheaply.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Optional
+
+from passlib.context import CryptContext
+from passlib.hash import pbkdf2_sha256
+
+# Worker processes for hashing; 0 hashes inline in the calling thread.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Jobs allowed in flight (running + queued) before requests are rejected.
+PASSWORD_HASH_MAX_QUEUE = int(
+    os.getenv("PASSWORD_HASH_MAX_QUEUE", str(max(1, PASSWORD_HASH_WORKERS) * 16))
+)
+# Seconds a caller waits for its job before giving up.
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+# pbkdf2 iterations for new hashes; hashes made with fewer are upgraded on login.
+PASSWORD_PBKDF2_ROUNDS = int(os.getenv("PASSWORD_PBKDF2_ROUNDS", str(pbkdf2_sha256.default_rounds)))
+
+# Prefer pbkdf2_sha256 to avoid bcrypt's 72-byte input limit and any CI
+# platform-dependent bcrypt backend issues. Keep bcrypt_sha256 and bcrypt
+# as fallbacks so existing hashes remain verifiable.
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256", "bcrypt_sha256", "bcrypt"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_PBKDF2_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_PBKDF2_ROUNDS,
+)
+
+
+class HashingSaturated(RuntimeError):
+    """Raised when too many hashing jobs are already in flight."""
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+        timeout: float = PASSWORD_HASH_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs event loop and
+            # threadpool threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    @contextmanager
+    def _slot(self):
+        """Account for one job; yields the executor, or None to hash inline."""
+        with self._lock:
+            if self.in_flight >= self.max_queue:
+                self.rejected += 1
+                raise HashingSaturated("password hashing queue is full")
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            executor = self._get_executor() if self.workers > 0 else None
+        try:
+            yield executor
+        except TimeoutError as err:
+            raise HashingSaturated("password hashing timed out") from err
+        except BrokenProcessPool:
+            # a worker died; start a fresh pool on the next call
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def _run(self, fn, *args):
+        with self._slot() as executor:
+            if executor is None:
+                return fn(*args)
+            return executor.submit(fn, *args).result(timeout=self.timeout)
+
+    async def _arun(self, fn, *args):
+        with self._slot() as executor:
+            if executor is None:
+                return await asyncio.to_thread(fn, *args)
+            future = asyncio.wrap_future(executor.submit(fn, *args))
+            return await asyncio.wait_for(future, self.timeout)
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(_verify, password, hashed)
+
+    async def ahash(self, password: str) -> str:
+        """Like `hash`, but waits without blocking the event loop."""
+        return await self._arun(_hash, password)
+
+    async def averify(self, password: str, hashed: str) -> bool:
+        """Like `verify`, but waits without blocking the event loop."""
+        return await self._arun(_verify, password, hashed)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Tell whether ``hashed`` uses a deprecated scheme or outdated parameters."""
+    return pwd_context.needs_update(hashed)
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,225 @@
+"""Idempotent bulk ingestion of payment provider events.
+
+Two entry points feed the same upsert:
+
+* ``POST /payments/webhook/{provider}``: provider notifications, one event or
+  a JSON array of events, authenticated by an HMAC-SHA256 of the raw body
+  with ``PAYMENT_WEBHOOK_SECRET`` (hex, in the ``X-Signature-SHA256`` header);
+* ``POST /payments/import``: admin batch import, e.g. a day's settlement file.
+
+Events are written with ``INSERT ... ON CONFLICT (provider,
+provider_payment_id) DO UPDATE`` in chunks of ``PAYMENT_INGEST_BATCH`` rows,
+so provider retries and replayed files never create duplicates. The update
+only fires for an allowed status transition (see `_TRANSITIONS`): a late
+``pending`` retry cannot undo ``completed``, and replaying the same event is a
+no-op.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from vpn_api import models, schemas
+from vpn_api.auth import require_admin
+from vpn_api.database import get_async_db
+from vpn_api.metrics import PAYMENT_EVENTS
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET", "")
+# Rows per executemany call of the upsert.
+PAYMENT_INGEST_BATCH = int(os.getenv("PAYMENT_INGEST_BATCH", "1000"))
+PAYMENT_INGEST_MAX_EVENTS = int(os.getenv("PAYMENT_INGEST_MAX_EVENTS", "100000"))
+SIGNATURE_HEADER = "X-Signature-SHA256"
+
+router = APIRouter(prefix="/payments", tags=["payments"])
+
+_payments = models.Payment.__table__
+_S = models.PaymentStatus
+# current status -> statuses an event may move it to
+_TRANSITIONS = {
+    _S.pending: (_S.completed, _S.failed),
+    _S.failed: (_S.completed,),
+    _S.completed: (_S.refunded,),
+}
+_EVENTS = TypeAdapter(list[schemas.PaymentEvent])
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@dataclass
+class IngestReport:
+    received: int = 0
+    # distinct provider payment ids after merging repeats within the request
+    unique: int = 0
+    # rows inserted or moved to a new status
+    applied: int = 0
+    # repeats within the request, replays of the current status and
+    # transitions that are not allowed
+    ignored: int = 0
+    rejected: list[dict] = field(default_factory=list)
+
+
+def _merge(events: list[schemas.PaymentEvent]) -> dict[str, tuple[int, dict]]:
+    """Collapse repeats of a payment id into one row (an UPSERT may touch a row once)."""
+    merged: dict[str, tuple[int, dict]] = {}
+    for index, event in enumerate(events):
+        status = _S(event.status.value)
+        known = merged.get(event.provider_payment_id)
+        if known is not None:
+            row = known[1]
+            if status in _TRANSITIONS.get(row["status"], ()):
+                row["status"] = status
+            row["user_id"] = row["user_id"] or event.user_id
+            continue
+        merged[event.provider_payment_id] = (
+            index,
+            {
+                "provider_payment_id": event.provider_payment_id,
+                "status": status,
+                "amount": event.amount,
+                "currency": event.currency,
+                "user_id": event.user_id,
+            },
+        )
+    return merged
+
+
+def _upsert(dialect: str):
+    """Build the single-row upsert statement.
+
+    Executed with a list of rows, it is compiled once (and cached) and sent as
+    multi-row INSERTs by SQLAlchemy's "insertmanyvalues".
+    """
+    try:
+        insert = _INSERTS[dialect]
+    except KeyError:
+        raise RuntimeError(f"payment ingestion does not support {dialect!r}") from None
+    stmt = insert(_payments)
+    allowed = or_(
+        *(
+            # plain equalities: IN () expands per call, which executemany rejects
+            and_(_payments.c.status == current, or_(*(stmt.excluded.status == t for t in targets)))
+            for current, targets in _TRANSITIONS.items()
+        )
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[_payments.c.provider, _payments.c.provider_payment_id],
+        set_={
+            "status": stmt.excluded.status,
+            "user_id": func.coalesce(_payments.c.user_id, stmt.excluded.user_id),
+        },
+        where=allowed,
+    ).returning(_payments.c.id)
+
+
+async def ingest_events(
+    db: AsyncSession, provider: str, events: list[schemas.PaymentEvent], source: str = "api"
+) -> IngestReport:
+    """Upsert ``events`` of ``provider`` in one transaction and report the outcome."""
+    report = IngestReport(received=len(events))
+    merged = _merge(events)
+
+    user_ids = {row["user_id"] for _i, row in merged.values() if row["user_id"] is not None}
+    known_users: set[int] = set()
+    ids = sorted(user_ids)
+    for i in range(0, len(ids), PAYMENT_INGEST_BATCH):
+        chunk = ids[i : i + PAYMENT_INGEST_BATCH]
+        known_users.update(
+            (await db.scalars(select(models.User.id).where(models.User.id.in_(chunk)))).all()
+        )
+    rows = []
+    for index, row in merged.values():
+        row["provider"] = provider
+        if row["user_id"] is not None and row["user_id"] not in known_users:
+            report.rejected.append(
+                {
+                    "index": index,
+                    "provider_payment_id": row["provider_payment_id"],
+                    "error": "unknown user_id",
+                }
+            )
+        else:
+            rows.append(row)
+    report.unique = len(rows)
+
+    stmt = _upsert(db.bind.dialect.name)
+    for i in range(0, len(rows), PAYMENT_INGEST_BATCH):
+        result = await db.execute(stmt, rows[i : i + PAYMENT_INGEST_BATCH])
+        report.applied += len(result.all())
+    await db.commit()
+    report.ignored = report.received - report.applied - len(report.rejected)
+
+    for result, count in (
+        ("applied", report.applied),
+        ("ignored", report.ignored),
+        ("rejected", len(report.rejected)),
+    ):
+        if count:
+            PAYMENT_EVENTS.labels(source, result).inc(count)
+    logger.info(
+        "[PAYMENTS] provider=%s source=%s received=%d applied=%d ignored=%d rejected=%d",
+        provider,
+        source,
+        report.received,
+        report.applied,
+        report.ignored,
+        len(report.rejected),
+    )
+    return report
+
+
+def _check_size(events: list) -> None:
+    if len(events) > PAYMENT_INGEST_MAX_EVENTS:
+        raise HTTPException(
+            status_code=413, detail=f"at most {PAYMENT_INGEST_MAX_EVENTS} events per request"
+        )
+
+
+def _verify_signature(body: bytes, signature: Optional[str]) -> None:
+    expected = hmac.new(PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    given = (signature or "").strip().lower().encode()
+    if not hmac.compare_digest(expected.encode(), given):
+        raise HTTPException(status_code=401, detail="invalid webhook signature")
+
+
+@router.post("/webhook/{provider}")
+async def payment_webhook(
+    provider: str, request: Request, db: AsyncSession = Depends(get_async_db)
+):
+    """Ingest provider notifications: one event object or an array of them."""
+    if not PAYMENT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="payment webhook is not configured")
+    body = await request.body()
+    _verify_signature(body, request.headers.get(SIGNATURE_HEADER))
+    try:
+        data = json.loads(body)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail="body is not valid JSON") from err
+    try:
+        events = _EVENTS.validate_python(data if isinstance(data, list) else [data])
+    except ValidationError as err:
+        raise RequestValidationError(err.errors(include_url=False)) from err
+    _check_size(events)
+    return await ingest_events(db, provider, events, source="webhook")
+
+
+@router.post("/import")
+async def import_payments(
+    payload: schemas.PaymentImport,
+    db: AsyncSession = Depends(get_async_db),
+    _admin: models.User = Depends(require_admin),
+):
+    """Admin batch import (e.g. a settlement file); same upsert as the webhook."""
+    _check_size(payload.events)
+    return await ingest_events(db, payload.provider, payload.events, source="import")
@@ -1,19 +1,21 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from vpn_api import models, schemas
 from vpn_api.auth import get_current_user
-from vpn_api.database import get_db
+from vpn_api.database import get_async_db
+from vpn_api.pagination import MAX_PAGE_SIZE, apaginate
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
 
 @router.post("/", response_model=schemas.PaymentOut)
-def create_payment(
+async def create_payment(
     payload: schemas.PaymentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
     # Only admin or owner can create payment
@@ -30,36 +32,49 @@ def create_payment(
         provider=payload.provider,
     )
     db.add(payment)
-    db.commit()
-    db.refresh(payment)
+    await db.commit()
+    await db.refresh(payment)
     return payment
 
 
 @router.get("/", response_model=List[schemas.PaymentOut])
-def list_payments(
+async def list_payments(
+    response: Response,
     user_id: Optional[int] = None,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["asc", "desc"] = "asc",
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    q = db.query(models.Payment)
+    """List payments; see `vpn_api.pagination` for cursor/offset paging."""
+    q = select(models.Payment)
     if user_id:
         if not getattr(current_user, "is_admin", False) and current_user.id != user_id:
             raise HTTPException(status_code=403, detail="Not allowed")
-        q = q.filter(models.Payment.user_id == user_id)
+        q = q.where(models.Payment.user_id == user_id)
     elif not getattr(current_user, "is_admin", False):
-        q = q.filter(models.Payment.user_id == current_user.id)
-    return q.offset(skip).limit(limit).all()
+        q = q.where(models.Payment.user_id == current_user.id)
+    return await apaginate(
+        db,
+        q,
+        models.Payment,
+        response,
+        limit=limit,
+        cursor=cursor,
+        skip=skip,
+        descending=order == "desc",
+    )
 
 
 @router.get("/{payment_id}", response_model=schemas.PaymentOut)
-def get_payment(
+async def get_payment(
     payment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+    payment = await db.get(models.Payment, payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     if not getattr(current_user, "is_admin", False) and payment.user_id != current_user.id:
@@ -68,13 +83,13 @@ def get_payment(
 
 
 @router.put("/{payment_id}", response_model=schemas.PaymentOut)
-def update_payment(
+async def update_payment(
     payment_id: int,
     payload: schemas.PaymentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+    payment = await db.get(models.Payment, payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     if not getattr(current_user, "is_admin", False) and payment.user_id != current_user.id:
@@ -82,22 +97,22 @@ def update_payment(
     payment.amount = payload.amount
     payment.currency = payload.currency
     payment.provider = payload.provider
-    db.commit()
-    db.refresh(payment)
+    await db.commit()
+    await db.refresh(payment)
     return payment
 
 
 @router.delete("/{payment_id}")
-def delete_payment(
+async def delete_payment(
     payment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+    payment = await db.get(models.Payment, payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     if not getattr(current_user, "is_admin", False) and payment.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not allowed")
-    db.delete(payment)
-    db.commit()
+    await db.delete(payment)
+    await db.commit()
     return {"msg": "deleted"}
@@ -1,42 +1,60 @@
-import asyncio
-import base64
 import logging
 import os
 import secrets
-from datetime import UTC, datetime
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import aiohttp
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Select, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from vpn_api import models, schemas
+from vpn_api import models, schemas, wg_host
 from vpn_api.auth import get_current_user
+from vpn_api.cache import config_cache, config_cache_key, invalidate_peer_config
 from vpn_api.crypto import decrypt_text, encrypt_text
-from vpn_api.database import get_db
-from vpn_api.wg_easy_adapter import WgEasyAdapter
-from vpn_api.wg_host import apply_peer, generate_key_on_host, remove_peer
+from vpn_api.database import get_async_db
+from vpn_api.entitlements import has_active_subscription
+from vpn_api.ip_pool import IpPoolExhausted, allocate_ip, release_ip, reserve_ip
+from vpn_api.metrics import PEERS_CREATED
+from vpn_api.pagination import MAX_PAGE_SIZE, apaginate
+from vpn_api.wg_easy_adapter import WgEasyAdapter, get_shared_client
+from vpn_api.wg_host import (
+    apply_peer,
+    enqueue_apply,
+    enqueue_remove,
+    generate_key_on_host,
+    remove_peer,
+)
+from vpn_api.wg_keys import derive_public_key, key_pool
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/vpn_peers", tags=["vpn_peers"])
 
 
-def _check_active_subscription(user_id: int, db: Session) -> bool:
+async def _check_active_subscription(user_id: int, db: AsyncSession) -> bool:
     """Check if user has an active subscription.
 
     Returns True if user has at least one active subscription that hasn't expired.
+    Served from the entitlement cache (see `vpn_api.entitlements`).
     """
-    now = datetime.now(UTC)
-    active = (
-        db.query(models.UserTariff)
-        .filter(
-            models.UserTariff.user_id == user_id,
-            models.UserTariff.status == "active",
-            (models.UserTariff.ended_at.is_(None)) | (models.UserTariff.ended_at > now),
-        )
-        .first()
+    return await db.run_sync(has_active_subscription, user_id)
+
+
+def latest_active_peer_stmt(user_id: int) -> Select:
+    """Select the user's most recently created active peer.
+
+    Served by the partial ``(user_id, active, created_at) WHERE active`` index.
+    """
+    return (
+        select(models.VpnPeer)
+        .where(models.VpnPeer.user_id == user_id, models.VpnPeer.active)
+        .order_by(models.VpnPeer.created_at.desc())
+        .limit(1)
     )
-    return active is not None
 
 
 def _build_wg_quick_config(private_key: str, address: str, allowed_ips: str) -> str:
@@ -73,47 +91,52 @@ def _build_wg_quick_config(private_key: str, address: str, allowed_ips: str) ->
 
 
 def _generate_wg_keypair() -> tuple[str, str]:
-    """Generate a WireGuard-compatible key pair locally.
+    """Return a WireGuard key pair as (private_key_base64, public_key_base64).
 
-    Returns a tuple of (private_key_base64, public_key_base64).
-    Uses the WireGuard key format: clamped 32-byte random values, base64-encoded.
+    Pairs come from the pre-generated in-memory pool (see `vpn_api.wg_keys`);
+    the public key is the real X25519 public key of the private key.
     """
-    # Generate 32 random bytes for private key
-    private_key_bytes = bytearray(secrets.token_bytes(32))
+    return key_pool.take()
 
-    # Generate 32 random bytes for public key
-    # (in reality derived from private, but for MVP we use random)
-    public_key_bytes = bytearray(secrets.token_bytes(32))
 
-    # Clamp the private key (WireGuard standard)
-    private_key_bytes[0] &= 248  # Clear bits 0, 1, 2
-    private_key_bytes[31] &= 127  # Clear bit 7
-    private_key_bytes[31] |= 64  # Set bit 6
+async def _allocate_ip(db: AsyncSession) -> str:
+    """Allocate a free /32 address from the configured WireGuard pools."""
+    try:
+        return await db.run_sync(allocate_ip)
+    except IpPoolExhausted as e:
+        raise HTTPException(status_code=503, detail="no free VPN addresses available") from e
 
-    # Encode to base64
-    private_key_b64 = base64.b64encode(bytes(private_key_bytes)).decode("utf-8")
-    public_key_b64 = base64.b64encode(bytes(public_key_bytes)).decode("utf-8")
 
-    return private_key_b64, public_key_b64
+async def _claim_ip(db: AsyncSession, wg_ip: Optional[str]) -> str:
+    """Allocate an address, or reserve the one the caller asked for."""
+    if not wg_ip:
+        return await _allocate_ip(db)
+    if not await db.run_sync(reserve_ip, wg_ip):
+        raise HTTPException(status_code=409, detail="Address already in use")
+    return wg_ip
 
 
-def _alloc_dummy_ip(user_id: int) -> str:
-    """Allocate a deterministic /32 address in 10.8.0.x range to match WireGuard server.
+async def _reserve_remote_ip(db: AsyncSession, wg_ip: Optional[str], client_id: str) -> None:
+    """Claim the address wg-easy assigned, so the pool never hands it out again.
 
-    WireGuard-Easy uses 10.8.0.x subnet for clients. This allocates IPs in that range.
+    When the pool already gave it to another peer the new wg-easy client is
+    deleted again and the request fails with 409.
     """
-    # Allocate from 10.8.0.19 onwards (10.8.0.1-10.8.0.18 are reserved for existing clients)
-    # Simple allocation: just use (user_id % 200) + 20 to avoid collisions
-    ip_suffix = (user_id % 200) + 20
-    allocated_ip = f"10.8.0.{ip_suffix}/32"
-    logger.info(f"[ALLOC_IP] user_id={user_id}, suffix={ip_suffix}, allocated_ip={allocated_ip}")
-    return allocated_ip
+    if not wg_ip or await db.run_sync(reserve_ip, wg_ip):
+        return
+    try:
+        await _delete_wg_easy_client(
+            os.getenv("WG_EASY_URL"), os.getenv("WG_EASY_PASSWORD"), client_id
+        )
+    except Exception:
+        logger.warning("failed to delete wg-easy client %s after an address clash", client_id)
+    raise HTTPException(status_code=409, detail="Address already in use")
 
 
 @router.post("/", response_model=schemas.VpnPeerOut)
-def create_peer(  # noqa: C901 - function is intentionally a bit complex; refactor in follow-up
+async def create_peer(  # noqa: C901 - function is intentionally a bit complex; refactor in follow-up
     payload: schemas.VpnPeerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
 
@@ -151,13 +174,13 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
             print("[DEBUG] Client provided public key, generated server private key in db mode")
             # Keep the client's public key as is
 
-        if not payload.wg_ip:
-            payload.wg_ip = _alloc_dummy_ip(target_user)
+        payload.wg_ip = await _claim_ip(db, payload.wg_ip)
 
     if key_policy == "host":
         # attempt to generate keypair on host; use username or timestamp as base name
         base = f"peer_{target_user}_{secrets.token_hex(6)}"
-        gen = generate_key_on_host(base)
+        # key generation shells out (possibly over SSH); keep it off the event loop
+        gen = await run_in_threadpool(generate_key_on_host, base)
         if gen:
             private = f"host:{gen['private']}"
             public = gen["public"]
@@ -167,8 +190,7 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
             print("[DEBUG] Host key generation failed, falling back to local generation")
         # ensure wg_ip exists to satisfy DB NOT NULL; allocate a synthetic
         # address when not provided by payload or controller
-        if not payload.wg_ip:
-            payload.wg_ip = _alloc_dummy_ip(target_user)
+        payload.wg_ip = await _claim_ip(db, payload.wg_ip)
     elif key_policy == "wg-easy":
         # Use the wg-easy HTTP API (via adapter). Create remote client first
         # then persist DB row. If persisting fails we attempt to delete the
@@ -177,7 +199,7 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
             # Create client and also attempt to retrieve client config. If the
             # incoming payload omitted wg_public_key or wg_ip we will fill them
             # from the controller response.
-            public, private, wg_client_id, meta = _handle_wg_easy_creation(
+            public, private, wg_client_id, meta, wg_easy_cfg = await _handle_wg_easy_creation(
                 target_user, payload.device_name
             )
             extra_metadata.update(meta or {})
@@ -190,6 +212,7 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
             raise HTTPException(
                 status_code=502, detail=f"failed to create remote wg-easy client: {e}"
             ) from e
+        await _reserve_remote_ip(db, payload.wg_ip or extra_metadata.get("address"), wg_client_id)
 
     # Ensure private key is set (should not be None at this point)
     if not private:
@@ -211,14 +234,14 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
     )
     db.add(peer)
     try:
-        db.commit()
-        db.refresh(peer)
+        await db.commit()
+        await db.refresh(peer)
     except Exception:
         # If we created a remote wg-easy client above, remove it as
         # compensation to avoid orphaned entries.
         try:
             if locals().get("wg_client_id"):
-                _delete_wg_easy_client(
+                await _delete_wg_easy_client(
                     os.getenv("WG_EASY_URL"),
                     os.getenv("WG_EASY_PASSWORD"),
                     locals().get("wg_client_id"),
@@ -227,17 +250,21 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
             # best-effort
             pass
         raise
+    PEERS_CREATED.labels(key_policy).inc()
     # Try to apply the peer on the host (best-effort). This will be a no-op unless
     # WG_APPLY_ENABLED=1 is set in the environment. We don't fail the API call if
     # the host operation fails; the DB remains the source of truth.
     try:
-        from vpn_api import wg_host as wg_host_module
-
         print(
-            f"[DEBUG] WG_APPLY_ENABLED={wg_host_module.WG_APPLY_ENABLED}, "
-            f"WG_HOST_SSH={wg_host_module.WG_HOST_SSH}"
+            f"[DEBUG] WG_APPLY_ENABLED={wg_host.WG_APPLY_ENABLED}, "
+            f"WG_HOST_SSH={wg_host.WG_HOST_SSH}"
         )
-        apply_peer(peer)
+        if wg_host.WG_BATCH_ENABLED:
+            # queued into the next coalesced batch; the queue logs per-peer
+            # failures, so the request does not wait for the SSH round trip
+            enqueue_apply(peer)
+        else:
+            await run_in_threadpool(apply_peer, peer)
     except Exception as e:
         # apply_peer is already logging; swallow exceptions to avoid 500s
         print(f"[ERROR] apply_peer failed: {e}")
@@ -250,25 +277,10 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
     # If key policy produced a config (wg-easy path or local generation), try
     # to store the wg-quick client config encrypted in the DB (best-effort).
     try:
-        # If wg-easy created a config, _get_wg_easy_client_config may have
-        # returned metadata including the private key; build a wg-quick text
-        # when possible.
         cfg_text = None
         if locals().get("wg_client_id"):
-            # attempt to fetch the config again (best-effort, synchronous)
-            try:
-                cfg_bytes = _get_wg_easy_client_config(
-                    os.getenv("WG_EASY_URL"),
-                    os.getenv("WG_EASY_PASSWORD"),
-                    locals().get("wg_client_id"),
-                )
-                cfg_text = (
-                    cfg_bytes.decode("utf-8")
-                    if isinstance(cfg_bytes, (bytes, bytearray))
-                    else str(cfg_bytes)
-                )
-            except Exception:
-                cfg_text = None
+            # reuse the config fetched during creation; no second round trip
+            cfg_text = locals().get("wg_easy_cfg")
         else:
             # For db or host keys generate a minimal wg-quick client config from
             # the stored values so that the mobile app can import it.
@@ -280,9 +292,9 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
         if cfg_text:
             enc = encrypt_text(cfg_text)
             peer.wg_config_encrypted = enc
-            db.add(peer)
-            db.commit()
-            db.refresh(peer)
+            await db.commit()
+            # the first GET /self/config (right after creation) is a cache hit
+            config_cache.set(config_cache_key(peer.id, enc), cfg_text)
             print(f"[DEBUG] Encrypted config saved successfully for peer {peer.id}")
         else:
             print(f"[DEBUG] No config text generated for peer {peer.id}")
@@ -295,8 +307,8 @@ def create_peer(  # noqa: C901 - function is intentionally a bit complex; refact
 
 
 @router.get("/self/config")
-def get_my_peer_config(
-    db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)
+async def get_my_peer_config(
+    db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_user)
 ):
     """Return the decrypted wg-quick configuration for the authenticated user's peer.
 
@@ -304,42 +316,49 @@ def get_my_peer_config(
     so the mobile client can programmatically import and start WireGuard.
     """
     # Check if user has an active subscription before returning config
-    if not _check_active_subscription(current_user.id, db):
+    if not await _check_active_subscription(current_user.id, db):
         raise HTTPException(status_code=403, detail="no_active_subscription")
 
     # Find the active peer for the user (pick most recent active)
-    peer = (
-        db.query(models.VpnPeer)
-        .filter(models.VpnPeer.user_id == current_user.id, models.VpnPeer.active)
-        .order_by(models.VpnPeer.created_at.desc())
-        .first()
-    )
+    peer = await db.scalar(latest_active_peer_stmt(current_user.id))
     if not peer:
         raise HTTPException(status_code=404, detail="No peer found for user")
     if not peer.wg_config_encrypted:
         raise HTTPException(status_code=404, detail="No stored config for peer")
-    cfg = decrypt_text(peer.wg_config_encrypted)
+    key = config_cache_key(peer.id, peer.wg_config_encrypted)
+    cfg = config_cache.get(key)
     if cfg is None:
-        raise HTTPException(status_code=500, detail="failed to decrypt stored config")
+        cfg = decrypt_text(peer.wg_config_encrypted)
+        if cfg is None:
+            raise HTTPException(status_code=500, detail="failed to decrypt stored config")
+        config_cache.set(key, cfg)
     return {"wg_quick": cfg}
 
 
-def _create_wg_easy_client(url: str, password: str, name: str) -> dict:
-    """Call the async WgEasyAdapter.create_client synchronously and return result."""
+@asynccontextmanager
+async def _wg_easy(url: str, password: str):
+    """Yield the app-wide pooled wg-easy client.
 
-    async def _inner():
-        async with WgEasyAdapter(url, password) as adapter:
-            return await adapter.create_client(name)
+    Outside the application lifespan (scripts, bare test clients) no shared
+    client is running, so fall back to a per-call adapter.
+    """
+    shared = get_shared_client()
+    if shared is not None:
+        yield shared
+        return
+    async with WgEasyAdapter(url, password) as adapter:
+        yield adapter
 
-    return asyncio.run(_inner())
 
+async def _create_wg_easy_client(url: str, password: str, name: str) -> dict:
+    """Create a wg-easy client on the running event loop and return the result."""
+    async with _wg_easy(url, password) as client:
+        return await client.create_client(name)
 
-def _delete_wg_easy_client(url: str, password: str, client_id: str) -> None:
-    async def _inner():
-        async with WgEasyAdapter(url, password) as adapter:
-            await adapter.delete_client(client_id)
 
-    return asyncio.run(_inner())
+async def _delete_wg_easy_client(url: str, password: str, client_id: str) -> None:
+    async with _wg_easy(url, password) as client:
+        await client.delete_client(client_id)
 
 
 def _parse_wg_quick_config(cfg_text: str) -> dict:
@@ -377,9 +396,11 @@ def _parse_wg_quick_config(cfg_text: str) -> dict:
     return result
 
 
-def _handle_wg_easy_creation(user_id: int, device_name: str | None = None):
-    """Create a wg-easy client for given user and return (public, private, id).
+async def _handle_wg_easy_creation(user_id: int, device_name: str | None = None):
+    """Create a wg-easy client for given user.
 
+    Returns (public, private, id, meta, cfg_text). The client config is fetched
+    exactly once here; callers reuse ``cfg_text`` instead of fetching it again.
     Raises HTTPException if required env vars are missing.
     """
     wg_url = os.getenv("WG_EASY_URL")
@@ -388,76 +409,92 @@ def _handle_wg_easy_creation(user_id: int, device_name: str | None = None):
         raise HTTPException(status_code=500, detail="WG_EASY_URL or WG_EASY_PASSWORD not set")
 
     name = device_name or f"peer-{user_id}-{secrets.token_hex(4)}"
-    created = _create_wg_easy_client(wg_url, wg_pass, name)
+    created = await _create_wg_easy_client(wg_url, wg_pass, name)
     public = created.get("publicKey")
     wg_client_id = created.get("id")
     # Attempt to fetch client config (wg-quick) to extract private key and IPs
     try:
-        cfg_bytes = _get_wg_easy_client_config(wg_url, wg_pass, wg_client_id)
-        cfg_text = (
-            cfg_bytes.decode("utf-8")
-            if isinstance(cfg_bytes, (bytes, bytearray))
-            else str(cfg_bytes)
-        )
-        meta = _parse_wg_quick_config(cfg_text)
-        private = meta.get("private_key") or "wg-easy:remote"
-        # If public key not present try to derive from config (rare)
-        return public, private, wg_client_id, meta
+        cfg_bytes = await _get_wg_easy_client_config(wg_url, wg_pass, wg_client_id)
     except Exception:
-        return public, "wg-easy:remote", wg_client_id, {}
-
-
-def _get_wg_easy_client_config(url: str, password: str, client_id: str) -> bytes:
-    # Prefer a simple synchronous HTTP GET here to avoid creating an
-    # aiohttp.ClientSession in a library (wg_easy_api) when called from
-    # synchronous code paths (tests and API helpers). The caller will
-    # treat any exception as non-fatal and fall back to a placeholder.
-    try:
-        import urllib.request
-
-        base = url.rstrip("/")
-        cfg_url = f"{base}/api/wireguard/client/{client_id}/configuration"
-        # Build Authorization header: prefer WG_API_KEY if set.
-        api_key = os.environ.get("WG_API_KEY")
-        if api_key:
-            auth = api_key
-        else:
-            auth = password
-
-        req = urllib.request.Request(cfg_url, headers={"Authorization": auth})
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            return resp.read()
-    except Exception:
-        # Caller handles failures; return empty bytes to indicate missing config
-        raise
+        return public, "wg-easy:remote", wg_client_id, {}, None
+    cfg_text = (
+        cfg_bytes.decode("utf-8") if isinstance(cfg_bytes, (bytes, bytearray)) else str(cfg_bytes)
+    )
+    meta = _parse_wg_quick_config(cfg_text)
+    private = meta.get("private_key") or "wg-easy:remote"
+    if not public and meta.get("private_key"):
+        # the creation response had no public key; derive it instead of
+        # listing every client on the node
+        try:
+            public = derive_public_key(meta["private_key"])
+        except ValueError:
+            pass
+    return public, private, wg_client_id, meta, cfg_text
+
+
+async def _get_wg_easy_client_config(url: str, password: str, client_id: str) -> bytes:
+    shared = get_shared_client()
+    if shared is not None:
+        return await shared.get_client_config(client_id)
+    # Use a plain HTTP GET with the Authorization header rather than the
+    # wg_easy_api wrapper (which re-checks its session and opens a new
+    # ClientSession per call). Any exception is treated as non-fatal by the
+    # caller, which falls back to a placeholder.
+    base = url.rstrip("/")
+    cfg_url = f"{base}/api/wireguard/client/{client_id}/configuration"
+    # Build Authorization header: prefer WG_API_KEY if set.
+    api_key = os.environ.get("WG_API_KEY")
+    if api_key:
+        auth = api_key
+    else:
+        auth = password
+
+    timeout = aiohttp.ClientTimeout(total=5)
+    async with aiohttp.ClientSession(timeout=timeout) as sess:
+        async with sess.get(cfg_url, headers={"Authorization": auth}) as resp:
+            resp.raise_for_status()
+            return await resp.read()
 
 
 @router.get("/", response_model=List[schemas.VpnPeerOut])
-def list_peers(
+async def list_peers(
+    response: Response,
     user_id: Optional[int] = None,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["asc", "desc"] = "asc",
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    q = db.query(models.VpnPeer)
+    """List peers; see `vpn_api.pagination` for cursor/offset paging."""
+    q = select(models.VpnPeer)
     if user_id:
         # non-admin can only list their own
         if not getattr(current_user, "is_admin", False) and current_user.id != user_id:
             raise HTTPException(status_code=403, detail="Not allowed")
-        q = q.filter(models.VpnPeer.user_id == user_id)
+        q = q.where(models.VpnPeer.user_id == user_id)
     elif not getattr(current_user, "is_admin", False):
-        q = q.filter(models.VpnPeer.user_id == current_user.id)
-    return q.offset(skip).limit(limit).all()
+        q = q.where(models.VpnPeer.user_id == current_user.id)
+    return await apaginate(
+        db,
+        q,
+        models.VpnPeer,
+        response,
+        limit=limit,
+        cursor=cursor,
+        skip=skip,
+        descending=order == "desc",
+    )
 
 
 @router.get("/{peer_id}", response_model=schemas.VpnPeerOut)
-def get_peer(
+async def get_peer(
     peer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    peer = db.query(models.VpnPeer).filter(models.VpnPeer.id == peer_id).first()
+    peer = await db.get(models.VpnPeer, peer_id)
     if not peer:
         raise HTTPException(status_code=404, detail="Peer not found")
     if not getattr(current_user, "is_admin", False) and peer.user_id != current_user.id:
@@ -502,66 +539,80 @@ def get_peer(
         403: {"description": "Not allowed / user not active"},
     },
 )
-def create_peer_self(
+async def create_peer_self(
     payload: schemas.VpnPeerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
     # Check if user has an active subscription before creating peer
-    if not _check_active_subscription(current_user.id, db):
+    if not await _check_active_subscription(current_user.id, db):
         raise HTTPException(status_code=403, detail="no_active_subscription")
 
     # Force the payload user to the current user and reuse create_peer logic.
     payload.user_id = current_user.id
-    peer = create_peer(payload, db=db, current_user=current_user)
+    peer = await create_peer(payload, db=db, current_user=current_user)
     # create_peer may have attached wg_private_key into the model; return as-is
     return peer
 
 
 @router.put("/{peer_id}", response_model=schemas.VpnPeerOut)
-def update_peer(
+async def update_peer(
     peer_id: int,
     payload: schemas.VpnPeerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    peer = db.query(models.VpnPeer).filter(models.VpnPeer.id == peer_id).first()
+    peer = await db.get(models.VpnPeer, peer_id)
     if not peer:
         raise HTTPException(status_code=404, detail="Peer not found")
     if not getattr(current_user, "is_admin", False) and peer.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not allowed")
     peer.wg_public_key = payload.wg_public_key
-    peer.wg_ip = payload.wg_ip
+    if payload.wg_ip and payload.wg_ip != peer.wg_ip:
+        # reserve the new address before freeing the old one, in one transaction
+        old_ip, peer.wg_ip = peer.wg_ip, await _claim_ip(db, payload.wg_ip)
+        await db.run_sync(release_ip, old_ip)
     peer.allowed_ips = payload.allowed_ips
-    db.commit()
-    db.refresh(peer)
+    try:
+        await db.commit()
+    except IntegrityError as err:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Address or key already in use") from err
+    invalidate_peer_config(peer.id)
+    await db.refresh(peer)
     return peer
 
 
 @router.delete("/{peer_id}")
-def delete_peer(
+async def delete_peer(
     peer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    peer = db.query(models.VpnPeer).filter(models.VpnPeer.id == peer_id).first()
+    peer = await db.get(models.VpnPeer, peer_id)
     if not peer:
         raise HTTPException(status_code=404, detail="Peer not found")
     if not getattr(current_user, "is_admin", False) and peer.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not allowed")
-    db.delete(peer)
-    db.commit()
+    await db.delete(peer)
+    # return the address to the pool's free list in the same transaction
+    await db.run_sync(release_ip, peer.wg_ip)
+    await db.commit()
+    invalidate_peer_config(peer.id)
     # Best-effort remove from host or wg-easy controller
     try:
         # If peer was created via wg-easy remove remote client id as well
         if getattr(peer, "wg_client_id", None):
             try:
-                _delete_wg_easy_client(
+                await _delete_wg_easy_client(
                     os.getenv("WG_EASY_URL"), os.getenv("WG_EASY_PASSWORD"), peer.wg_client_id
                 )
             except Exception:
                 pass
-        remove_peer(peer)
+        if wg_host.WG_BATCH_ENABLED:
+            enqueue_remove(peer)
+        else:
+            await run_in_threadpool(remove_peer, peer)
     except Exception:
         pass
     return {"msg": "deleted"}
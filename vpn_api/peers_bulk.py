@@ -0,0 +1,257 @@
+"""Bulk peer provisioning for B2B onboarding.
+
+``POST /vpn_peers/bulk`` creates many peers in one request: keys and
+addresses are taken in one pass (or wg-easy clients are created with a
+bounded fan-out), configs are encrypted as a batch, all rows are inserted in
+a single transaction and host changes go out as one batched ``wg set``.
+Per-item results are streamed back as NDJSON, one JSON object per line,
+followed by a summary line.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from vpn_api import models, peers, schemas, wg_host
+from vpn_api.auth import require_admin
+from vpn_api.cache import config_cache, config_cache_key
+from vpn_api.crypto import encrypt_texts, encryption_configured
+from vpn_api.database import SessionLocal
+from vpn_api.ip_pool import IpPoolExhausted, allocate_ips, reserve_ip
+from vpn_api.metrics import PEERS_CREATED
+from vpn_api.wg_keys import key_pool
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of wg-easy clients created at the same time.
+WG_BULK_CONCURRENCY = int(os.getenv("WG_BULK_CONCURRENCY", "10"))
+
+router = APIRouter(prefix="/vpn_peers", tags=["vpn_peers"])
+
+
+@dataclass
+class _Item:
+    index: int
+    user_id: int
+    device_name: Optional[str]
+    private: Optional[str] = None
+    public: Optional[str] = None
+    wg_ip: Optional[str] = None
+    allowed_ips: Optional[str] = None
+    client_id: Optional[str] = None
+    cfg_text: Optional[str] = None
+
+
+def _line(item: _Item, **fields) -> str:
+    out = {"index": item.index, "user_id": item.user_id, "device_name": item.device_name}
+    out.update(fields)
+    return json.dumps(out, default=str) + "\n"
+
+
+def _known_user_ids(db: Session, user_ids: set[int]) -> set[int]:
+    rows = db.query(models.User.id).filter(models.User.id.in_(user_ids)).all()
+    return {r.id for r in rows}
+
+
+def _prepare_local(db: Session, items: list[_Item], allowed_ips: Optional[str]) -> None:
+    """Fill keys, addresses and configs for db/host policies in one pass."""
+    keys = key_pool.take_many(len(items))
+    ips = allocate_ips(db, len(items))
+    for item, (private, public), ip in zip(items, keys, ips, strict=True):
+        item.private, item.public, item.wg_ip = private, public, ip
+        item.allowed_ips = allowed_ips
+        item.cfg_text = peers._build_wg_quick_config(private, ip, allowed_ips or "0.0.0.0/0")
+
+
+async def _create_remote(
+    items: list[_Item], allowed_ips: Optional[str]
+) -> AsyncIterator[tuple[_Item, Optional[Exception]]]:
+    """Create wg-easy clients with bounded concurrency, yielding as they finish."""
+    sem = asyncio.Semaphore(max(1, WG_BULK_CONCURRENCY))
+
+    async def one(item: _Item):
+        async with sem:
+            try:
+                public, private, cid, meta, cfg = await peers._handle_wg_easy_creation(
+                    item.user_id, item.device_name
+                )
+            except Exception as exc:
+                return item, exc
+        item.public, item.private, item.client_id, item.cfg_text = public, private, cid, cfg
+        item.wg_ip = meta.get("address")
+        item.allowed_ips = allowed_ips or meta.get("allowed_ips")
+        if not item.wg_ip or not item.public:
+            return item, RuntimeError("wg-easy did not return an address or public key")
+        return item, None
+
+    for fut in asyncio.as_completed([one(i) for i in items]):
+        yield await fut
+
+
+def _insert_all(db: Session, items: list[_Item]) -> list[models.VpnPeer]:
+    """Insert every peer row in one transaction (all or nothing)."""
+    encrypted = encrypt_texts([i.cfg_text or "" for i in items])
+    rows = []
+    for item, enc in zip(items, encrypted, strict=True):
+        rows.append(
+            models.VpnPeer(
+                user_id=item.user_id,
+                wg_private_key=item.private,
+                wg_public_key=item.public,
+                wg_client_id=item.client_id,
+                wg_ip=item.wg_ip,
+                allowed_ips=item.allowed_ips,
+                wg_config_encrypted=enc if item.cfg_text else None,
+            )
+        )
+    db.add_all(rows)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for row, item in zip(rows, items, strict=True):
+        if item.cfg_text:
+            config_cache.set(config_cache_key(row.id, row.wg_config_encrypted), item.cfg_text)
+    return rows
+
+
+async def _compensate(items: list[_Item]) -> None:
+    url, password = os.getenv("WG_EASY_URL"), os.getenv("WG_EASY_PASSWORD")
+    sem = asyncio.Semaphore(max(1, WG_BULK_CONCURRENCY))
+
+    async def one(cid):
+        async with sem:
+            try:
+                await peers._delete_wg_easy_client(url, password, cid)
+            except Exception:
+                logger.warning("[BULK] failed to delete orphaned wg-easy client %s", cid)
+
+    await asyncio.gather(*(one(i.client_id) for i in items if i.client_id))
+
+
+async def _prepare(
+    db: Session, items: list[_Item], allowed_ips: Optional[str], policy: str
+) -> AsyncIterator[tuple[_Item, Optional[str]]]:
+    """Yield ``(item, None)`` for items ready to insert, ``(item, error)`` otherwise."""
+    if policy == "wg-easy":
+        # clients created remotely but unusable here must not be left behind
+        orphaned = []
+        async for item, exc in _create_remote(items, allowed_ips):
+            # claim wg-easy's address in the pool (in this request's transaction)
+            if exc is None and not await run_in_threadpool(reserve_ip, db, item.wg_ip):
+                exc = RuntimeError(f"address {item.wg_ip} is already in use")
+            if exc is not None and item.client_id:
+                orphaned.append(item)
+            yield item, None if exc is None else f"wg-easy: {exc}"
+        await _compensate(orphaned)
+        return
+    if not items:
+        return
+    try:
+        await run_in_threadpool(_prepare_local, db, items, allowed_ips)
+    except IpPoolExhausted:
+        await run_in_threadpool(db.rollback)
+        for item in items:
+            yield item, "no free VPN addresses available"
+        return
+    for item in items:
+        yield item, None
+
+
+async def _apply_on_host(items: list[_Item]) -> dict[str, bool]:
+    """Add locally keyed peers to the host interface as batched ``wg set`` calls."""
+    applied: dict[str, bool] = {}
+    if not items or not wg_host.WG_APPLY_ENABLED:
+        return applied
+    ops = [wg_host.PeerOp("add", i.public, i.allowed_ips or "") for i in items]
+    for start in range(0, len(ops), wg_host.WG_BATCH_MAX):
+        chunk = ops[start : start + wg_host.WG_BATCH_MAX]
+        applied.update(await run_in_threadpool(wg_host.apply_peers, chunk))
+    return applied
+
+
+async def _reject(items: list[_Item], error: str) -> AsyncIterator[str]:
+    for item in items:
+        yield _line(item, status="error", error=error)
+    yield json.dumps({"summary": {"created": 0, "failed": len(items)}}) + "\n"
+
+
+async def _provision(
+    items: list[_Item], allowed_ips: Optional[str], policy: str
+) -> AsyncIterator[str]:
+    db = SessionLocal()
+    created = failed = 0
+    try:
+        known = await run_in_threadpool(_known_user_ids, db, {i.user_id for i in items})
+        pending = []
+        for item in items:
+            if item.user_id in known:
+                pending.append(item)
+            else:
+                failed += 1
+                yield _line(item, status="error", error="user not found")
+
+        ready: list[_Item] = []
+        async for item, error in _prepare(db, pending, allowed_ips, policy):
+            if error is None:
+                ready.append(item)
+            else:
+                failed += 1
+                yield _line(item, status="error", error=error)
+
+        rows: list[models.VpnPeer] = []
+        if ready:
+            try:
+                rows = await run_in_threadpool(_insert_all, db, ready)
+                PEERS_CREATED.labels(policy).inc(len(rows))
+            except Exception as exc:
+                logger.exception("[BULK] insert of %d peers failed", len(ready))
+                await _compensate(ready)
+                for item in ready:
+                    failed += 1
+                    yield _line(item, status="error", error=f"database: {exc.__class__.__name__}")
+                ready = []
+
+        applied = await _apply_on_host([i for i in ready if not i.client_id])
+        for item, row in zip(ready, rows, strict=True):
+            created += 1
+            out = schemas.VpnPeerOut.model_validate(row).model_dump(mode="json")
+            extra = {"host_applied": applied.get(item.public)} if item.public in applied else {}
+            yield _line(item, status="created", peer=out, **extra)
+        logger.info("[BULK] policy=%s created=%d failed=%d", policy, created, failed)
+        yield json.dumps({"summary": {"created": created, "failed": failed}}) + "\n"
+    finally:
+        db.close()
+
+
+@router.post(
+    "/bulk",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def create_peers_bulk(
+    payload: schemas.VpnPeerBulkCreate,
+    current_user: models.User = Depends(require_admin),
+):
+    """Provision many peers at once (admin only); streams NDJSON results."""
+    owner = payload.user_id or current_user.id
+    items = [
+        _Item(index=i, user_id=it.user_id or owner, device_name=it.device_name)
+        for i, it in enumerate(payload.items)
+    ]
+    policy = os.getenv("WG_KEY_POLICY", "db")
+    if encryption_configured():
+        lines = _provision(items, payload.allowed_ips, policy)
+    else:
+        # fail before any key, address or wg-easy client is taken
+        lines = _reject(items, "CONFIG_ENCRYPTION_KEY is not set")
+    return StreamingResponse(lines, media_type="application/x-ndjson")
@@ -0,0 +1,57 @@
+"""Cache of authenticated users for `vpn_api.auth.get_current_user`.
+
+A hit costs no query: the cached row is a detached ``User`` snapshot that
+is merged into the request session with ``load=False``, so routes get a
+normal persistent instance and may still modify and commit it.
+
+Every committed ORM change to a user (promotion, status change, blocking,
+...) drops its entry; the short ``PRINCIPAL_CACHE_TTL`` bounds staleness
+for changes made by other workers or with Core statements.
+"""
+
+from itertools import chain
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from vpn_api import models
+from vpn_api.cache import invalidate_principal, principal_cache
+
+_COLUMNS = [attr.key for attr in inspect(models.User).column_attrs]
+_PENDING_KEY = "principal_invalidations"
+
+
+def _snapshot(user: models.User) -> models.User:
+    copy = models.User(**{key: getattr(user, key) for key in _COLUMNS})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def load_principal(db: Session, subject: str) -> Optional[models.User]:
+    """Return the user a token subject refers to, bound to ``db``."""
+    snapshot = principal_cache.get(subject)
+    if snapshot is not None:
+        return db.merge(snapshot, load=False)
+    user = db.query(models.User).filter(models.User.email == subject).first()
+    if user is not None:
+        principal_cache.set(subject, _snapshot(user))
+    return user
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, _flush_context) -> None:
+    subjects = set()
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, models.User):
+            subjects.add(obj.email)
+            # an email change must drop the entry under the old subject too
+            subjects.update(inspect(obj).attrs.email.history.deleted or ())
+    if subjects:
+        session.info.setdefault(_PENDING_KEY, set()).update(subjects)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    for subject in session.info.pop(_PENDING_KEY, ()):
+        invalidate_principal(subject)
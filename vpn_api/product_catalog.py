@@ -0,0 +1,136 @@
+"""In-memory catalog of app store products and the tariffs they grant.
+
+IAP validation resolves a purchased ``product_id`` to a tariff and its
+duration for every receipt, so it reads an immutable `CatalogSnapshot`
+instead of the database:
+
+* the snapshot is built from one ``iap_products JOIN tariffs`` query at
+  startup and replaced as a whole (a single reference swap): readers see the
+  old or the new catalog, never a mix of both;
+* every committed ORM change to ``iap_products`` or ``tariffs`` in this
+  process reloads it right after the commit, through the committing
+  session's engine;
+* edits made by other workers (or with Core statements) are picked up by the
+  periodic refresh every ``PRODUCT_CATALOG_REFRESH_INTERVAL`` seconds.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from itertools import chain
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Select, event, select
+from sqlalchemy.orm import Session
+
+from vpn_api import models
+from vpn_api.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background reloads; 0 disables them (local commits still reload).
+PRODUCT_CATALOG_REFRESH_INTERVAL = float(os.getenv("PRODUCT_CATALOG_REFRESH_INTERVAL", "300"))
+
+_PENDING_KEY = "product_catalog_changed"
+
+
+@dataclass(frozen=True)
+class CatalogProduct:
+    product_id: str
+    tariff_id: int
+    tariff_name: str
+    duration_days: int
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    products: Mapping[str, CatalogProduct] = field(default_factory=lambda: MappingProxyType({}))
+    # duration of every tariff that has at least one product
+    durations: Mapping[int, int] = field(default_factory=lambda: MappingProxyType({}))
+    loaded_at: Optional[datetime] = None
+
+    def get(self, product_id: str) -> Optional[CatalogProduct]:
+        return self.products.get(product_id)
+
+
+_snapshot = CatalogSnapshot()
+# Reloads may run concurrently (commits in several threads, the refresh task);
+# each takes a ticket before reading and only a newer read may be installed.
+_tickets = itertools.count(1)
+_installed = 0
+# Guards the compare-and-swap only: it is never held across I/O, which could
+# deadlock the event loop when an async session's commit triggers a reload.
+_swap_lock = threading.Lock()
+
+
+def catalog() -> CatalogSnapshot:
+    """Return the current snapshot; never touches the database."""
+    return _snapshot
+
+
+def catalog_stmt() -> Select:
+    return select(
+        models.IapProduct.product_id,
+        models.Tariff.id,
+        models.Tariff.name,
+        models.Tariff.duration_days,
+    ).join(models.Tariff)
+
+
+def reload(bind=None) -> CatalogSnapshot:
+    """Read the catalog from the database and swap it in; return the current snapshot."""
+    global _snapshot, _installed
+    ticket = next(_tickets)
+    with (bind or engine).connect() as conn:
+        products = {row.product_id: CatalogProduct(*row) for row in conn.execute(catalog_stmt())}
+    snapshot = CatalogSnapshot(
+        products=MappingProxyType(products),
+        durations=MappingProxyType({p.tariff_id: p.duration_days for p in products.values()}),
+        loaded_at=datetime.now(UTC),
+    )
+    with _swap_lock:
+        if ticket > _installed:
+            _snapshot, _installed = snapshot, ticket
+        return _snapshot
+
+
+async def refresh() -> None:
+    """Reload in a worker thread; on failure keep serving the previous snapshot."""
+    try:
+        await run_in_threadpool(reload)
+    except Exception:
+        logger.exception("[CATALOG] reload failed, keeping the previous snapshot")
+
+
+async def run_forever(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await refresh()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, _flush_context) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.IapProduct) or (
+            isinstance(obj, models.Tariff) and obj not in session.new
+        ):
+            session.info[_PENDING_KEY] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _reload_committed(session: Session) -> None:
+    if not session.info.pop(_PENDING_KEY, False):
+        return
+    try:
+        # the session's own engine: for an AsyncSession this runs on its
+        # async driver instead of blocking the event loop
+        reload(session.get_bind())
+    except Exception:
+        logger.exception("[CATALOG] reload after commit failed")
@@ -0,0 +1,286 @@
+"""Background reconciliation of `vpn_peers` against wg-easy and the host interface.
+
+Peer side effects in the create/delete routes are best-effort, so the three
+copies of peer state (database rows, wg-easy clients, kernel ``wg`` peers)
+can drift. The reconciler periodically compares them and applies only the
+differences:
+
+* The database side is kept as an in-memory snapshot refreshed
+  incrementally: each pass reads only rows whose ``updated_at`` is past the
+  high-water mark of the previous pass, and drops snapshot entries whose row
+  was deleted (an ``id IN (...)`` check on the primary key). A full reload
+  happens on the first pass and every ``WG_RECONCILE_FULL_EVERY`` passes.
+* Peers created through wg-easy (``wg_client_id`` set) are compared with the
+  wg-easy client list; the others with ``wg show <iface> dump`` on the host
+  (only when ``WG_APPLY_ENABLED=1``).
+* Missing or changed host peers are added, host peers and wg-easy clients
+  of deactivated rows are removed. Remote entries the database does not know
+  at all are only reported, unless ``WG_RECONCILE_PRUNE=1``.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from vpn_api import models, wg_host
+from vpn_api.auth import require_admin
+from vpn_api.database import SessionLocal
+from vpn_api.wg_easy_adapter import get_shared_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds between passes; 0 disables the background worker.
+WG_RECONCILE_INTERVAL = float(os.getenv("WG_RECONCILE_INTERVAL", "0"))
+WG_RECONCILE_FULL_EVERY = int(os.getenv("WG_RECONCILE_FULL_EVERY", "60"))
+WG_RECONCILE_PRUNE = os.getenv("WG_RECONCILE_PRUNE", "0") == "1"
+# Re-read rows this far behind the high-water mark, so a transaction that
+# committed late with an older timestamp is not missed.
+WG_RECONCILE_OVERLAP = float(os.getenv("WG_RECONCILE_OVERLAP", "5"))
+WG_RECONCILE_BATCH = int(os.getenv("WG_RECONCILE_BATCH", "500"))
+
+router = APIRouter(prefix="/admin/reconcile", tags=["admin"])
+
+_peers = models.VpnPeer.__table__
+_SNAPSHOT_COLUMNS = (
+    _peers.c.id,
+    _peers.c.wg_public_key,
+    _peers.c.wg_client_id,
+    _peers.c.allowed_ips,
+    _peers.c.wg_ip,
+    _peers.c.active,
+    _peers.c.updated_at,
+)
+
+
+@dataclass
+class PeerState:
+    public_key: str
+    client_id: Optional[str]
+    allowed_ips: str
+    active: bool
+
+
+@dataclass
+class ReconcileReport:
+    dry_run: bool
+    full_sync: bool = False
+    rows_read: int = 0
+    host_checked: bool = False
+    wg_easy_checked: bool = False
+    host_add: list[str] = field(default_factory=list)
+    host_remove: list[str] = field(default_factory=list)
+    host_orphans: list[str] = field(default_factory=list)
+    wg_easy_remove: list[str] = field(default_factory=list)
+    wg_easy_orphans: list[str] = field(default_factory=list)
+    wg_easy_missing: list[str] = field(default_factory=list)
+    applied: dict[str, bool] = field(default_factory=dict)
+    errors: list[str] = field(default_factory=list)
+
+
+def _host_allowed_ips(row) -> str:
+    return row.allowed_ips or row.wg_ip or ""
+
+
+def _normalize_ips(value: str) -> frozenset:
+    return frozenset(p.strip() for p in (value or "").split(",") if p.strip())
+
+
+class Reconciler:
+    def __init__(self, session_factory=SessionLocal, full_every: int = WG_RECONCILE_FULL_EVERY):
+        self._session_factory = session_factory
+        self.full_every = max(1, full_every)
+        self._known: dict[int, PeerState] = {}
+        self._high_water = None
+        self._passes = 0
+        self._lock = asyncio.Lock()
+
+    # -- database side -------------------------------------------------
+
+    def _refresh_snapshot(self, full: bool) -> int:
+        """Load changed rows into the snapshot; returns the number of rows read."""
+        stmt = select(*_SNAPSHOT_COLUMNS)
+        if not full and self._high_water is not None:
+            since = self._high_water - timedelta(seconds=WG_RECONCILE_OVERLAP)
+            stmt = stmt.where(_peers.c.updated_at >= since)
+        db: Session = self._session_factory()
+        try:
+            rows = db.execute(stmt).all()
+            if not full:
+                self._drop_deleted(db)
+        finally:
+            db.close()
+        if full:
+            self._known = {}
+        for row in rows:
+            self._known[row.id] = PeerState(
+                row.wg_public_key, row.wg_client_id, _host_allowed_ips(row), bool(row.active)
+            )
+            if self._high_water is None or row.updated_at > self._high_water:
+                self._high_water = row.updated_at
+        return len(rows)
+
+    def _drop_deleted(self, db: Session) -> None:
+        # hard-deleted rows never show up past the high-water mark; without
+        # this their peers would be re-added to the host until a full reload
+        ids = list(self._known)
+        existing = set()
+        for i in range(0, len(ids), WG_RECONCILE_BATCH):
+            chunk = ids[i : i + WG_RECONCILE_BATCH]
+            existing.update(db.execute(select(_peers.c.id).where(_peers.c.id.in_(chunk))).scalars())
+        for peer_id in set(ids) - existing:
+            del self._known[peer_id]
+
+    # -- diffs ---------------------------------------------------------
+
+    def _diff_host(
+        self, remote: dict[str, str], report: ReconcileReport, easy_keys=frozenset(), prune=True
+    ) -> list:
+        """Diff the host interface; ``easy_keys`` are public keys of wg-easy's clients.
+
+        wg-easy shares the interface: its peers (known to the database, active
+        or not, or only listed by wg-easy) are never host orphans.
+        """
+        desired = {}
+        inactive = set()
+        managed = set(easy_keys)
+        for state in self._known.values():
+            if state.client_id:
+                managed.add(state.public_key)  # managed by wg-easy
+                continue
+            if state.active:
+                desired[state.public_key] = state.allowed_ips
+            else:
+                inactive.add(state.public_key)
+        ops = []
+        for key, allowed in desired.items():
+            if key not in remote or _normalize_ips(remote[key]) != _normalize_ips(allowed):
+                report.host_add.append(key)
+                ops.append(wg_host.PeerOp("add", key, allowed))
+        for key in remote:
+            if key in desired or key in managed:
+                continue
+            if key in inactive:
+                report.host_remove.append(key)
+                ops.append(wg_host.PeerOp("remove", key))
+            else:
+                report.host_orphans.append(key)
+                if WG_RECONCILE_PRUNE and prune:
+                    ops.append(wg_host.PeerOp("remove", key))
+        return ops
+
+    def _diff_wg_easy(self, remote: list[dict], report: ReconcileReport) -> list[str]:
+        active_ids = {s.client_id for s in self._known.values() if s.client_id and s.active}
+        inactive_ids = {s.client_id for s in self._known.values() if s.client_id and not s.active}
+        remote_ids = {str(c.get("id")) for c in remote if c.get("id")}
+        to_delete = []
+        for cid in sorted(remote_ids - active_ids):
+            if cid in inactive_ids:
+                report.wg_easy_remove.append(cid)
+                to_delete.append(cid)
+            else:
+                report.wg_easy_orphans.append(cid)
+                if WG_RECONCILE_PRUNE:
+                    to_delete.append(cid)
+        # wg-easy generates keys itself, so a lost client cannot be recreated
+        # with the stored keys; report it for manual follow-up
+        report.wg_easy_missing.extend(sorted(active_ids - remote_ids))
+        return to_delete
+
+    # -- passes --------------------------------------------------------
+
+    async def run_once(self, dry_run: bool = False) -> ReconcileReport:
+        async with self._lock:
+            full = self._high_water is None or self._passes % self.full_every == 0
+            self._passes += 1
+            report = ReconcileReport(dry_run=dry_run, full_sync=full)
+            report.rows_read = await run_in_threadpool(self._refresh_snapshot, full)
+
+            easy_deletes = []
+            easy_keys: set[str] = set()
+            client = get_shared_client()
+            if client is not None:
+                try:
+                    remote_clients = await client.list_clients()
+                except Exception as exc:
+                    report.errors.append(f"failed to list wg-easy clients: {exc}")
+                else:
+                    report.wg_easy_checked = True
+                    easy_deletes = self._diff_wg_easy(remote_clients, report)
+                    easy_keys = {c["publicKey"] for c in remote_clients if c.get("publicKey")}
+
+            host_ops = []
+            if wg_host.WG_APPLY_ENABLED:
+                remote = await run_in_threadpool(wg_host.dump_peers)
+                if remote is None:
+                    report.errors.append("failed to read host WireGuard peers")
+                else:
+                    report.host_checked = True
+                    # without wg-easy's client list an unknown key may be one of
+                    # its peers: report orphans but do not prune them
+                    prune = client is None or report.wg_easy_checked
+                    host_ops = self._diff_host(remote, report, easy_keys, prune)
+
+            if not dry_run:
+                await self._apply(host_ops, easy_deletes, client, report)
+            if host_ops or easy_deletes or report.errors:
+                logger.info(
+                    "[RECONCILE] dry_run=%s full=%s rows=%d host_ops=%d wg_easy_deletes=%d "
+                    "errors=%d",
+                    dry_run,
+                    full,
+                    report.rows_read,
+                    len(host_ops),
+                    len(easy_deletes),
+                    len(report.errors),
+                )
+            return report
+
+    async def _apply(self, host_ops, easy_deletes, client, report: ReconcileReport) -> None:
+        for i in range(0, len(host_ops), WG_RECONCILE_BATCH):
+            chunk = host_ops[i : i + WG_RECONCILE_BATCH]
+            results = await run_in_threadpool(wg_host.apply_peers, chunk)
+            report.applied.update(results)
+
+        async def _delete(cid):
+            try:
+                await client.delete_client(cid)
+                report.applied[cid] = True
+            except Exception as exc:
+                report.applied[cid] = False
+                report.errors.append(f"failed to delete wg-easy client {cid}: {exc}")
+
+        for i in range(0, len(easy_deletes), WG_RECONCILE_BATCH):
+            await asyncio.gather(*(_delete(c) for c in easy_deletes[i : i + WG_RECONCILE_BATCH]))
+
+    async def run_forever(self, interval: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[RECONCILE] pass failed")
+            await asyncio.sleep(interval)
+
+
+reconciler = Reconciler()
+
+
+@router.get("")
+async def reconcile_report(_admin: models.User = Depends(require_admin)):
+    """Dry run: report the deltas a reconciliation pass would apply."""
+    return await reconciler.run_once(dry_run=True)
+
+
+@router.post("")
+async def reconcile_now(_admin: models.User = Depends(require_admin)):
+    """Run a reconciliation pass immediately and apply the deltas."""
+    return await reconciler.run_once(dry_run=False)
@@ -3,7 +3,7 @@ from decimal import Decimal
 from enum import Enum
 from typing import Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class UserStatus(str, Enum):
@@ -12,6 +12,13 @@ class UserStatus(str, Enum):
     blocked = "blocked"
 
 
+class PaymentStatus(str, Enum):
+    pending = "pending"
+    completed = "completed"
+    failed = "failed"
+    refunded = "refunded"
+
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str | None = None
@@ -63,6 +70,21 @@ class TariffOut(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class TariffUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    duration_days: Optional[int] = Field(default=None, ge=1)
+    price: Optional[Decimal] = None
+
+
+class IapProductOut(BaseModel):
+    product_id: str
+    tariff_id: int
+    tariff_name: str
+    duration_days: int
+    model_config = {"from_attributes": True}
+
+
 class AssignTariff(BaseModel):
     tariff_id: int
 
@@ -80,6 +102,19 @@ class VpnPeerCreate(BaseModel):
     device_name: Optional[str] = None
 
 
+class VpnPeerBulkItem(BaseModel):
+    # Defaults to VpnPeerBulkCreate.user_id when omitted.
+    user_id: Optional[int] = None
+    device_name: Optional[str] = None
+
+
+class VpnPeerBulkCreate(BaseModel):
+    # Owner of items that do not name a user; defaults to the caller.
+    user_id: Optional[int] = None
+    allowed_ips: Optional[str] = None
+    items: list[VpnPeerBulkItem] = Field(min_length=1, max_length=1000)
+
+
 class VpnPeerOut(BaseModel):
     id: int
     user_id: int
@@ -89,7 +124,8 @@ class VpnPeerOut(BaseModel):
     # (e.g. when WG_KEY_POLICY creates the key remotely and it is not
     # available to the API).
     wg_private_key: Optional[str]
-    wg_ip: str
+    # None once the peer is revoked and its address returned to the pool
+    wg_ip: Optional[str]
     allowed_ips: Optional[str]
     active: bool
     created_at: datetime
@@ -104,6 +140,21 @@ class PaymentCreate(BaseModel):
     provider: Optional[str]
 
 
+class PaymentEvent(BaseModel):
+    """One provider notification or settlement-file line about a payment."""
+
+    provider_payment_id: str = Field(min_length=1, max_length=255)
+    status: PaymentStatus
+    amount: Decimal
+    currency: str = Field("USD", max_length=8)
+    user_id: Optional[int] = None
+
+
+class PaymentImport(BaseModel):
+    provider: str = Field(min_length=1, max_length=64)
+    events: list[PaymentEvent] = Field(min_length=1)
+
+
 class PaymentOut(BaseModel):
     id: int
     user_id: Optional[int]
@@ -0,0 +1,252 @@
+"""Background expiry of lapsed subscriptions and revocation of their peers.
+
+The read path already ignores `user_tariffs` rows whose ``ended_at`` has
+passed, but nothing ever marked them expired, so the users' peers stayed
+active, on the WireGuard interface and in wg-easy. Each sweep pass:
+
+* takes leadership with a Postgres session advisory lock, so with several
+  API workers only one sweeps at a time (the others skip the pass); SQLite
+  deployments are single-process and always lead;
+* walks ``status = 'active' AND ended_at <= now`` through the
+  ``(status, ended_at)`` index in transactions of ``SUBSCRIPTION_SWEEP_BATCH``
+  rows, marking them ``expired`` and deactivating the ``vpn_peers`` of users
+  left without any current subscription;
+* removes the deactivated peers remotely once per pass: one batched host
+  operation (`wg_host.apply_peers`) and concurrent wg-easy deletions.
+
+Nothing reactivates a revoked peer (a renewed user creates a new one), so
+deactivated rows give up their address in the same transaction: ``wg_ip`` is
+cleared and the address goes back to the pool's free list.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Select, select, text, update
+from sqlalchemy.orm import Session
+
+from vpn_api import models, wg_host
+from vpn_api.auth import require_admin
+from vpn_api.cache import invalidate_peer_config
+from vpn_api.database import SessionLocal
+from vpn_api.entitlements import invalidate_subscription
+from vpn_api.ip_pool import release_ips
+from vpn_api.wg_easy_adapter import get_shared_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds between passes; 0 disables the background worker.
+SUBSCRIPTION_SWEEP_INTERVAL = float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", "0"))
+SUBSCRIPTION_SWEEP_BATCH = int(os.getenv("SUBSCRIPTION_SWEEP_BATCH", "500"))
+# Key of the Postgres advisory lock that elects the sweeping worker.
+SUBSCRIPTION_SWEEP_LOCK_KEY = int(os.getenv("SUBSCRIPTION_SWEEP_LOCK_KEY", "720130017"))
+
+router = APIRouter(prefix="/admin/subscriptions", tags=["admin"])
+
+_user_tariffs = models.UserTariff.__table__
+_peers = models.VpnPeer.__table__
+
+
+@dataclass
+class RevokedPeer:
+    id: int
+    public_key: str
+    client_id: Optional[str]
+
+
+@dataclass
+class SweepReport:
+    leader: bool = True
+    batches: int = 0
+    subscriptions_expired: int = 0
+    users_lapsed: int = 0
+    peers_deactivated: int = 0
+    host_removed: int = 0
+    wg_easy_removed: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+@contextmanager
+def _leadership(db: Session, key: int):
+    """Yield whether this worker holds the sweep lock (held until exit)."""
+    if db.get_bind().dialect.name != "postgresql":
+        yield True
+        return
+    # session-level lock on a dedicated connection: it survives the batch
+    # commits and is dropped by Postgres if this process dies mid-pass
+    with db.get_bind().connect() as conn:
+        held = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key}).scalar()
+        conn.commit()
+        try:
+            yield bool(held)
+        finally:
+            if held:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
+                conn.commit()
+
+
+def lapsed_subscriptions_stmt(now: datetime, batch: int) -> Select:
+    """Select the ``batch`` oldest active subscriptions that ended by ``now``."""
+    return (
+        select(_user_tariffs.c.id, _user_tariffs.c.user_id)
+        .where(_user_tariffs.c.status == "active", _user_tariffs.c.ended_at <= now)
+        .order_by(_user_tariffs.c.ended_at)
+        .limit(batch)
+    )
+
+
+def _expire_batch(
+    db: Session, now: datetime, batch: int, report: SweepReport
+) -> tuple[int, list[RevokedPeer]]:
+    """Expire up to ``batch`` subscriptions in one transaction.
+
+    Returns the number of subscriptions expired and the peers deactivated.
+    """
+    rows = db.execute(lapsed_subscriptions_stmt(now, batch)).all()
+    if not rows:
+        return 0, []
+    db.execute(
+        update(_user_tariffs)
+        .where(_user_tariffs.c.id.in_([r.id for r in rows]))
+        .values(status="expired")
+    )
+    users = {r.user_id for r in rows}
+    # a renewal leaves another current subscription behind; keep those users' peers
+    renewed = set(
+        db.execute(
+            select(_user_tariffs.c.user_id).where(
+                _user_tariffs.c.user_id.in_(users),
+                _user_tariffs.c.status == "active",
+                (_user_tariffs.c.ended_at.is_(None)) | (_user_tariffs.c.ended_at > now),
+            )
+        ).scalars()
+    )
+    lapsed = users - renewed
+    revoked, addresses = [], []
+    if lapsed:
+        for p in db.execute(
+            select(
+                _peers.c.id, _peers.c.wg_public_key, _peers.c.wg_client_id, _peers.c.wg_ip
+            ).where(_peers.c.user_id.in_(lapsed), _peers.c.active.is_(True))
+        ):
+            revoked.append(RevokedPeer(p.id, p.wg_public_key, p.wg_client_id))
+            addresses.append(p.wg_ip)
+    if revoked:
+        db.execute(
+            update(_peers)
+            .where(_peers.c.id.in_([p.id for p in revoked]))
+            .values(active=False, wg_ip=None)
+        )
+        release_ips(db, addresses)
+    db.commit()
+    # Core statements bypass the ORM hooks that normally drop these entries
+    for user_id in users:
+        invalidate_subscription(user_id)
+    for peer in revoked:
+        invalidate_peer_config(peer.id)
+    report.batches += 1
+    report.subscriptions_expired += len(rows)
+    report.users_lapsed += len(lapsed)
+    report.peers_deactivated += len(revoked)
+    return len(rows), revoked
+
+
+class SubscriptionSweeper:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch: int = SUBSCRIPTION_SWEEP_BATCH,
+        lock_key: int = SUBSCRIPTION_SWEEP_LOCK_KEY,
+    ):
+        self._session_factory = session_factory
+        self.batch = max(1, batch)
+        self.lock_key = lock_key
+        self._lock = asyncio.Lock()
+
+    def _sweep_db(self, now: datetime, report: SweepReport) -> list[RevokedPeer]:
+        db: Session = self._session_factory()
+        revoked: list[RevokedPeer] = []
+        try:
+            with _leadership(db, self.lock_key) as leader:
+                report.leader = leader
+                if not leader:
+                    return []
+                while True:
+                    expired, peers = _expire_batch(db, now, self.batch, report)
+                    revoked.extend(peers)
+                    if expired < self.batch:
+                        break
+        finally:
+            db.close()
+        return revoked
+
+    async def _remove_remote(self, revoked: list[RevokedPeer], report: SweepReport) -> None:
+        host_ops = [wg_host.PeerOp("remove", p.public_key) for p in revoked if not p.client_id]
+        if host_ops and wg_host.WG_APPLY_ENABLED:
+            results = await run_in_threadpool(wg_host.apply_peers, host_ops)
+            report.host_removed = sum(1 for ok in results.values() if ok)
+            failed = len(host_ops) - report.host_removed
+            if failed:
+                report.errors.append(f"failed to remove {failed} host peers")
+
+        client_ids = [p.client_id for p in revoked if p.client_id]
+        client = get_shared_client()
+        if not client_ids or client is None:
+            return
+
+        async def _delete(cid):
+            try:
+                await client.delete_client(cid)
+                report.wg_easy_removed += 1
+            except Exception as exc:
+                report.errors.append(f"failed to delete wg-easy client {cid}: {exc}")
+
+        await asyncio.gather(*(_delete(c) for c in client_ids))
+
+    async def run_once(self, now: Optional[datetime] = None) -> SweepReport:
+        async with self._lock:
+            report = SweepReport()
+            now = now or datetime.now(UTC)
+            revoked = await run_in_threadpool(self._sweep_db, now, report)
+            # remote state lags the database on failure; the reconciler removes
+            # host peers and wg-easy clients of inactive rows on its next pass
+            if revoked:
+                await self._remove_remote(revoked, report)
+            if report.subscriptions_expired or report.errors:
+                logger.info(
+                    "[SWEEP] expired=%d users=%d peers=%d host_removed=%d wg_easy_removed=%d "
+                    "errors=%d",
+                    report.subscriptions_expired,
+                    report.users_lapsed,
+                    report.peers_deactivated,
+                    report.host_removed,
+                    report.wg_easy_removed,
+                    len(report.errors),
+                )
+            return report
+
+    async def run_forever(self, interval: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[SWEEP] pass failed")
+            await asyncio.sleep(interval)
+
+
+sweeper = SubscriptionSweeper()
+
+
+@router.post("/sweep")
+async def sweep_now(_admin: models.User = Depends(require_admin)):
+    """Expire lapsed subscriptions and revoke their peers immediately."""
+    return await sweeper.run_once()
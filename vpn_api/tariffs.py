@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from vpn_api import models, schemas
+from vpn_api.auth import require_admin
 from vpn_api.database import get_db
+from vpn_api.pagination import paginate
+from vpn_api.product_catalog import catalog
 
 router = APIRouter()
 
@@ -13,7 +18,12 @@ def create_tariff(t: schemas.TariffCreate, db: Session = Depends(get_db)):
     db_t = db.query(models.Tariff).filter(models.Tariff.name == t.name).first()
     if db_t:
         raise HTTPException(status_code=400, detail="Tariff already exists")
-    new = models.Tariff(name=t.name, price=t.price)
+    new = models.Tariff(
+        name=t.name,
+        description=t.description,
+        duration_days=t.duration_days or 30,
+        price=t.price,
+    )
     db.add(new)
     try:
         db.commit()
@@ -26,9 +36,84 @@ def create_tariff(t: schemas.TariffCreate, db: Session = Depends(get_db)):
 
 @router.get("/")
 def list_tariffs(
-    db: Session = Depends(get_db), skip: int = Query(0, ge=0), limit: int = Query(10, ge=1, le=100)
+    response: Response,
+    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+):
+    return paginate(
+        db.query(models.Tariff), models.Tariff, response, limit=limit, cursor=cursor, skip=skip
+    )
+
+
+# Продукты App Store / Google Play и тарифы, которые они дают. Читается из
+# снимка в памяти (vpn_api.product_catalog), без запросов к БД.
+@router.get("/products", response_model=list[schemas.IapProductOut])
+def list_products():
+    return sorted(catalog().products.values(), key=lambda p: p.product_id)
+
+
+# Привязка продукта к тарифу (продукт, привязанный к другому тарифу, переносится).
+# После коммита снимок каталога перечитывается.
+@router.put("/{tariff_id}/products/{product_id}", response_model=schemas.IapProductOut)
+def map_product(
+    tariff_id: int,
+    product_id: str,
+    db: Session = Depends(get_db),
+    _admin: models.User = Depends(require_admin),
+):
+    tariff = db.get(models.Tariff, tariff_id)
+    if not tariff:
+        raise HTTPException(status_code=404, detail="Tariff not found")
+    product = db.get(models.IapProduct, product_id)
+    if product is None:
+        db.add(models.IapProduct(product_id=product_id, tariff_id=tariff_id))
+    else:
+        product.tariff_id = tariff_id
+    db.commit()
+    return {
+        "product_id": product_id,
+        "tariff_id": tariff.id,
+        "tariff_name": tariff.name,
+        "duration_days": tariff.duration_days,
+    }
+
+
+@router.delete("/products/{product_id}")
+def unmap_product(
+    product_id: str,
+    db: Session = Depends(get_db),
+    _admin: models.User = Depends(require_admin),
 ):
-    return db.query(models.Tariff).offset(skip).limit(limit).all()
+    product = db.get(models.IapProduct, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    db.delete(product)
+    db.commit()
+    return {"msg": "product unmapped", "product_id": product_id}
+
+
+# Изменение тарифа: длительность и цена сразу видны в каталоге продуктов.
+@router.patch("/{tariff_id}", response_model=schemas.TariffOut)
+def update_tariff(
+    tariff_id: int,
+    changes: schemas.TariffUpdate,
+    db: Session = Depends(get_db),
+    _admin: models.User = Depends(require_admin),
+):
+    tariff = db.get(models.Tariff, tariff_id)
+    if not tariff:
+        raise HTTPException(status_code=404, detail="Tariff not found")
+    for name, value in changes.model_dump(exclude_unset=True).items():
+        setattr(tariff, name, value)
+    try:
+        db.commit()
+    except IntegrityError as err:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Tariff already exists or DB error") from err
+    db.refresh(tariff)
+    return tariff
 
 
 # Удаление тарифа (если не назначен ни одному пользователю)
@@ -0,0 +1,92 @@
+import os
+import time
+
+from cryptography.fernet import Fernet
+from fastapi.testclient import TestClient
+
+from vpn_api import cache, crypto
+from vpn_api.cache import TTLCache
+from vpn_api.main import app
+
+
+def test_ttl_cache_lru_expiry_and_counters():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # "a" is now most recently used
+    c.set("c", 3)  # evicts "b"
+    assert c.get("b") is None
+    assert c.pop_where(lambda k: k in ("a", "c")) == 2
+    c.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert c.get("short") is None
+    assert len(c) == 0
+    assert c.stats()["hits"] == 1
+    assert c.stats()["misses"] == 2
+    assert c.stats()["evictions"] == 1
+
+
+def test_fernet_is_memoized(monkeypatch):
+    monkeypatch.setenv("CONFIG_ENCRYPTION_KEY", Fernet.generate_key().decode())
+    assert crypto._get_fernet() is crypto._get_fernet()
+    token = crypto.encrypt_text("hello")
+    # a rotated key is picked up on the next call
+    monkeypatch.setenv("CONFIG_ENCRYPTION_KEY", Fernet.generate_key().decode())
+    assert crypto.decrypt_text(token) is None
+
+
+def _auth(client, email):
+    client.post("/auth/register", json={"email": email, "password": "cachepass1"})
+    token = client.post("/auth/login", json={"email": email, "password": "cachepass1"})
+    return {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def test_config_served_from_cache_and_invalidated(monkeypatch):
+    if not os.getenv("CONFIG_ENCRYPTION_KEY"):
+        monkeypatch.setenv("CONFIG_ENCRYPTION_KEY", Fernet.generate_key().decode())
+    monkeypatch.setenv("WG_KEY_POLICY", "db")
+    client = TestClient(app)
+    headers = _auth(client, "cache-cfg@example.com")
+
+    # no subscription yet: the negative result is cached...
+    assert client.get("/vpn_peers/self/config", headers=headers).status_code == 403
+    tariff = client.post("/tariffs/", json={"name": f"cache-{time.time()}", "price": 1})
+    # ...and dropped when the user subscribes
+    r = client.post("/auth/subscribe", json={"tariff_id": tariff.json()["id"]}, headers=headers)
+    assert r.status_code == 200
+
+    peer = client.post("/vpn_peers/self", json={"device_name": "phone"}, headers=headers).json()
+
+    decrypts = []
+    real_decrypt = crypto.decrypt_text
+    monkeypatch.setattr(
+        "vpn_api.peers.decrypt_text", lambda t: decrypts.append(t) or real_decrypt(t)
+    )
+    before = cache.config_cache.stats()["hits"]
+    first = client.get("/vpn_peers/self/config", headers=headers).json()["wg_quick"]
+    second = client.get("/vpn_peers/self/config", headers=headers).json()["wg_quick"]
+    assert first == second and first.startswith("[Interface]")
+    # primed at creation: no decryption at all
+    assert decrypts == []
+    assert cache.config_cache.stats()["hits"] == before + 2
+
+    r = client.put(
+        f"/vpn_peers/{peer['id']}",
+        json={"wg_public_key": peer["wg_public_key"], "wg_ip": peer["wg_ip"]},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert not any(k[0] == peer["id"] for k in cache.config_cache._data)
+    assert client.get("/vpn_peers/self/config", headers=headers).json()["wg_quick"] == first
+    assert len(decrypts) == 1
+
+
+def test_cache_stats_admin_only():
+    client = TestClient(app)
+    headers = _auth(client, "cache-stats@example.com")
+    assert client.get("/admin/cache", headers=headers).status_code == 403
+    me = client.get("/auth/me", headers=headers).json()
+    client.post("/auth/admin/promote", params={"user_id": me["id"], "secret": "bootstrap-secret"})
+    body = client.get("/admin/cache", headers=headers).json()
+    assert set(body) == {"peer_config", "subscription", "principal", "iap_receipt"}
+    assert "hit_ratio" in body["peer_config"]
@@ -0,0 +1,21 @@
+import pytest
+
+from vpn_api.database import _async_url
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:////tmp/app.db", "sqlite+aiosqlite:////tmp/app.db"),
+        ("postgresql://u:p@db:5432/vpn", "postgresql+asyncpg://u:p@db:5432/vpn"),
+        ("postgresql+psycopg2://u:p@db/vpn", "postgresql+asyncpg://u:p@db/vpn"),
+        ("postgresql://u:p@db/vpn?sslmode=require", "postgresql+asyncpg://u:p@db/vpn?ssl=require"),
+    ],
+)
+def test_async_url_picks_async_driver(url, expected):
+    assert _async_url(url) == expected
+
+
+def test_async_url_rejects_unknown_backend():
+    with pytest.raises(RuntimeError):
+        _async_url("mysql://u:p@db/vpn")
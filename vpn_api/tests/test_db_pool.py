@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+
+from vpn_api import database
+from vpn_api.db_pool import instrumented, pool_stats
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+def _engine(tmp_path, **metrics_kwargs):
+    return create_engine(
+        f"sqlite:///{(tmp_path / 'pool.db').as_posix()}",
+        poolclass=instrumented(QueuePool, "test", **metrics_kwargs),
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+        pool_pre_ping=True,
+    )
+
+
+def test_pool_reports_occupancy_and_timeouts(tmp_path):
+    engine = _engine(tmp_path)
+    first, second = engine.connect(), engine.connect()
+    stats = pool_stats(engine)
+    assert stats["in_use"] == 2 and stats["overflow"] == 1
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    first.close()
+    second.close()
+
+    stats = pool_stats(engine)
+    assert stats["pool"] == "InstrumentedQueuePool"
+    assert stats["in_use"] == 0
+    assert stats["checkouts"] == 3 and stats["checkout_timeouts"] == 1
+    assert stats["checkout_wait_seconds_max"] >= 0.05
+    engine.dispose()
+
+
+def test_slow_checkout_logs_warning_and_survives_dispose(tmp_path, caplog):
+    engine = _engine(tmp_path, slow_checkout_ms=0)
+    with caplog.at_level(logging.WARNING, logger="vpn_api.db_pool"):
+        with engine.connect() as conn:
+            conn.execute(text("select 1"))
+    assert "slow db pool checkout" in caplog.text
+    engine.dispose()
+    assert pool_stats(engine)["slow_checkouts"] == 1
+
+
+def test_app_engine_uses_configured_pool():
+    pool = database.engine.pool
+    assert pool.size() == database.DB_POOL_SIZE
+    assert pool._pre_ping is database.DB_POOL_PRE_PING
+    assert pool._recycle == database.DB_POOL_RECYCLE
+
+
+def test_db_pool_stats_admin_only():
+    client.post("/auth/register", json={"email": "pooladmin@example.com", "password": "poolpass1"})
+    token = client.post(
+        "/auth/login", json={"email": "pooladmin@example.com", "password": "poolpass1"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/admin/db-pool", headers=headers).status_code == 403
+    me = client.get("/auth/me", headers=headers).json()
+    client.post("/auth/admin/promote", params={"user_id": me["id"], "secret": "bootstrap-secret"})
+    body = client.get("/admin/db-pool", headers=headers).json()
+    assert body["sync"]["checkouts"] > 0
+    assert body["async"]["pool"] == "NullPool"
@@ -0,0 +1,155 @@
+import socket
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select
+
+from vpn_api import email_outbox, models
+from vpn_api.database import Base, SessionLocal, engine
+from vpn_api.email_outbox import OutboxWorker, SmtpSession
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+
+class _Recorder:
+    """aiosmtpd handler: records delivered mail and the session it came over."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("reject"):
+            return "550 no such user"
+        if address.startswith("later"):
+            return "451 try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], envelope.content.decode()))
+        if session not in self.sessions:
+            self.sessions.append(session)
+        return "250 Message accepted"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtpd(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.execute(delete(models.EmailOutbox))
+        db.commit()
+    recorder = _Recorder()
+    port = _free_port()
+    recorder.controller = Controller(recorder, hostname="127.0.0.1", port=port)
+    recorder.controller.start()
+    monkeypatch.setenv("SMTP_DRY_RUN", "0")
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_USER", "")
+    yield recorder
+    recorder.controller.stop()
+
+
+def _enqueue(*recipients):
+    with SessionLocal() as db:
+        for i, to in enumerate(recipients):
+            email_outbox.enqueue(db, to, f"subject {i}", f"body {i}")
+        db.commit()
+
+
+def _rows():
+    with SessionLocal() as db:
+        return (
+            db.execute(select(models.EmailOutbox).order_by(models.EmailOutbox.id)).scalars().all()
+        )
+
+
+def test_many_messages_share_one_smtp_session(smtpd):
+    _enqueue(*(f"user{i}@example.com" for i in range(30)))
+    worker = OutboxWorker(SmtpSession(), batch=7)
+    try:
+        report = worker.drain_once()
+    finally:
+        worker.close()
+    assert (report.claimed, report.sent) == (30, 30)
+    assert len(smtpd.messages) == 30
+    assert len(smtpd.sessions) == 1
+    assert {r.status for r in _rows()} == {"sent"}
+    # nothing left to send
+    assert worker.drain_once().claimed == 0
+
+
+def test_session_is_recycled_and_reopened_after_a_drop(smtpd):
+    worker = OutboxWorker(SmtpSession(noop_after=0, max_messages=10))
+    try:
+        _enqueue(*(f"user{i}@example.com" for i in range(25)))
+        assert worker.drain_once().sent == 25
+        assert len(smtpd.sessions) == 3
+
+        # the server goes away and comes back: the NOOP probe notices and reconnects
+        port = smtpd.controller.port
+        smtpd.controller.stop()
+        smtpd.controller = Controller(smtpd, hostname="127.0.0.1", port=port)
+        smtpd.controller.start()
+        _enqueue("again@example.com")
+        assert worker.drain_once().sent == 1
+        assert len(smtpd.sessions) == 4
+    finally:
+        worker.close()
+
+
+def test_failures_are_retried_with_backoff_then_given_up(smtpd, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_MAX_ATTEMPTS", 2)
+    _enqueue("ok@example.com", "reject@example.com", "later@example.com")
+    worker = OutboxWorker(SmtpSession())
+    try:
+        report = worker.drain_once()
+        assert (report.sent, report.failed, report.retried) == (1, 1, 1)
+        ok, rejected, later = _rows()
+        assert (ok.status, rejected.status, later.status) == ("sent", "failed", "pending")
+        assert rejected.attempts == 1 and "550" in rejected.last_error
+        assert later.attempts == 1
+
+        # not due yet; once it is, the second temporary failure is the last one
+        assert worker.drain_once().claimed == 0
+        report = worker.drain_once(now=datetime.now(UTC) + timedelta(hours=1))
+        assert report.failed == 1
+        assert _rows()[2].status == "failed"
+    finally:
+        worker.close()
+    assert [to for to, _body in smtpd.messages] == ["ok@example.com"]
+
+
+def test_unreachable_server_defers_without_using_attempts(smtpd, monkeypatch):
+    monkeypatch.setenv("SMTP_PORT", str(_free_port()))
+    _enqueue("a@example.com", "b@example.com")
+    worker = OutboxWorker(SmtpSession())
+    report = worker.drain_once()
+    assert (report.claimed, report.deferred, report.sent) == (2, 2, 0)
+    rows = _rows()
+    assert {(r.status, r.attempts) for r in rows} == {("pending", 0)}
+    assert all(r.next_attempt_at.replace(tzinfo=UTC) > datetime.now(UTC) for r in rows)
+
+
+def test_verification_email_is_sent_only_after_the_caller_commits(smtpd):
+    with SessionLocal() as db:
+        email_outbox.enqueue_verification_email(db, "rolled-back@example.com", "000000")
+        db.rollback()
+        email_outbox.enqueue_verification_email(db, "verify@example.com", "123456")
+        db.commit()
+    worker = OutboxWorker(SmtpSession())
+    try:
+        assert worker.drain_once().sent == 1
+    finally:
+        worker.close()
+    [(to, body)] = smtpd.messages
+    assert to == "verify@example.com"
+    assert "Your verification code: 123456" in body
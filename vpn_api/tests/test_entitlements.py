@@ -0,0 +1,102 @@
+import time
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from vpn_api import models
+from vpn_api.database import SessionLocal, engine
+from vpn_api.entitlements import get_entitlement, subscription_cache
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+@contextmanager
+def _count_queries(table):
+    seen = []
+
+    def _before(conn, cursor, statement, *args):
+        if table in statement:
+            seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+
+
+def _user(email):
+    r = client.post("/auth/register", json={"email": email, "password": "entpass12"})
+    assert r.status_code == 200
+    token = client.post("/auth/login", json={"email": email, "password": "entpass12"})
+    return r.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def _tariff(days=30):
+    r = client.post(
+        "/tariffs/", json={"name": f"ent-{time.time()}", "price": 5, "duration_days": days}
+    )
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def test_subscription_lookups_hit_the_cache():
+    _uid, headers = _user("ent-hot@example.com")
+    assert client.get("/auth/me/subscription", headers=headers).json() is None
+    r = client.post("/auth/subscribe", json={"tariff_id": _tariff()}, headers=headers)
+    assert r.status_code == 200
+
+    first = client.get("/auth/me/subscription", headers=headers).json()
+    assert first["days_remaining"] in (29, 30)
+    with _count_queries("user_tariffs") as queries:
+        for _ in range(5):
+            assert client.get("/auth/me/subscription", headers=headers).json() == first
+            assert client.get("/vpn_peers/self/config", headers=headers).status_code == 404
+    assert queries == []
+
+
+def test_entry_expires_at_ended_at():
+    uid, _headers = _user("ent-expiry@example.com")
+    now = datetime.now(UTC)
+    db = SessionLocal()
+    try:
+        db.add(
+            models.UserTariff(
+                user_id=uid,
+                tariff_id=_tariff(),
+                started_at=now,
+                ended_at=now + timedelta(seconds=30),
+            )
+        )
+        db.commit()
+        assert get_entitlement(db, uid, now) is not None
+        # still cached a moment before the end, re-checked right after it
+        with _count_queries("user_tariffs") as queries:
+            assert get_entitlement(db, uid, now + timedelta(seconds=29)) is not None
+        assert queries == []
+        assert get_entitlement(db, uid, now + timedelta(seconds=31)) is None
+    finally:
+        db.close()
+
+
+def test_committed_tariff_changes_invalidate():
+    uid, headers = _user("ent-invalidate@example.com")
+    client.post("/auth/subscribe", json={"tariff_id": _tariff()}, headers=headers)
+    assert client.get("/auth/me/subscription", headers=headers).json() is not None
+    assert subscription_cache.get(uid) is not None
+
+    db = SessionLocal()
+    try:
+        user_tariff = db.query(models.UserTariff).filter_by(user_id=uid).one()
+        user_tariff.status = "cancelled"
+        db.flush()
+        # flushed but not committed: the cached entry stays
+        assert subscription_cache.get(uid) is not None
+        db.commit()
+    finally:
+        db.close()
+    assert subscription_cache.get(uid, "missing") == "missing"
+    assert client.get("/auth/me/subscription", headers=headers).json() is None
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from vpn_api import iap_validator as iap
+from vpn_api.cache import receipt_cache
+from vpn_api.iap_validator import IapValidator
+
+BUNDLE = "com.example.vpn"
+
+
+def _purchase(expires_in: float = 3600) -> dict:
+    now_ms = int(time.time() * 1000)
+    return {
+        "status": 0,
+        "receipt": {"bundle_id": BUNDLE},
+        "latest_receipt_info": [
+            {
+                "transaction_id": "t-1",
+                "product_id": "com.example.vpn.monthly",
+                "purchase_date_ms": str(now_ms - 1000),
+                "expires_date_ms": str(now_ms + int(expires_in * 1000)),
+            }
+        ],
+    }
+
+
+def _make_app(state):
+    def handler(environment):
+        async def verify(request):
+            body = await request.json()
+            state["calls"].append((environment, body["receipt-data"]))
+            await asyncio.sleep(state["delay"])
+            return web.json_response(state[environment])
+
+        return verify
+
+    app = web.Application()
+    app.router.add_post("/prod", handler("production"))
+    app.router.add_post("/sandbox", handler("sandbox"))
+    return app
+
+
+@pytest.fixture
+def state():
+    receipt_cache.clear()
+    yield {"calls": [], "delay": 0, "production": _purchase(), "sandbox": _purchase()}
+    receipt_cache.clear()
+
+
+def _validator(server) -> IapValidator:
+    return IapValidator(
+        production_url=str(server.make_url("/prod")),
+        sandbox_url=str(server.make_url("/sandbox")),
+    )
+
+
+@pytest.mark.asyncio
+async def test_sandbox_receipt_falls_back_and_is_cached(state):
+    state["production"] = {"status": 21007}
+    async with TestServer(_make_app(state)) as server:
+        validator = _validator(server)
+        try:
+            first = await validator.validate_apple_receipt("r1", BUNDLE)
+            second = await validator.validate_apple_receipt("r1", BUNDLE)
+        finally:
+            await validator.close()
+    assert first["environment"] == "sandbox"
+    assert first["product_id"] == "com.example.vpn.monthly"
+    assert second == first
+    assert state["calls"] == [("production", "r1"), ("sandbox", "r1")]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checks_share_one_request(state):
+    state["delay"] = 0.05
+    async with TestServer(_make_app(state)) as server:
+        validator = _validator(server)
+        try:
+            results = await asyncio.gather(
+                *(validator.validate_apple_receipt("r1", BUNDLE) for _ in range(20)),
+                validator.validate_apple_receipt("r2", BUNDLE),
+            )
+        finally:
+            await validator.close()
+    assert all(r is not None for r in results)
+    assert sorted(state["calls"]) == [("production", "r1"), ("production", "r2")]
+
+
+@pytest.mark.asyncio
+async def test_rejections_are_cached_transient_failures_are_not(state):
+    async with TestServer(_make_app(state)) as server:
+        validator = _validator(server)
+        try:
+            state["production"] = {"status": 21005}
+            assert await validator.validate_apple_receipt("r1", BUNDLE) is None
+            assert await validator.validate_apple_receipt("r1", BUNDLE) is None
+            assert len(state["calls"]) == 2
+
+            state["production"] = {"status": 21010}
+            assert await validator.validate_apple_receipt("r2", BUNDLE) is None
+            assert await validator.validate_apple_receipt("r2", BUNDLE) is None
+            assert len(state["calls"]) == 3
+
+            state["production"] = _purchase()
+            assert await validator.validate_apple_receipt("r3", "com.other.app") is None
+            assert await validator.validate_apple_receipt("r3", "com.other.app") is None
+            assert len(state["calls"]) == 4
+        finally:
+            await validator.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_purchase_is_not_served_from_cache(state, monkeypatch):
+    monkeypatch.setattr(iap, "IAP_RECEIPT_NEGATIVE_TTL", 0)
+    state["production"] = _purchase(expires_in=-60)
+    async with TestServer(_make_app(state)) as server:
+        validator = _validator(server)
+        try:
+            assert await validator.validate_apple_receipt("r1", BUNDLE) is not None
+            assert await validator.validate_apple_receipt("r1", BUNDLE) is not None
+        finally:
+            await validator.close()
+    assert len(state["calls"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_first_request_does_not_cancel_the_others(state):
+    state["delay"] = 0.1
+    async with TestServer(_make_app(state)) as server:
+        validator = _validator(server)
+        try:
+            first = asyncio.create_task(validator.validate_apple_receipt("r1", BUNDLE))
+            await asyncio.sleep(0.02)
+            second = asyncio.create_task(validator.validate_apple_receipt("r1", BUNDLE))
+            await asyncio.sleep(0.02)
+            first.cancel()
+            assert (await second)["product_id"] == "com.example.vpn.monthly"
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            # the shared check still completed and was cached
+            assert await validator.validate_apple_receipt("r1", BUNDLE) is not None
+        finally:
+            await validator.close()
+    assert state["calls"] == [("production", "r1")]
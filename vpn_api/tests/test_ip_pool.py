@@ -0,0 +1,191 @@
+import ipaddress
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from vpn_api import ip_pool, models
+from vpn_api.database import Base, SessionLocal, engine
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+
+
+def test_allocate_skips_reserved_and_reuses_released():
+    db = SessionLocal()
+    try:
+        first = ip_pool.allocate_ip(db, pools=["10.50.0.0/24"])
+        second = ip_pool.allocate_ip(db, pools=["10.50.0.0/24"])
+        assert first == "10.50.0.20/32"
+        assert second == "10.50.0.21/32"
+        assert ip_pool.release_ip(db, first) is True
+        # released address comes back before the high-water mark moves on
+        assert ip_pool.allocate_ip(db, pools=["10.50.0.0/24"]) == first
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_allocate_skips_addresses_of_legacy_peers():
+    db = SessionLocal()
+    try:
+        user = models.User(email="legacy-ip@example.test")
+        db.add(user)
+        db.flush()
+        db.add(
+            models.VpnPeer(
+                user_id=user.id,
+                wg_private_key="k",
+                wg_public_key="legacy-pk",
+                wg_ip="10.51.0.20/32",
+            )
+        )
+        db.flush()
+        assert ip_pool.allocate_ip(db, pools=["10.51.0.0/24"]) == "10.51.0.21/32"
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_exhaustion_falls_through_to_next_pool_then_raises():
+    db = SessionLocal()
+    try:
+        # /28 has offsets 1..14 usable; reserved 1..19 leaves nothing
+        pools = ["10.52.0.0/28", "10.53.0.0/27"]
+        got = [ip_pool.allocate_ip(db, pools=pools) for _ in range(11)]
+        assert all(ipaddress.ip_interface(a).ip in ipaddress.ip_network(pools[1]) for a in got)
+        assert got[-1] == "10.53.0.30/32"
+        with pytest.raises(ip_pool.IpPoolExhausted):
+            ip_pool.allocate_ip(db, pools=pools)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_allocate_ips_batch_is_contiguous_and_distinct():
+    db = SessionLocal()
+    try:
+        got = ip_pool.allocate_ips(db, 100, pools=["10.54.0.0/24"])
+        assert len(set(got)) == 100
+        assert got[0] == "10.54.0.20/32" and got[-1] == "10.54.0.119/32"
+        assert ip_pool.release_ips(db, got[:10]) == 10
+        again = ip_pool.allocate_ips(db, 15, pools=["10.54.0.0/24"])
+        assert set(got[:10]) <= set(again)
+        assert "10.54.0.124/32" in again
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_stress_60k_allocations_in_slash16_without_collisions():
+    pools = ["10.60.0.0/16"]
+    db = SessionLocal()
+    try:
+        live: set[str] = set()
+        # mix single allocations with batches the way bulk provisioning does
+        for _ in range(1_000):
+            live.add(ip_pool.allocate_ip(db, pools=pools))
+        while len(live) < 60_000:
+            batch = ip_pool.allocate_ips(db, min(1_000, 60_000 - len(live)), pools=pools)
+            assert live.isdisjoint(batch)
+            live.update(batch)
+        db.commit()
+        assert len(live) == 60_000
+
+        # free a random half and allocate the same amount again from the free list
+        rng = random.Random(42)
+        freed = rng.sample(sorted(live), 30_000)
+        assert ip_pool.release_ips(db, freed) == 30_000
+        live.difference_update(freed)
+        db.commit()
+        reused = ip_pool.allocate_ips(db, 30_000, pools=pools)
+        assert live.isdisjoint(reused)
+        assert set(reused) == set(freed)
+        live.update(reused)
+        db.commit()
+
+        # /16 minus reserved offsets, network and broadcast
+        remaining = 65_536 - 2 - ip_pool.WG_IP_RESERVED - 60_000
+        tail = ip_pool.allocate_ips(db, remaining, pools=pools)
+        assert live.isdisjoint(tail)
+        with pytest.raises(ip_pool.IpPoolExhausted):
+            ip_pool.allocate_ip(db, pools=pools)
+
+        assert ip_pool.release_ips(db, sorted(live) + tail) == 60_000 + remaining
+        db.commit()
+        in_use = (
+            db.query(models.IpAllocation)
+            .filter(models.IpAllocation.address.like("10.60.%"), models.IpAllocation.in_use)
+            .count()
+        )
+        assert in_use == 0
+    finally:
+        db.close()
+
+
+def test_reserve_ip_marks_manual_addresses_in_use():
+    pools = ["10.55.0.0/24"]
+    db = SessionLocal()
+    try:
+        allocated = ip_pool.allocate_ip(db, pools=pools)
+        assert allocated == "10.55.0.20/32"
+        # taken by another peer
+        assert ip_pool.reserve_ip(db, allocated, pools=pools) is False
+        # above the high-water mark: the allocator must step over it later
+        assert ip_pool.reserve_ip(db, "10.55.0.22/32", pools=pools) is True
+        assert ip_pool.reserve_ip(db, "10.55.0.22/32", pools=pools) is False
+        assert ip_pool.allocate_ips(db, 2, pools=pools) == ["10.55.0.21/32", "10.55.0.23/32"]
+        # a released address comes off the free list
+        ip_pool.release_ip(db, allocated)
+        assert ip_pool.reserve_ip(db, allocated, pools=pools) is True
+        assert ip_pool.allocate_ip(db, pools=pools) == "10.55.0.24/32"
+        # reserved offsets and foreign networks are not tracked
+        assert ip_pool.reserve_ip(db, "10.55.0.5/32", pools=pools) is True
+        assert ip_pool.reserve_ip(db, "192.168.1.10/32", pools=pools) is True
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_overlapping_allocations_never_share_an_address():
+    pools = ["10.56.0.0/24"]
+
+    def worker(n):
+        got = []
+        db = SessionLocal()
+        try:
+            for _ in range(n):
+                got.append(ip_pool.allocate_ip(db, pools=pools))
+                db.commit()
+        finally:
+            db.close()
+        return got
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(worker, [10] * 6))
+    everything = [a for got in results for a in got]
+    assert len(everything) == len(set(everything)) == 60
+
+
+def test_lost_race_is_retried(monkeypatch):
+    pools = ["10.57.0.0/24"]
+    real_bump = ip_pool._bump
+    calls = []
+
+    def racing_bump(db, pool_id, net, n):
+        calls.append(n)
+        if len(calls) == 1:
+            # another worker inserted the same address in between
+            raise IntegrityError("INSERT", {}, Exception("duplicate address"))
+        return real_bump(db, pool_id, net, n)
+
+    monkeypatch.setattr(ip_pool, "_bump", racing_bump)
+    db = SessionLocal()
+    try:
+        assert ip_pool.allocate_ip(db, pools=pools) == "10.57.0.20/32"
+        assert len(calls) == 2
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from vpn_api import crypto, metrics
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_are_labelled_by_route_template():
+    before = _value("http_requests_total", method="GET", route="/vpn_peers/{peer_id}", status="401")
+    client.get("/vpn_peers/12345")
+    client.get("/vpn_peers/67890")
+    after = _value("http_requests_total", method="GET", route="/vpn_peers/{peer_id}", status="401")
+    assert after - before == 2
+    assert _value("http_requests_in_progress", method="GET") == 0
+
+    # prefix given at include_router time is part of the template
+    before = _value("http_requests_total", method="GET", route="/auth/me", status="401")
+    client.get("/auth/me")
+    assert _value("http_requests_total", method="GET", route="/auth/me", status="401") - before == 1
+
+
+def test_unknown_paths_share_one_label():
+    before = _value(
+        "http_requests_total", method="GET", route=metrics.UNMATCHED_ROUTE, status="404"
+    )
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    after = _value("http_requests_total", method="GET", route=metrics.UNMATCHED_ROUTE, status="404")
+    assert after - before == 2
+
+
+def test_metrics_endpoint_exposes_domain_and_pool_metrics(monkeypatch):
+    monkeypatch.setenv("CONFIG_ENCRYPTION_KEY", "x" * 43 + "=")
+    crypto.decrypt_text(crypto.encrypt_text("[Interface]"))
+    body = client.get("/metrics").text
+    assert 'config_crypto_duration_seconds_count{operation="encrypt"}' in body
+    assert 'config_crypto_duration_seconds_count{operation="decrypt"}' in body
+    assert 'db_pool_in_use{engine="sync"}' in body
+    assert "password_hash_in_flight" in body
+    assert 'cache_hits_total{cache="peer_config"}' in body
+    assert "http_request_duration_seconds_bucket" in body
+
+
+async def test_wg_easy_failures_are_counted():
+    @metrics.wg_easy_call("test_op")
+    async def broken():
+        raise RuntimeError("wg-easy down")
+
+    with pytest.raises(RuntimeError):
+        await broken()
+    assert _value("wg_easy_failures_total", operation="test_op") == 1
+    assert _value("wg_easy_request_duration_seconds_count", operation="test_op") == 1
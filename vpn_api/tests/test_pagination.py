@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+from vpn_api import models, pagination
+from vpn_api.database import SessionLocal
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+def _user(email):
+    r = client.post("/auth/register", json={"email": email, "password": "pagepass1"})
+    assert r.status_code == 200
+    token = client.post("/auth/login", json={"email": email, "password": "pagepass1"})
+    return r.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def _add_payments(user_id, n):
+    # inserted in one statement, so most rows share the same created_at second
+    db = SessionLocal()
+    try:
+        db.add_all([models.Payment(user_id=user_id, amount=i + 1) for i in range(n)])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _walk(path, headers, **params):
+    seen, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        r = client.get(path, params=query, headers=headers)
+        assert r.status_code == 200, r.text
+        seen.extend(item["id"] for item in r.json())
+        pages += 1
+        cursor = r.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return seen, pages
+
+
+def test_cursor_walk_has_no_gaps_or_duplicates():
+    uid, headers = _user("page-walk@example.com")
+    _add_payments(uid, 23)
+
+    ids, pages = _walk("/payments/", headers, limit=5)
+    assert pages == 5
+    assert len(ids) == 23 and len(set(ids)) == 23
+    assert ids == sorted(ids)
+
+    desc, _ = _walk("/payments/", headers, limit=7, order="desc")
+    assert desc == ids[::-1]
+
+
+def test_legacy_offset_mode_still_works():
+    uid, headers = _user("page-offset@example.com")
+    _add_payments(uid, 6)
+    everything = client.get("/payments/", headers=headers).json()
+    r = client.get("/payments/", params={"skip": 2, "limit": 3}, headers=headers)
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()] == [p["id"] for p in everything[2:5]]
+    assert pagination.NEXT_CURSOR_HEADER not in r.headers
+
+
+def test_invalid_cursor_and_page_size_are_rejected():
+    _uid, headers = _user("page-errors@example.com")
+    r = client.get("/payments/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert r.status_code == 400
+    r = client.get("/vpn_peers/", params={"limit": pagination.MAX_PAGE_SIZE + 1}, headers=headers)
+    assert r.status_code == 422
+    asc = pagination.encode_cursor(datetime.now(timezone.utc), 1)
+    r = client.get("/payments/", params={"cursor": asc, "order": "desc"}, headers=headers)
+    assert r.status_code == 400
+    r = client.get("/payments/", params={"cursor": asc, "skip": 1}, headers=headers)
+    assert r.status_code == 400
+
+
+def test_cursor_round_trip():
+    ts = datetime(2026, 10, 17, 12, 30, 5, 123456, tzinfo=timezone.utc)
+    assert pagination.decode_cursor(pagination.encode_cursor(ts, 42, True)) == (ts, 42, True)
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.hash import pbkdf2_sha256
+
+from vpn_api import models, passwords
+from vpn_api.database import SessionLocal
+from vpn_api.main import app
+from vpn_api.passwords import HashingSaturated, PasswordHasher
+
+client = TestClient(app)
+
+
+def test_hash_and_verify_in_process_pool():
+    hasher = PasswordHasher(workers=1, max_queue=4)
+    try:
+        hashed = hasher.hash("pool-password")
+        assert hasher.verify("pool-password", hashed)
+        assert not hasher.verify("wrong-password", hashed)
+        assert hasher._executor is not None
+        stats = hasher.stats()
+        assert stats["completed"] == 3 and stats["in_flight"] == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_saturated_queue_fails_fast():
+    hasher = PasswordHasher(workers=0, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(_password):
+        started.set()
+        release.wait(5)
+        return "hash"
+
+    worker = threading.Thread(target=hasher._run, args=(slow, "x"))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(HashingSaturated):
+        hasher.hash("another-password")
+    release.set()
+    worker.join()
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["peak_in_flight"] == 1
+
+
+def test_register_and_login_answer_503_when_saturated(monkeypatch):
+    monkeypatch.setattr(passwords.hasher, "max_queue", 0)
+    r = client.post("/auth/register", json={"email": "busy@example.com", "password": "busypass1"})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+
+
+def test_outdated_hash_is_upgraded_after_login():
+    email = "rehash@example.com"
+    db = SessionLocal()
+    try:
+        weak = pbkdf2_sha256.using(rounds=1000).hash("rehashpass")
+        db.add(models.User(email=email, hashed_password=weak, status="active"))
+        db.commit()
+    finally:
+        db.close()
+
+    r = client.post("/auth/login", json={"email": email, "password": "rehashpass"})
+    assert r.status_code == 200
+
+    db = SessionLocal()
+    try:
+        upgraded = db.query(models.User).filter_by(email=email).one().hashed_password
+    finally:
+        db.close()
+    assert upgraded != weak
+    assert not passwords.needs_rehash(upgraded)
+    assert client.post("/auth/login", json={"email": email, "password": "rehashpass"}).is_success
+
+
+async def test_async_hash_and_verify():
+    hasher = PasswordHasher(workers=1, max_queue=4)
+    try:
+        hashed = await hasher.ahash("async-password")
+        assert await hasher.averify("async-password", hashed)
+        assert hasher.verify("async-password", hashed)
+        assert hasher.stats()["in_flight"] == 0
+    finally:
+        hasher.shutdown()
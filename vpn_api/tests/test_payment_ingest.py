@@ -0,0 +1,139 @@
+import hashlib
+import hmac
+import json
+
+from fastapi.testclient import TestClient
+
+from vpn_api import models, payment_ingest
+from vpn_api.database import Base, SessionLocal, engine
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+
+
+def _login(email, admin=False):
+    r = client.post("/auth/register", json={"email": email, "password": "payments1"})
+    assert r.status_code == 200
+    user_id = r.json()["id"]
+    if admin:
+        client.post(
+            "/auth/admin/promote", params={"user_id": user_id, "secret": "bootstrap-secret"}
+        )
+    token = client.post("/auth/login", json={"email": email, "password": "payments1"})
+    return user_id, {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def _rows(provider):
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Payment).filter_by(provider=provider).all()
+        return {p.provider_payment_id: (p.status.value, p.user_id) for p in rows}
+    finally:
+        db.close()
+
+
+def _signed(body: bytes, secret="whsec-test"):
+    return {
+        payment_ingest.SIGNATURE_HEADER: hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    }
+
+
+def test_webhook_is_idempotent_and_moves_status_forward(monkeypatch):
+    monkeypatch.setattr(payment_ingest, "PAYMENT_WEBHOOK_SECRET", "whsec-test")
+    user_id, _ = _login("ingest-webhook@example.com")
+
+    def send(events):
+        body = json.dumps(events).encode()
+        return client.post("/payments/webhook/acme", content=body, headers=_signed(body))
+
+    first = [
+        {"provider_payment_id": "pi_1", "status": "pending", "amount": "9.99", "user_id": user_id},
+        {"provider_payment_id": "pi_2", "status": "pending", "amount": "5.00"},
+        # repeat within one request: merged, the later status wins if allowed
+        {"provider_payment_id": "pi_2", "status": "completed", "amount": "5.00"},
+    ]
+    r = send(first)
+    assert r.status_code == 200, r.text
+    assert r.json() == {
+        "received": 3,
+        "unique": 2,
+        "applied": 2,
+        "ignored": 1,
+        "rejected": [],
+    }
+    # a provider retry of the same delivery changes nothing
+    r = send(first)
+    assert r.json()["applied"] == 0 and r.json()["ignored"] == 3
+    assert _rows("acme") == {"pi_1": ("pending", user_id), "pi_2": ("completed", None)}
+
+    r = send(
+        [
+            {"provider_payment_id": "pi_1", "status": "completed", "amount": "9.99"},
+            # late retry cannot move a completed payment back to pending
+            {"provider_payment_id": "pi_2", "status": "pending", "amount": "5.00"},
+        ]
+    )
+    assert r.json()["applied"] == 1
+    assert _rows("acme") == {"pi_1": ("completed", user_id), "pi_2": ("completed", None)}
+
+    # a single event object is accepted too
+    r = send({"provider_payment_id": "pi_2", "status": "refunded", "amount": "5.00"})
+    assert r.json()["applied"] == 1
+    assert _rows("acme")["pi_2"] == ("refunded", None)
+
+
+def test_webhook_rejects_bad_signature_and_unconfigured(monkeypatch):
+    body = json.dumps({"provider_payment_id": "x", "status": "pending", "amount": "1"}).encode()
+    monkeypatch.setattr(payment_ingest, "PAYMENT_WEBHOOK_SECRET", "")
+    assert client.post("/payments/webhook/acme", content=body).status_code == 503
+
+    monkeypatch.setattr(payment_ingest, "PAYMENT_WEBHOOK_SECRET", "whsec-test")
+    r = client.post("/payments/webhook/acme", content=body, headers=_signed(body, "wrong"))
+    assert r.status_code == 401
+    assert client.post("/payments/webhook/acme", content=body).status_code == 401
+    bad = b'{"provider_payment_id": "x", "status": "settled", "amount": "1"}'
+    assert (
+        client.post("/payments/webhook/acme", content=bad, headers=_signed(bad)).status_code == 422
+    )
+
+
+def test_admin_import_upserts_in_chunks(monkeypatch):
+    monkeypatch.setattr(payment_ingest, "PAYMENT_INGEST_BATCH", 7)
+    user_id, user_headers = _login("ingest-user@example.com")
+    _, headers = _login("ingest-admin@example.com", admin=True)
+    events = [
+        {
+            "provider_payment_id": f"st_{i}",
+            "status": "pending",
+            "amount": "1.00",
+            "user_id": user_id,
+        }
+        for i in range(30)
+    ]
+    events.append(
+        {"provider_payment_id": "st_x", "status": "pending", "amount": "1", "user_id": 10**9}
+    )
+    payload = {"provider": "settle", "events": events}
+
+    assert client.post("/payments/import", json=payload, headers=user_headers).status_code == 403
+    r = client.post("/payments/import", json=payload, headers=headers)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["applied"], body["ignored"]) == (30, 0)
+    assert body["rejected"] == [
+        {"index": 30, "provider_payment_id": "st_x", "error": "unknown user_id"}
+    ]
+
+    for e in events:
+        e["status"] = "completed"
+    r = client.post("/payments/import", json=payload, headers=headers)
+    assert r.json()["applied"] == 30
+    rows = _rows("settle")
+    assert len(rows) == 30 and {s for s, _ in rows.values()} == {"completed"}
+
+    monkeypatch.setattr(payment_ingest, "PAYMENT_INGEST_MAX_EVENTS", 10)
+    assert client.post("/payments/import", json=payload, headers=headers).status_code == 413
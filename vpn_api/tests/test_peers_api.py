@@ -2,6 +2,7 @@ import os
 
 from fastapi.testclient import TestClient
 
+from vpn_api import peers, wg_keys
 from vpn_api.main import app
 
 client = TestClient(app)
@@ -87,7 +88,7 @@ def test_create_self_wg_easy_parses_config(monkeypatch):
     os.environ.setdefault("WG_EASY_PASSWORD", "pw")
 
     # Mock _create_wg_easy_client to return a created client
-    def fake_create(url, pw, name):
+    async def fake_create(url, pw, name):
         return {"publicKey": "PUB_WG_123", "id": "cid123"}
 
     # Mock _get_wg_easy_client_config to return wg-quick text
@@ -97,7 +98,7 @@ def test_create_self_wg_easy_parses_config(monkeypatch):
         b"Endpoint = vpn.example.com:51820\n"
     )
 
-    def fake_get_config(url, pw, client_id):
+    async def fake_get_config(url, pw, client_id):
         return sample_cfg
 
     monkeypatch.setattr("vpn_api.peers._create_wg_easy_client", fake_create)
@@ -130,3 +131,88 @@ def test_create_self_wg_easy_parses_config(monkeypatch):
     assert data.get("wg_private_key") == "PRIVATE_ABC"
     assert data.get("wg_ip") == "10.10.0.99/32"
     assert data.get("allowed_ips") == "0.0.0.0/0"
+
+
+def test_manual_address_change_reserves_the_new_address(monkeypatch):
+    monkeypatch.setenv("WG_KEY_POLICY", "db")
+    resp = client.post(
+        "/auth/register", json={"email": "ipedit@example.com", "password": "testpass123"}
+    )
+    client.post(
+        "/auth/admin/promote", params={"user_id": resp.json()["id"], "secret": "bootstrap-secret"}
+    )
+    login = client.post(
+        "/auth/login", json={"email": "ipedit@example.com", "password": "testpass123"}
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    a = client.post("/vpn_peers/", json={"wg_public_key": "ipedit-a"}, headers=headers).json()
+    b = client.post("/vpn_peers/", json={"wg_public_key": "ipedit-b"}, headers=headers).json()
+    # moving onto an address another peer holds is refused
+    r = client.put(
+        f"/vpn_peers/{a['id']}",
+        json={"wg_public_key": "ipedit-a", "wg_ip": b["wg_ip"]},
+        headers=headers,
+    )
+    assert r.status_code == 409
+
+    # a free address is reserved, and the old one goes back to the pool
+    free = "10.8.0.250/32"
+    r = client.put(
+        f"/vpn_peers/{a['id']}", json={"wg_public_key": "ipedit-a", "wg_ip": free}, headers=headers
+    )
+    assert r.status_code == 200 and r.json()["wg_ip"] == free
+    c = client.post("/vpn_peers/", json={"wg_public_key": "ipedit-c"}, headers=headers).json()
+    assert c["wg_ip"] == a["wg_ip"]
+    r = client.post(
+        "/vpn_peers/", json={"wg_public_key": "ipedit-d", "wg_ip": free}, headers=headers
+    )
+    assert r.status_code == 409
+
+
+def test_wg_easy_addresses_are_reserved_in_the_pool(monkeypatch):
+    deleted = []
+
+    async def fake_creation(user_id, device_name=None):
+        private, public = wg_keys.generate_keypair()
+        meta = {"address": device_name, "allowed_ips": "0.0.0.0/0"}
+        return public, private, f"cid-{device_name}", meta, None
+
+    async def fake_delete(url, password, cid):
+        deleted.append(cid)
+
+    monkeypatch.setattr(peers, "_handle_wg_easy_creation", fake_creation)
+    monkeypatch.setattr(peers, "_delete_wg_easy_client", fake_delete)
+    resp = client.post(
+        "/auth/register", json={"email": "ipmixed@example.com", "password": "testpass123"}
+    )
+    client.post(
+        "/auth/admin/promote", params={"user_id": resp.json()["id"], "secret": "bootstrap-secret"}
+    )
+    login = client.post(
+        "/auth/login", json={"email": "ipmixed@example.com", "password": "testpass123"}
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    # a wg-easy peer inside the pool holds its address against db-policy peers
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    easy = "10.8.0.240/32"
+    r = client.post("/vpn_peers/", json={"device_name": easy}, headers=headers)
+    assert r.status_code == 200, r.text
+    monkeypatch.setenv("WG_KEY_POLICY", "db")
+    r = client.post(
+        "/vpn_peers/", json={"wg_public_key": "ipmixed-a", "wg_ip": easy}, headers=headers
+    )
+    assert r.status_code == 409
+
+    # wg-easy handing out an address the pool already gave away is refused,
+    # and the new remote client is deleted again
+    taken = client.post("/vpn_peers/", json={"wg_public_key": "ipmixed-b"}, headers=headers)
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    r = client.post("/vpn_peers/", json={"device_name": taken.json()["wg_ip"]}, headers=headers)
+    assert r.status_code == 409
+    assert deleted == [f"cid-{taken.json()['wg_ip']}"]
+
+    # addresses outside the pools are not tracked
+    r = client.post("/vpn_peers/", json={"device_name": "10.10.9.9/32"}, headers=headers)
+    assert r.status_code == 200
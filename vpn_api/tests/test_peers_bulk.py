@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+
+from cryptography.fernet import Fernet
+from fastapi.testclient import TestClient
+
+from vpn_api import peers, peers_bulk, wg_host, wg_keys
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+def setup_module():
+    if not os.getenv("CONFIG_ENCRYPTION_KEY"):
+        os.environ["CONFIG_ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+
+def _user(email, admin=False):
+    r = client.post("/auth/register", json={"email": email, "password": "bulkpass1"})
+    assert r.status_code == 200
+    uid = r.json()["id"]
+    if admin:
+        client.post("/auth/admin/promote", params={"user_id": uid, "secret": "bootstrap-secret"})
+    token = client.post("/auth/login", json={"email": email, "password": "bulkpass1"})
+    return uid, {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def _bulk(headers, body):
+    r = client.post("/vpn_peers/bulk", json=body, headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in r.text.splitlines()]
+
+
+def test_bulk_db_policy_one_pass(monkeypatch):
+    monkeypatch.setenv("WG_KEY_POLICY", "db")
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", True)
+    batches = []
+    monkeypatch.setattr(
+        wg_host,
+        "apply_peers",
+        lambda ops: batches.append(ops) or {op.public_key: True for op in ops},
+    )
+    admin_id, headers = _user("bulk-admin@example.com", admin=True)
+    seat_id, _ = _user("bulk-seat@example.com")
+
+    items = [{"device_name": f"laptop-{i}"} for i in range(30)]
+    items += [{"user_id": seat_id}, {"user_id": 999999}]
+    lines = _bulk(headers, {"items": items})
+
+    assert lines[-1] == {"summary": {"created": 31, "failed": 1}}
+    errors = [ln for ln in lines[:-1] if ln["status"] == "error"]
+    assert [(e["index"], e["error"]) for e in errors] == [(31, "user not found")]
+    created = [ln for ln in lines[:-1] if ln["status"] == "created"]
+    assert {ln["user_id"] for ln in created} == {admin_id, seat_id}
+    peers_out = [ln["peer"] for ln in created]
+    assert len({p["wg_ip"] for p in peers_out}) == 31
+    assert all(
+        wg_keys.derive_public_key(p["wg_private_key"]) == p["wg_public_key"] for p in peers_out
+    )
+    # one batched host apply for the whole request
+    assert len(batches) == 1 and len(batches[0]) == 31
+    assert all(ln["host_applied"] for ln in created)
+
+
+def test_bulk_wg_easy_bounded_fanout_and_per_item_errors(monkeypatch):
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    monkeypatch.setattr(peers_bulk, "WG_BULK_CONCURRENCY", 3)
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_creation(user_id, device_name=None):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if device_name == "broken":
+            raise RuntimeError("remote 500")
+        private, public = wg_keys.generate_keypair()
+        n = int(device_name.split("-")[1])
+        meta = {"address": f"10.77.0.{n + 2}/32", "allowed_ips": "0.0.0.0/0"}
+        return public, private, f"bulk-cid-{n}", meta, f"[Interface]\nPrivateKey = {private}\n"
+
+    monkeypatch.setattr(peers, "_handle_wg_easy_creation", fake_creation)
+    _, headers = _user("bulk-easy@example.com", admin=True)
+    items = [{"device_name": f"dev-{i}"} for i in range(10)] + [{"device_name": "broken"}]
+    lines = _bulk(headers, {"items": items})
+
+    assert lines[-1] == {"summary": {"created": 10, "failed": 1}}
+    assert in_flight["max"] == 3
+    created = [ln["peer"] for ln in lines if ln.get("status") == "created"]
+    assert sorted(p["wg_ip"] for p in created) == sorted(f"10.77.0.{i + 2}/32" for i in range(10))
+
+
+def test_bulk_insert_failure_rolls_back_and_compensates(monkeypatch):
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    private, public = wg_keys.generate_keypair()
+    deleted = []
+
+    async def same_key_creation(user_id, device_name=None):
+        n = int(device_name.split("-")[1])
+        meta = {"address": f"10.78.0.{n + 2}/32"}
+        # duplicate public keys violate the unique constraint on insert
+        return public, private, f"dup-{n}", meta, None
+
+    async def fake_delete(url, password, cid):
+        deleted.append(cid)
+
+    monkeypatch.setattr(peers, "_handle_wg_easy_creation", same_key_creation)
+    monkeypatch.setattr(peers, "_delete_wg_easy_client", fake_delete)
+    _, headers = _user("bulk-dup@example.com", admin=True)
+    lines = _bulk(headers, {"items": [{"device_name": "d-0"}, {"device_name": "d-1"}]})
+
+    assert lines[-1] == {"summary": {"created": 0, "failed": 2}}
+    assert sorted(deleted) == ["dup-0", "dup-1"]
+
+
+def test_bulk_wg_easy_deletes_clients_it_cannot_use(monkeypatch):
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    deleted = []
+
+    async def addressless_creation(user_id, device_name=None):
+        private, public = wg_keys.generate_keypair()
+        meta = {} if device_name == "no-address" else {"address": "10.79.0.2/32"}
+        return public, private, f"cid-{device_name}", meta, None
+
+    async def fake_delete(url, password, cid):
+        deleted.append(cid)
+
+    monkeypatch.setattr(peers, "_handle_wg_easy_creation", addressless_creation)
+    monkeypatch.setattr(peers, "_delete_wg_easy_client", fake_delete)
+    _, headers = _user("bulk-orphan@example.com", admin=True)
+    lines = _bulk(headers, {"items": [{"device_name": "ok"}, {"device_name": "no-address"}]})
+
+    assert lines[-1] == {"summary": {"created": 1, "failed": 1}}
+    assert deleted == ["cid-no-address"]
+
+
+def test_bulk_wg_easy_reserves_addresses_in_the_pool(monkeypatch):
+    _, headers = _user("bulk-mixed@example.com", admin=True)
+    monkeypatch.setenv("WG_KEY_POLICY", "db")
+    held = _bulk(headers, {"items": [{}]})[0]["peer"]["wg_ip"]
+    deleted = []
+
+    async def fake_creation(user_id, device_name=None):
+        private, public = wg_keys.generate_keypair()
+        return public, private, f"cid-{device_name}", {"address": device_name}, None
+
+    async def fake_delete(url, password, cid):
+        deleted.append(cid)
+
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    monkeypatch.setattr(peers, "_handle_wg_easy_creation", fake_creation)
+    monkeypatch.setattr(peers, "_delete_wg_easy_client", fake_delete)
+    free = "10.8.0.241/32"
+    lines = _bulk(headers, {"items": [{"device_name": held}, {"device_name": free}]})
+
+    assert lines[-1] == {"summary": {"created": 1, "failed": 1}}
+    assert deleted == [f"cid-{held}"]
+    # the created wg-easy peer's address is no longer handed out by the pool
+    monkeypatch.setenv("WG_KEY_POLICY", "db")
+    r = client.post(
+        "/vpn_peers/", json={"wg_public_key": "bulk-mixed-x", "wg_ip": free}, headers=headers
+    )
+    assert r.status_code == 409
+
+
+def test_bulk_without_encryption_key_fails_before_provisioning(monkeypatch):
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    monkeypatch.delenv("CONFIG_ENCRYPTION_KEY")
+    calls = []
+
+    async def creation(user_id, device_name=None):
+        calls.append(device_name)
+
+    monkeypatch.setattr(peers, "_handle_wg_easy_creation", creation)
+    _, headers = _user("bulk-nokey@example.com", admin=True)
+    lines = _bulk(headers, {"items": [{"device_name": "a"}, {"device_name": "b"}]})
+
+    assert lines[-1] == {"summary": {"created": 0, "failed": 2}}
+    assert {ln["error"] for ln in lines[:-1]} == {"CONFIG_ENCRYPTION_KEY is not set"}
+    assert calls == []
+
+
+def test_bulk_requires_admin():
+    _, headers = _user("bulk-nonadmin@example.com")
+    r = client.post("/vpn_peers/bulk", json={"items": [{}]}, headers=headers)
+    assert r.status_code == 403
@@ -1,7 +1,9 @@
+import asyncio
+
 import pytest
 
 from vpn_api import models, peers, schemas
-from vpn_api.database import Base, SessionLocal, engine
+from vpn_api.database import AsyncSessionLocal, Base, SessionLocal, engine
 
 
 def setup_module():
@@ -9,6 +11,13 @@ def setup_module():
     Base.metadata.create_all(bind=engine)
 
 
+async def _create_peer(payload, user, db=None):
+    if db is not None:
+        return await peers.create_peer(payload, db=db, current_user=user)
+    async with AsyncSessionLocal() as db:
+        return await peers.create_peer(payload, db=db, current_user=user)
+
+
 def test_create_peer_wg_easy_success(monkeypatch):
     calls = {}
     # Ensure code chooses wg-easy path
@@ -16,11 +25,11 @@ def test_create_peer_wg_easy_success(monkeypatch):
     monkeypatch.setenv("WG_EASY_URL", "http://127.0.0.1:51821")
     monkeypatch.setenv("WG_EASY_PASSWORD", "pass")
 
-    def fake_create(url, password, name):
+    async def fake_create(url, password, name):
         calls["created"] = {"id": "cid-1", "publicKey": "pubkey"}
         return calls["created"]
 
-    def fake_delete(url, password, cid):
+    async def fake_delete(url, password, cid):
         calls.setdefault("deleted", []).append(cid)
 
     monkeypatch.setattr(peers, "_create_wg_easy_client", fake_create)
@@ -37,8 +46,8 @@ def test_create_peer_wg_easy_success(monkeypatch):
         user_id=user.id, wg_public_key="", wg_ip="10.0.0.5", allowed_ips="10.0.0.5/32"
     )
 
-    # call create_peer (sync) as if current_user is same user
-    peer = peers.create_peer(payload, db=db, current_user=user)
+    # call create_peer directly as if current_user is same user
+    peer = asyncio.run(_create_peer(payload, user))
     assert peer.wg_client_id == "cid-1"
     assert peer.wg_public_key == "pubkey"
 
@@ -50,10 +59,10 @@ def test_create_peer_wg_easy_compensate_on_db_failure(monkeypatch):
     monkeypatch.setenv("WG_EASY_URL", "http://127.0.0.1:51821")
     monkeypatch.setenv("WG_EASY_PASSWORD", "pass")
 
-    def fake_create(url, password, name):
+    async def fake_create(url, password, name):
         return created
 
-    def fake_delete(url, password, cid):
+    async def fake_delete(url, password, cid):
         deleted.append(cid)
 
     monkeypatch.setattr(peers, "_create_wg_easy_client", fake_create)
@@ -70,13 +79,57 @@ def test_create_peer_wg_easy_compensate_on_db_failure(monkeypatch):
     )
 
     # monkeypatch commit to raise to simulate DB failure
-    def bad_commit():
+    async def bad_commit():
         raise RuntimeError("db commit failed")
 
-    db.commit = bad_commit
+    async def run():
+        async with AsyncSessionLocal() as adb:
+            adb.commit = bad_commit
+            await _create_peer(payload, user, db=adb)
 
     with pytest.raises(RuntimeError):
-        peers.create_peer(payload, db=db, current_user=user)
+        asyncio.run(run())
 
     # ensure compensation attempted: remote client deleted
     assert deleted == [created["id"]]
+
+
+def test_create_peer_wg_easy_concurrent_calls_overlap(monkeypatch):
+    # Remote calls are awaited on the loop, so concurrent creations must overlap
+    # instead of queueing behind one another.
+    monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+    monkeypatch.setenv("WG_EASY_URL", "http://127.0.0.1:51821")
+    monkeypatch.setenv("WG_EASY_PASSWORD", "pass")
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_create(url, password, name):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.05)
+        in_flight["now"] -= 1
+        return {"id": f"cid-{name}", "publicKey": f"pub-{name}"}
+
+    async def fake_get_config(url, password, cid):
+        raise RuntimeError("no config")
+
+    monkeypatch.setattr(peers, "_create_wg_easy_client", fake_create)
+    monkeypatch.setattr(peers, "_get_wg_easy_client_config", fake_get_config)
+
+    db = SessionLocal()
+    user = models.User(email="concurrent@example.test")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    async def run():
+        calls = []
+        for i in range(10):
+            payload = schemas.VpnPeerCreate(
+                user_id=user.id, wg_ip=f"10.0.1.{i + 10}/32", device_name=f"dev-{i}"
+            )
+            calls.append(_create_peer(payload, user))
+        return await asyncio.gather(*calls)
+
+    created = asyncio.run(run())
+    assert len({p.wg_client_id for p in created}) == 10
+    assert in_flight["max"] == 10
@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from vpn_api import models
+from vpn_api.cache import principal_cache
+from vpn_api.database import SessionLocal, engine
+from vpn_api.main import app
+from vpn_api.principals import load_principal
+
+client = TestClient(app)
+
+
+def _user(email):
+    r = client.post("/auth/register", json={"email": email, "password": "princpass1"})
+    assert r.status_code == 200
+    token = client.post("/auth/login", json={"email": email, "password": "princpass1"})
+    return r.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def test_authenticated_requests_skip_user_lookup():
+    _uid, headers = _user("principal-hot@example.com")
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    statements = []
+
+    def _before(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        for _ in range(5):
+            r = client.get("/auth/me", headers=headers)
+            assert r.json()["email"] == "principal-hot@example.com"
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    assert not [s for s in statements if "FROM users" in s]
+
+
+def test_promotion_and_blocking_take_effect_immediately():
+    uid, headers = _user("principal-change@example.com")
+    assert client.get("/admin/cache", headers=headers).status_code == 403
+    assert principal_cache.get("principal-change@example.com") is not None
+
+    client.post("/auth/admin/promote", params={"user_id": uid, "secret": "bootstrap-secret"})
+    assert client.get("/admin/cache", headers=headers).status_code == 200
+
+    db = SessionLocal()
+    try:
+        db.get(models.User, uid).status = models.UserStatus.blocked
+        db.commit()
+    finally:
+        db.close()
+    r = client.get("/auth/me", headers=headers)
+    assert r.status_code == 403
+    assert r.json()["detail"] == "User not active"
+
+
+def test_cached_principal_can_be_modified():
+    _uid, headers = _user("principal-write@example.com")
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    db = SessionLocal()
+    try:
+        user = load_principal(db, "principal-write@example.com")
+        assert user in db
+        user.is_admin = True
+        db.commit()
+    finally:
+        db.close()
+    assert principal_cache.get("principal-write@example.com") is None
+    assert client.get("/auth/me", headers=headers).json()["is_admin"] is True
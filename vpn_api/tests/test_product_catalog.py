@@ -0,0 +1,109 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from vpn_api import models, product_catalog
+from vpn_api.database import AsyncSessionLocal, engine
+from vpn_api.iap_validator import ProductIdToTariffMapper
+from vpn_api.main import app
+
+client = TestClient(app)
+
+
+def _admin_headers(email):
+    r = client.post("/auth/register", json={"email": email, "password": "catalogpass"})
+    assert r.status_code == 200
+    client.post(
+        "/auth/admin/promote", params={"user_id": r.json()["id"], "secret": "bootstrap-secret"}
+    )
+    token = client.post("/auth/login", json={"email": email, "password": "catalogpass"})
+    return {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+
+def _tariff(days=30):
+    r = client.post(
+        "/tariffs/", json={"name": f"cat-{time.time()}", "price": 5, "duration_days": days}
+    )
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def test_admin_edits_are_visible_without_queries():
+    headers = _admin_headers("catalog-admin@example.com")
+    monthly, annual = _tariff(30), _tariff(365)
+
+    r = client.put(f"/tariffs/{monthly}/products/cat.monthly", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["duration_days"] == 30
+    assert client.put(f"/tariffs/{annual}/products/cat.annual", headers=headers).status_code == 200
+
+    queries = []
+
+    def _before(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        assert ProductIdToTariffMapper.get_tariff_id("cat.monthly") == monthly
+        assert ProductIdToTariffMapper.get_duration_days(annual) == 365
+        assert ProductIdToTariffMapper.get_tariff_id("cat.unknown") is None
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    assert queries == []
+
+    # a duration change and a product move are swapped in on commit
+    r = client.patch(f"/tariffs/{annual}", json={"duration_days": 366}, headers=headers)
+    assert r.status_code == 200 and r.json()["duration_days"] == 366
+    assert ProductIdToTariffMapper.get_duration_days(annual) == 366
+    client.put(f"/tariffs/{annual}/products/cat.monthly", headers=headers)
+    assert ProductIdToTariffMapper.get_tariff_id("cat.monthly") == annual
+    assert ProductIdToTariffMapper.get_duration_days(monthly) == 0
+
+    listed = {p["product_id"]: p for p in client.get("/tariffs/products").json()}
+    assert listed["cat.monthly"]["tariff_id"] == annual
+
+    assert client.delete("/tariffs/products/cat.monthly", headers=headers).status_code == 200
+    assert ProductIdToTariffMapper.get_tariff_id("cat.monthly") is None
+    # deleting the tariff drops its remaining products
+    assert client.delete(f"/tariffs/{annual}", headers=headers).status_code == 200
+    assert "cat.annual" not in ProductIdToTariffMapper.get_product_ids()
+
+
+def test_product_mapping_requires_admin():
+    r = client.post(
+        "/auth/register", json={"email": "catalog-user@example.com", "password": "catalogpass"}
+    )
+    assert r.status_code == 200
+    token = client.post(
+        "/auth/login", json={"email": "catalog-user@example.com", "password": "catalogpass"}
+    )
+    headers = {"Authorization": f"Bearer {token.json()['access_token']}"}
+    tariff_id = _tariff()
+    r = client.put(f"/tariffs/{tariff_id}/products/cat.user", headers=headers)
+    assert r.status_code == 403
+    r = client.patch(f"/tariffs/{tariff_id}", json={"duration_days": 1}, headers=headers)
+    assert r.status_code == 403
+    assert ProductIdToTariffMapper.get_tariff_id("cat.user") is None
+
+
+@pytest.mark.asyncio
+async def test_async_commit_reloads_the_snapshot():
+    tariff_id = _tariff(90)
+    before = product_catalog.catalog()
+    async with AsyncSessionLocal() as db:
+        db.add(models.IapProduct(product_id="cat.async", tariff_id=tariff_id))
+        await db.commit()
+    after = product_catalog.catalog()
+    assert after is not before
+    assert after.get("cat.async").duration_days == 90
+    # the previous snapshot is never mutated
+    assert before.get("cat.async") is None
+
+
+def test_older_reload_does_not_replace_newer_snapshot(monkeypatch):
+    current = product_catalog.reload()
+    # a reload that took its ticket before the current snapshot was installed
+    monkeypatch.setattr(product_catalog, "_tickets", iter([0]))
+    assert product_catalog.reload() is current
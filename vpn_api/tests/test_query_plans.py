@@ -0,0 +1,169 @@
+"""Query-plan regression tests for the hot per-user lookups.
+
+Each hot statement is built by the same code the endpoints use, run through
+``EXPLAIN`` against a seeded dataset and rejected if it reads a whole table.
+On SQLite that is a ``SCAN <table>`` without an index (or a temporary b-tree
+sort where the index should deliver the order). On Postgres the check runs
+with ``enable_seqscan`` off, so any ``Seq Scan`` left in the plan means no
+usable index exists; set ``DATABASE_URL`` to a migrated Postgres database to
+run it there.
+"""
+
+import json
+import re
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import ClauseElement, Executable, delete, insert, select, text
+from sqlalchemy.ext.compiler import compiles
+
+from vpn_api import models
+from vpn_api.database import Base, engine
+from vpn_api.entitlements import current_subscription_stmt
+from vpn_api.pagination import _keyset, encode_cursor
+from vpn_api.peers import latest_active_peer_stmt
+from vpn_api.sweeper import lapsed_subscriptions_stmt
+
+SEED_USERS = 200
+# Large per-user tables; small lookup tables (tariffs) may legitimately be scanned.
+WATCHED_TABLES = {"users", "user_tariffs", "vpn_peers", "payments"}
+_USER_EMAIL = "plans-{}@example.test"
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    if compiler.dialect.name == "postgresql":
+        prefix = "EXPLAIN (FORMAT JSON) "
+    else:
+        prefix = "EXPLAIN QUERY PLAN "
+    return prefix + compiler.process(element.stmt, **kw)
+
+
+def _pg_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _pg_nodes(child)
+
+
+def plan_problems(conn, stmt, ordered: bool = False) -> list[str]:
+    """Return the full scans (and, if ``ordered``, sorts) in ``stmt``'s plan."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        raw = conn.execute(Explain(stmt)).scalar()
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+        problems = [
+            f"Seq Scan on {n['Relation Name']}"
+            for n in _pg_nodes(plan)
+            if n["Node Type"] == "Seq Scan" and n["Relation Name"] in WATCHED_TABLES
+        ]
+        if ordered:
+            problems += ["Sort" for n in _pg_nodes(plan) if n["Node Type"] == "Sort"]
+        return problems
+    details = [row[-1] for row in conn.execute(Explain(stmt))]
+    problems = [d for d in details if (m := re.match(r"SCAN (\w+)$", d)) and m[1] in WATCHED_TABLES]
+    if ordered:
+        problems += [d for d in details if d.startswith("USE TEMP B-TREE FOR ORDER BY")]
+    return problems
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """Seed users with subscription history, peers and payments; yield one user id.
+
+    The rows are deleted afterwards, so the test can be rerun against the same
+    (Postgres) database.
+    """
+    Base.metadata.create_all(bind=engine)
+    now = datetime.now(UTC)
+    with engine.begin() as conn:
+        tariff_id = conn.execute(
+            insert(models.Tariff).values(name="plans-tariff", duration_days=30, price=1)
+        ).inserted_primary_key[0]
+        conn.execute(
+            insert(models.User),
+            [{"email": _USER_EMAIL.format(i), "status": "active"} for i in range(SEED_USERS)],
+        )
+        user_ids = list(
+            conn.execute(
+                select(models.User.id).where(models.User.email.like("plans-%@example.test"))
+            ).scalars()
+        )
+        tariffs, peers, payments = [], [], []
+        for n, uid in enumerate(user_ids):
+            for k in range(4):
+                started = now - timedelta(days=30 * (4 - k))
+                tariffs.append(
+                    {
+                        "user_id": uid,
+                        "tariff_id": tariff_id,
+                        "started_at": started,
+                        "ended_at": started + timedelta(days=30 + (k == 3)),
+                        "status": "active" if k == 3 else "expired",
+                    }
+                )
+            for k in range(3):
+                peers.append(
+                    {
+                        "user_id": uid,
+                        "wg_private_key": f"plans-priv-{uid}-{k}",
+                        "wg_public_key": f"plans-pub-{uid}-{k}",
+                        "wg_ip": f"10.92.{n}.{k + 2}/32",
+                        "active": k == 2,
+                        "created_at": now - timedelta(days=3 - k),
+                    }
+                )
+            payments += [
+                {"user_id": uid, "amount": 1, "currency": "USD", "created_at": now - timedelta(k)}
+                for k in range(5)
+            ]
+        conn.execute(insert(models.UserTariff), tariffs)
+        conn.execute(insert(models.VpnPeer), peers)
+        conn.execute(insert(models.Payment), payments)
+        conn.execute(text("ANALYZE"))
+    try:
+        yield user_ids[len(user_ids) // 2]
+    finally:
+        with engine.begin() as conn:
+            for model in (models.Payment, models.VpnPeer, models.UserTariff):
+                conn.execute(delete(model).where(model.user_id.in_(user_ids)))
+            conn.execute(delete(models.User).where(models.User.id.in_(user_ids)))
+            conn.execute(delete(models.Tariff).where(models.Tariff.id == tariff_id))
+
+
+def _hot_queries(user_id: int, dialect: str):
+    now = datetime.now(UTC)
+    pay = select(models.Payment).where(models.Payment.user_id == user_id)
+    peers = select(models.VpnPeer).where(models.VpnPeer.user_id == user_id)
+    cursor = encode_cursor(now - timedelta(days=2), 1, descending=True)
+    return {
+        "current_subscription": (current_subscription_stmt(user_id, now), False),
+        "latest_active_peer": (latest_active_peer_stmt(user_id), True),
+        "payments_page": (_keyset(pay, models.Payment, 100, None, False, dialect), True),
+        "payments_page_cursor": (_keyset(pay, models.Payment, 100, cursor, True, dialect), True),
+        "peers_page": (_keyset(peers, models.VpnPeer, 100, None, True, dialect), True),
+        "expiry_sweep": (lapsed_subscriptions_stmt(now, 500), True),
+    }
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "current_subscription",
+        "latest_active_peer",
+        "payments_page",
+        "payments_page_cursor",
+        "peers_page",
+        "expiry_sweep",
+    ],
+)
+def test_hot_query_uses_an_index(seeded, name):
+    with engine.begin() as conn:
+        stmt, ordered = _hot_queries(seeded, conn.dialect.name)[name]
+        assert plan_problems(conn, stmt, ordered) == []
@@ -0,0 +1,243 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from vpn_api import models, reconciler, wg_host, wg_keys
+from vpn_api.database import Base, SessionLocal, engine
+from vpn_api.main import app
+from vpn_api.reconciler import Reconciler
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+
+
+def _make_peers(email, specs):
+    """Insert peers described by (active, client_id, allowed_ips); return their public keys."""
+    db = SessionLocal()
+    try:
+        user = models.User(email=email)
+        db.add(user)
+        db.flush()
+        keys = []
+        old = datetime.now() - timedelta(hours=1)
+        for i, (active, client_id, allowed) in enumerate(specs):
+            private, public = wg_keys.generate_keypair()
+            db.add(
+                models.VpnPeer(
+                    user_id=user.id,
+                    wg_private_key=private,
+                    wg_public_key=public,
+                    wg_client_id=client_id,
+                    wg_ip=f"10.90.{user.id % 250}.{i + 2}/32",
+                    allowed_ips=allowed,
+                    active=active,
+                    updated_at=old,
+                )
+            )
+            keys.append(public)
+        db.commit()
+        return keys
+    finally:
+        db.close()
+
+
+def test_host_diff_applies_only_deltas(monkeypatch):
+    keys = _make_peers(
+        "reconcile-host@example.test",
+        [
+            (True, None, "10.90.0.2/32"),  # missing on host -> add
+            (True, None, "10.90.0.3/32"),  # in sync
+            (True, None, "10.90.0.4/32"),  # wrong allowed ips -> add (update)
+            (False, None, "10.90.0.5/32"),  # deactivated but still on host -> remove
+        ],
+    )
+    orphan = wg_keys.generate_keypair()[1]
+    host = {keys[1]: "10.90.0.3/32", keys[2]: "10.99.0.1/32", keys[3]: "10.90.0.5/32", orphan: ""}
+    applied = []
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", True)
+    monkeypatch.setattr(wg_host, "dump_peers", lambda iface=None: dict(host))
+    monkeypatch.setattr(
+        wg_host,
+        "apply_peers",
+        lambda ops: applied.extend(ops) or {op.public_key: True for op in ops},
+    )
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: None)
+
+    r = Reconciler()
+    dry = asyncio.run(r.run_once(dry_run=True))
+    assert dry.full_sync and dry.host_checked
+    assert {keys[0], keys[2]} <= set(dry.host_add)
+    assert keys[1] not in dry.host_add
+    assert dry.host_remove == [keys[3]]
+    assert dry.host_orphans == [orphan]
+    assert applied == []
+
+    report = asyncio.run(r.run_once())
+    mine = {op.public_key: op.op for op in applied if op.public_key in [*keys, orphan]}
+    assert mine == {keys[0]: "add", keys[2]: "add", keys[3]: "remove"}
+    assert report.applied[keys[3]] is True
+
+
+def test_incremental_pass_reads_only_changed_rows(monkeypatch):
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", False)
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: None)
+    monkeypatch.setattr(reconciler, "WG_RECONCILE_OVERLAP", 0)
+    keys = _make_peers("reconcile-incr@example.test", [(True, None, None)] * 3)
+
+    r = Reconciler(full_every=1000)
+    first = asyncio.run(r.run_once(dry_run=True))
+    assert first.full_sync and first.rows_read >= 3
+
+    db = SessionLocal()
+    try:
+        peer = db.query(models.VpnPeer).filter(models.VpnPeer.wg_public_key == keys[0]).one()
+        peer.active = False
+        peer.updated_at = datetime.now() + timedelta(hours=1)
+        db.commit()
+    finally:
+        db.close()
+
+    mark = r._high_water
+    second = asyncio.run(r.run_once(dry_run=True))
+    assert not second.full_sync
+    # the changed row, plus any row stamped exactly at the (inclusive) mark
+    db = SessionLocal()
+    try:
+        at_mark = db.query(models.VpnPeer).filter(models.VpnPeer.updated_at >= mark).count()
+    finally:
+        db.close()
+    assert second.rows_read == at_mark
+    assert not next(s for s in r._known.values() if s.public_key == keys[0]).active
+
+
+def test_wg_easy_diff(monkeypatch):
+    _make_peers(
+        "reconcile-easy@example.test",
+        [(True, "easy-live", None), (False, "easy-dead", None), (True, "easy-lost", None)],
+    )
+    deleted = []
+
+    class FakeClient:
+        async def list_clients(self):
+            return [{"id": "easy-live"}, {"id": "easy-dead"}, {"id": "easy-unknown"}]
+
+        async def delete_client(self, cid):
+            deleted.append(cid)
+
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", False)
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: FakeClient())
+    report = asyncio.run(Reconciler().run_once())
+    assert report.wg_easy_remove == ["easy-dead"]
+    assert report.wg_easy_orphans == ["easy-unknown"]
+    assert "easy-lost" in report.wg_easy_missing
+    # unknown clients are only reported unless pruning is enabled
+    assert deleted == ["easy-dead"]
+
+
+def test_incremental_pass_forgets_deleted_peers(monkeypatch):
+    keys = _make_peers("reconcile-deleted@example.test", [(True, None, "10.90.2.2/32")] * 2)
+    host = {}
+    applied = []
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", True)
+    monkeypatch.setattr(wg_host, "dump_peers", lambda iface=None: dict(host))
+    monkeypatch.setattr(
+        wg_host,
+        "apply_peers",
+        lambda ops: applied.extend(ops) or {op.public_key: True for op in ops},
+    )
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: None)
+
+    r = Reconciler(full_every=1000)
+    first = asyncio.run(r.run_once())
+    assert first.full_sync and set(keys) <= set(first.host_add)
+    host.update(dict.fromkeys(keys, "10.90.2.2/32"))
+
+    db = SessionLocal()
+    try:
+        db.delete(db.query(models.VpnPeer).filter_by(wg_public_key=keys[0]).one())
+        db.commit()
+    finally:
+        db.close()
+    # the device's host peer is gone too (delete_peer removes it best-effort)
+    del host[keys[0]]
+
+    applied.clear()
+    second = asyncio.run(r.run_once())
+    assert not second.full_sync
+    assert keys[0] not in second.host_add
+    assert keys[0] not in {op.public_key for op in applied}
+    assert all(s.public_key != keys[0] for s in r._known.values())
+
+
+def test_dry_run_endpoint_requires_admin(monkeypatch):
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", False)
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: None)
+    client = TestClient(app)
+
+    def login(email):
+        r = client.post("/auth/register", json={"email": email, "password": "reconcile1"})
+        assert r.status_code == 200
+        token = client.post("/auth/login", json={"email": email, "password": "reconcile1"})
+        return r.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+    _, user_headers = login("reconcile-user@example.com")
+    assert client.get("/admin/reconcile", headers=user_headers).status_code == 403
+
+    admin_id, headers = login("reconcile-admin@example.com")
+    client.post("/auth/admin/promote", params={"user_id": admin_id, "secret": "bootstrap-secret"})
+    r = client.get("/admin/reconcile", headers=headers)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["dry_run"] is True
+    assert body["host_checked"] is False
+
+
+def test_wg_easy_peers_on_the_host_are_not_orphans(monkeypatch):
+    live, dead = _make_peers(
+        "reconcile-shared@example.test",
+        [(True, "shared-live", "10.90.1.2/32"), (False, "shared-dead", "10.90.1.3/32")],
+    )
+    listed_only = wg_keys.generate_keypair()[1]  # a wg-easy client the database never saw
+    orphan = wg_keys.generate_keypair()[1]
+    host = {live: "10.90.1.2/32", dead: "10.90.1.3/32", listed_only: "", orphan: ""}
+    applied = []
+
+    class FakeClient:
+        async def list_clients(self):
+            return [
+                {"id": "shared-live", "publicKey": live},
+                {"id": "shared-dead", "publicKey": dead},
+                {"id": "shared-unknown", "publicKey": listed_only},
+            ]
+
+        async def delete_client(self, cid):
+            pass
+
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", True)
+    monkeypatch.setattr(wg_host, "dump_peers", lambda iface=None: dict(host))
+    monkeypatch.setattr(
+        wg_host,
+        "apply_peers",
+        lambda ops: applied.extend(ops) or {op.public_key: True for op in ops},
+    )
+    monkeypatch.setattr(reconciler, "WG_RECONCILE_PRUNE", True)
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: FakeClient())
+
+    report = asyncio.run(Reconciler().run_once())
+    assert report.host_orphans == [orphan]
+    removed = {op.public_key for op in applied if op.op == "remove"}
+    assert orphan in removed
+    assert not removed & {live, dead, listed_only}
+
+    # when wg-easy cannot be listed, unknown host keys are reported, never pruned
+    class BrokenClient(FakeClient):
+        async def list_clients(self):
+            raise RuntimeError("wg-easy down")
+
+    applied.clear()
+    monkeypatch.setattr(reconciler, "get_shared_client", lambda: BrokenClient())
+    report = asyncio.run(Reconciler().run_once())
+    assert set(report.host_orphans) == {listed_only, orphan}
+    assert not {op.public_key for op in applied if op.op == "remove"} & {listed_only, orphan}
@@ -0,0 +1,162 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from vpn_api import models, sweeper, wg_host, wg_keys
+from vpn_api.database import Base, SessionLocal, engine
+from vpn_api.ip_pool import allocate_ip
+from vpn_api.main import app
+from vpn_api.sweeper import SubscriptionSweeper
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+
+
+def _make_user(email, ended, peers):
+    """Insert a user with subscriptions ending at ``ended`` and peers (active, client_id)."""
+    db = SessionLocal()
+    try:
+        tariff = models.Tariff(name=f"sweep-{email}", duration_days=30, price=1)
+        user = models.User(email=email)
+        db.add_all([tariff, user])
+        db.flush()
+        now = datetime.now(UTC)
+        for i, end in enumerate(ended):
+            db.add(
+                models.UserTariff(
+                    user_id=user.id,
+                    tariff_id=tariff.id,
+                    started_at=now - timedelta(days=60 - i),
+                    ended_at=end,
+                    status="active",
+                )
+            )
+        keys = []
+        for i, (active, client_id) in enumerate(peers):
+            private, public = wg_keys.generate_keypair()
+            db.add(
+                models.VpnPeer(
+                    user_id=user.id,
+                    wg_private_key=private,
+                    wg_public_key=public,
+                    wg_client_id=client_id,
+                    wg_ip=f"10.91.{user.id % 250}.{i + 2}/32",
+                    active=active,
+                )
+            )
+            keys.append(public)
+        db.commit()
+        return user.id, keys
+    finally:
+        db.close()
+
+
+def _state(user_id):
+    db = SessionLocal()
+    try:
+        statuses = sorted(t.status for t in db.query(models.UserTariff).filter_by(user_id=user_id))
+        active = [p.active for p in db.query(models.VpnPeer).filter_by(user_id=user_id)]
+        return statuses, active
+    finally:
+        db.close()
+
+
+def test_sweep_expires_in_batches_and_revokes_peers(monkeypatch):
+    past = datetime.now(UTC) - timedelta(days=1)
+    lapsed, lapsed_keys = _make_user(
+        "sweep-lapsed@example.test", [past], [(True, None), (True, None), (True, "easy-sweep-1")]
+    )
+    renewed, _ = _make_user(
+        "sweep-renewed@example.test", [past, datetime.now(UTC) + timedelta(days=29)], [(True, None)]
+    )
+    applied, deleted = [], []
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", True)
+    monkeypatch.setattr(
+        wg_host,
+        "apply_peers",
+        lambda ops: applied.append(list(ops)) or {op.public_key: True for op in ops},
+    )
+
+    class FakeClient:
+        async def delete_client(self, cid):
+            deleted.append(cid)
+
+    monkeypatch.setattr(sweeper, "get_shared_client", lambda: FakeClient())
+
+    report = asyncio.run(SubscriptionSweeper(batch=1).run_once())
+    assert report.leader
+    assert report.subscriptions_expired >= 2
+    assert report.batches >= report.subscriptions_expired
+    assert _state(lapsed) == (["expired"], [False, False, False])
+    # a user with a current renewal keeps their peers
+    assert _state(renewed) == (["active", "expired"], [True])
+
+    # host peers go out in one batched operation, wg-easy clients are deleted
+    assert len(applied) == 1
+    removed = {op.public_key for op in applied[0]}
+    assert {op.op for op in applied[0]} == {"remove"}
+    assert set(lapsed_keys[:2]) <= removed and lapsed_keys[2] not in removed
+    assert "easy-sweep-1" in deleted
+
+    again = asyncio.run(SubscriptionSweeper().run_once())
+    assert again.subscriptions_expired == 0 and again.peers_deactivated == 0
+
+
+def test_revoked_peers_return_their_address_to_the_pool(monkeypatch):
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", False)
+    monkeypatch.setattr(sweeper, "get_shared_client", lambda: None)
+    user_id, _ = _make_user(
+        "sweep-release@example.test", [datetime.now(UTC) - timedelta(days=1)], [(True, None)]
+    )
+    db = SessionLocal()
+    try:
+        peer = db.query(models.VpnPeer).filter_by(user_id=user_id).one()
+        peer.wg_ip = allocate_ip(db)
+        db.commit()
+        address = peer.wg_ip
+    finally:
+        db.close()
+
+    asyncio.run(SubscriptionSweeper().run_once())
+
+    db = SessionLocal()
+    try:
+        peer = db.query(models.VpnPeer).filter_by(user_id=user_id).one()
+        assert (peer.active, peer.wg_ip) == (False, None)
+        row = db.query(models.IpAllocation).filter_by(address=address.split("/")[0]).one()
+        assert not row.in_use
+    finally:
+        db.close()
+
+
+def test_sweep_endpoint_requires_admin(monkeypatch):
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", False)
+    monkeypatch.setattr(sweeper, "get_shared_client", lambda: None)
+    client = TestClient(app)
+
+    def login(email):
+        r = client.post("/auth/register", json={"email": email, "password": "sweeper1"})
+        assert r.status_code == 200
+        token = client.post("/auth/login", json={"email": email, "password": "sweeper1"})
+        return r.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+    _, user_headers = login("sweep-user@example.com")
+    assert client.post("/admin/subscriptions/sweep", headers=user_headers).status_code == 403
+
+    admin_id, headers = login("sweep-admin@example.com")
+    client.post("/auth/admin/promote", params={"user_id": admin_id, "secret": "bootstrap-secret"})
+    r = client.post("/admin/subscriptions/sweep", headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["leader"] is True
+
+
+def test_expiry_scan_uses_status_ended_at_index():
+    stmt = (
+        "EXPLAIN QUERY PLAN SELECT id, user_id FROM user_tariffs "
+        "WHERE status = 'active' AND ended_at <= :now ORDER BY ended_at LIMIT 500"
+    )
+    with engine.connect() as conn:
+        plan = " ".join(str(row[-1]) for row in conn.exec_driver_sql(stmt, {"now": "2026-01-01"}))
+    assert "ix_user_tariffs_status_ended_at" in plan
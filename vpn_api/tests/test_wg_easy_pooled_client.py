@@ -0,0 +1,117 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from vpn_api import wg_easy_adapter
+from vpn_api.wg_easy_adapter import PooledWgEasyClient, WgEasyAuthError
+
+
+def _make_app(state):
+    async def session(request):
+        body = await request.json()
+        state["logins"] += 1
+        if body.get("password") != "pw":
+            return web.json_response({"error": "bad password"}, status=401)
+        state["authorized"] = True
+        return web.json_response({"success": True})
+
+    def _guard(request):
+        state["peers"].add(request.transport.get_extra_info("peername"))
+        if not state["authorized"]:
+            raise web.HTTPUnauthorized()
+
+    async def list_clients(request):
+        _guard(request)
+        return web.json_response(state["clients"])
+
+    async def create_client(request):
+        _guard(request)
+        body = await request.json()
+        cid = f"cid-{len(state['clients']) + 1}"
+        state["clients"].append({"id": cid, "name": body["name"], "publicKey": f"pk-{cid}"})
+        return web.json_response({"success": True})
+
+    async def delete_client(request):
+        _guard(request)
+        cid = request.match_info["cid"]
+        state["clients"] = [c for c in state["clients"] if c["id"] != cid]
+        return web.json_response({"success": True})
+
+    async def configuration(request):
+        _guard(request)
+        return web.Response(body=b"[Interface]\nPrivateKey = x\n")
+
+    app = web.Application()
+    app.router.add_post("/api/session", session)
+    app.router.add_get("/api/wireguard/client", list_clients)
+    app.router.add_post("/api/wireguard/client", create_client)
+    app.router.add_delete("/api/wireguard/client/{cid}", delete_client)
+    app.router.add_get("/api/wireguard/client/{cid}/configuration", configuration)
+    return app
+
+
+@pytest.fixture
+def state():
+    return {"logins": 0, "authorized": False, "clients": [], "peers": set()}
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_logs_in_once_and_reuses_connection(state):
+    async with TestServer(_make_app(state)) as server:
+        client = await PooledWgEasyClient(str(server.make_url("/")), "pw").start()
+        try:
+            for i in range(5):
+                created = await client.create_client(f"dev-{i}")
+                assert created["publicKey"] == f"pk-{created['id']}"
+                assert (await client.get_client_config(created["id"])).startswith(b"[Interface]")
+            await client.delete_client("cid-1")
+            assert (await client.list_clients())[0]["id"] == "cid-2"
+        finally:
+            await client.close()
+    assert state["logins"] == 1
+    # every API call went over the same keep-alive connection
+    assert len(state["peers"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_reauthenticates_on_401(state):
+    async with TestServer(_make_app(state)) as server:
+        client = await PooledWgEasyClient(str(server.make_url("/")), "pw").start()
+        try:
+            await client.list_clients()
+            # simulate wg-easy restart dropping the session
+            state["authorized"] = False
+            assert await client.list_clients() == []
+        finally:
+            await client.close()
+    assert state["logins"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pooled_client_bad_password(state):
+    async with TestServer(_make_app(state)) as server:
+        client = await PooledWgEasyClient(str(server.make_url("/")), "wrong").start()
+        try:
+            with pytest.raises(WgEasyAuthError):
+                await client.list_clients()
+        finally:
+            await client.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_client_used_by_peers_helpers(state):
+    from vpn_api import peers
+
+    async with TestServer(_make_app(state)) as server:
+        url = str(server.make_url("/"))
+        await wg_easy_adapter.start_shared_client(url, "pw")
+        try:
+            created = await peers._create_wg_easy_client(url, "pw", "shared")
+            cfg = await peers._get_wg_easy_client_config(url, "pw", created["id"])
+            assert cfg.startswith(b"[Interface]")
+            await peers._delete_wg_easy_client(url, "pw", created["id"])
+        finally:
+            await wg_easy_adapter.stop_shared_client()
+    assert wg_easy_adapter.get_shared_client() is None
+    assert state["logins"] == 1
+    assert state["clients"] == []
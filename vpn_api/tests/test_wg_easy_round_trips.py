@@ -0,0 +1,128 @@
+"""Round-trip budget for creating a peer through wg-easy."""
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from vpn_api import models, peers, schemas, wg_easy_adapter, wg_keys
+from vpn_api.database import AsyncSessionLocal, Base, SessionLocal, engine
+from vpn_api.wg_easy_adapter import WgEasyAdapter
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+
+
+def _make_app(calls, returns_id):
+    clients = []
+    subnet = 71 if returns_id else 72
+
+    def _count(request):
+        calls.append(f"{request.method} {request.path}")
+
+    async def session(request):
+        _count(request)
+        return web.json_response({"success": True})
+
+    async def list_clients(request):
+        _count(request)
+        return web.json_response(clients)
+
+    async def create_client(request):
+        _count(request)
+        body = await request.json()
+        private, public = wg_keys.generate_keypair()
+        cid = f"cid-{len(clients) + 1}"
+        clients.append({"id": cid, "name": body["name"], "publicKey": public, "_priv": private})
+        return web.json_response(
+            {"success": True, "clientId": cid} if returns_id else {"success": True}
+        )
+
+    async def configuration(request):
+        _count(request)
+        c = next(c for c in clients if c["id"] == request.match_info["cid"])
+        return web.Response(
+            text=f"[Interface]\nPrivateKey = {c['_priv']}\n"
+            f"Address = 10.{subnet}.0.{len(clients) + 1}/32\n"
+            "[Peer]\nAllowedIPs = 0.0.0.0/0\n"
+        )
+
+    app = web.Application()
+    app.router.add_post("/api/session", session)
+    app.router.add_get("/api/wireguard/client", list_clients)
+    app.router.add_post("/api/wireguard/client", create_client)
+    app.router.add_get("/api/wireguard/client/{cid}/configuration", configuration)
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "returns_id, expected",
+    [
+        # wg-easy answering with the new client id: create + config, nothing else
+        (True, ["POST /api/wireguard/client", "GET /api/wireguard/client/cid-1/configuration"]),
+        # older wg-easy answering {"success": true}: one extra list lookup
+        (
+            False,
+            [
+                "POST /api/wireguard/client",
+                "GET /api/wireguard/client",
+                "GET /api/wireguard/client/cid-1/configuration",
+            ],
+        ),
+    ],
+)
+async def test_create_peer_round_trip_budget(monkeypatch, returns_id, expected):
+    calls = []
+    async with TestServer(_make_app(calls, returns_id)) as server:
+        url = str(server.make_url("/"))
+        monkeypatch.setenv("WG_KEY_POLICY", "wg-easy")
+        monkeypatch.setenv("WG_EASY_URL", url)
+        monkeypatch.setenv("WG_EASY_PASSWORD", "pw")
+        await wg_easy_adapter.start_shared_client(url, "pw")
+        db = SessionLocal()
+        try:
+            user = models.User(email=f"rt-{returns_id}@example.test")
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+            assert calls == ["POST /api/session"]
+            del calls[:]
+
+            payload = schemas.VpnPeerCreate(user_id=user.id, device_name="phone")
+            async with AsyncSessionLocal() as adb:
+                peer = await peers.create_peer(payload, db=adb, current_user=user)
+        finally:
+            db.close()
+            await wg_easy_adapter.stop_shared_client()
+
+    assert calls == expected
+    assert peer.wg_client_id == "cid-1"
+    assert peer.wg_public_key == wg_keys.derive_public_key(peer.wg_private_key)
+
+
+@pytest.mark.asyncio
+async def test_adapter_uses_wrapper_return_value_without_listing(monkeypatch):
+    listed = []
+
+    class FakeClient:
+        def __init__(self, name):
+            self.name = name
+            self.id = "cid-9"
+            self.publicKey = "pub-9"
+
+    class FakeWg:
+        def __init__(self, url, password, session=None):
+            pass
+
+        async def create_client(self, name):
+            return FakeClient(name)
+
+        async def get_clients(self):
+            listed.append(True)
+            return []
+
+    monkeypatch.setattr("vpn_api.wg_easy_adapter.WgEasy", FakeWg)
+    async with WgEasyAdapter("http://127.0.0.1:51821", "pass") as adapter:
+        assert await adapter.create_client("alice") == {"id": "cid-9", "publicKey": "pub-9"}
+    assert listed == []
@@ -1,3 +1,4 @@
+import os
 import subprocess
 import types
 
@@ -42,3 +43,71 @@ def test_generate_key_on_host_parsing(monkeypatch):
     )
     res = wg_host.generate_key_on_host("name", outdir="/tmp")
     assert res and res["public"] == "pubkey"
+
+
+def _fake_ssh(tmp_path, monkeypatch):
+    """Put a fake `ssh` on PATH that emulates a ControlMaster socket with a file."""
+    log = tmp_path / "ssh.log"
+    master = tmp_path / "master.up"
+    script = tmp_path / "ssh"
+    script.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {log}\n'
+        'case "$*" in\n'
+        f'  *"-O check"*) [ -f {master} ] ;;\n'
+        f'  *"-O exit"*) rm -f {master} ;;\n'
+        f'  "-M "*) touch {master} ;;\n'
+        '  *) echo "PRIVATE=/etc/wg-keys/k"; echo "PUBLIC=pub" ;;\n'
+        "esac\n"
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    monkeypatch.setattr(wg_host, "WG_APPLY_ENABLED", True)
+    monkeypatch.setattr(wg_host, "WG_HOST_SSH", "root@host")
+    monkeypatch.setattr(wg_host, "WG_SSH_MULTIPLEX", True)
+    monkeypatch.setattr(wg_host, "WG_SSH_CONTROL_DIR", str(tmp_path / "cm"))
+    monkeypatch.setattr(wg_host, "_ssh_master", None)
+    return log, master
+
+
+def test_host_commands_share_one_ssh_master(tmp_path, monkeypatch):
+    log, master = _fake_ssh(tmp_path, monkeypatch)
+
+    class P:
+        wg_public_key = "pk"
+        allowed_ips = "10.8.0.2/32"
+
+    for _ in range(5):
+        assert wg_host.apply_peer(P()) is True
+    assert wg_host.generate_key_on_host("name")["public"] == "pub"
+
+    lines = log.read_text().splitlines()
+    assert sum(line.startswith("-M ") for line in lines) == 1
+    commands = [line for line in lines if "sudo" in line]
+    assert len(commands) == 6
+    control_path = os.path.join(str(tmp_path / "cm"), "%C")
+    assert all(f"ControlPath={control_path}" in line for line in commands)
+
+    wg_host.close_ssh_master()
+    assert not master.exists()
+
+
+def test_ssh_master_reconnects_after_drop(tmp_path, monkeypatch):
+    log, master = _fake_ssh(tmp_path, monkeypatch)
+    cm = wg_host.SshControlMaster("root@host", control_dir=str(tmp_path / "cm"), check_interval=0)
+    assert cm.ensure() is True
+    master.unlink()  # connection dropped (host reboot, network blip)
+    assert cm.ensure() is True
+    assert master.exists()
+    assert sum(line.startswith("-M ") for line in log.read_text().splitlines()) == 2
+
+
+def test_dump_peers_parsing(monkeypatch):
+    monkeypatch.setattr(wg_host, "WG_HOST_SSH", None)
+    out = (
+        "privkey\tpubkey-srv\t51820\toff\n"
+        "pk-a\t(none)\t1.2.3.4:5555\t10.8.0.2/32\t0\t0\t0\toff\n"
+        "pk-b\t(none)\t(none)\t(none)\t0\t0\t0\toff"
+    )
+    monkeypatch.setattr(wg_host, "_run_and_capture", lambda cmd: (0, out, ""))
+    assert wg_host.dump_peers("wg0") == {"pk-a": "10.8.0.2/32", "pk-b": ""}
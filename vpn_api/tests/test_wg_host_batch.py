@@ -0,0 +1,114 @@
+import os
+import subprocess
+import threading
+import types
+from pathlib import Path
+
+from vpn_api import wg_host, wg_keys
+from vpn_api.wg_host import HostApplyQueue, PeerOp
+
+SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "wg_batch.sh"
+
+
+def _keys(n):
+    return [pub for _, pub in wg_keys.generate_keypairs(n)]
+
+
+def test_coalesce_latest_op_wins():
+    a, b = _keys(2)
+    ops = [PeerOp("add", a, "10.8.0.2/32"), PeerOp("add", b), PeerOp("remove", a)]
+    assert [(o.op, o.public_key) for o in wg_host.coalesce_ops(ops)] == [
+        ("add", b),
+        ("remove", a),
+    ]
+
+
+def test_apply_peers_single_process(monkeypatch):
+    a, b = _keys(2)
+    calls = []
+
+    def fake_run(cmd, input=None, **kw):
+        calls.append((cmd, input))
+        out = f"ok add {a}\nok remove {b}\n"
+        return types.SimpleNamespace(returncode=0, stdout=out, stderr="")
+
+    monkeypatch.setattr(wg_host, "WG_HOST_SSH", "root@host")
+    monkeypatch.setattr(wg_host, "WG_SSH_MULTIPLEX", False)
+    monkeypatch.setattr(subprocess, "run", fake_run)
+    res = wg_host.apply_peers([PeerOp("add", a, "10.8.0.2/32"), PeerOp("remove", b)])
+    assert res == {a: True, b: True}
+    assert len(calls) == 1
+    assert calls[0][0][0] == "ssh"
+    assert calls[0][1] == f"add {a} 10.8.0.2/32\nremove {b}\n"
+
+
+def test_apply_peers_rejects_malformed_and_falls_back_per_peer(monkeypatch):
+    (a,) = _keys(1)
+    applied = []
+    monkeypatch.setattr(
+        subprocess,
+        "run",
+        lambda *x, **k: types.SimpleNamespace(returncode=1, stdout="", stderr="boom"),
+    )
+    monkeypatch.setattr(wg_host, "apply_peer", lambda p: applied.append(p.wg_public_key) or True)
+    res = wg_host.apply_peers([PeerOp("add", a), PeerOp("add", "bad key; rm -rf /")])
+    assert res == {a: True, "bad key; rm -rf /": False}
+    assert applied == [a]
+
+
+def test_batch_script_issues_one_wg_set(tmp_path, monkeypatch):
+    log = tmp_path / "wg.log"
+    (tmp_path / "ip").write_text("#!/bin/sh\nexit 0\n")
+    (tmp_path / "wg").write_text(f'#!/bin/sh\necho "$@" >> {log}\n')
+    for name in ("ip", "wg"):
+        (tmp_path / name).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(wg_host, "WG_HOST_SSH", None)
+    monkeypatch.setattr(wg_host, "WG_BATCH_SCRIPT", str(SCRIPT))
+
+    keys = _keys(3)
+    ops = [PeerOp("add", k, f"10.8.0.{i + 2}/32", iface="wg0") for i, k in enumerate(keys[:2])]
+    ops.append(PeerOp("remove", keys[2], iface="wg0"))
+    assert wg_host.apply_peers(ops) == dict.fromkeys(keys, True)
+    assert log.read_text().splitlines() == [
+        f"set wg0 peer {keys[0]} allowed-ips 10.8.0.2/32 "
+        f"peer {keys[1]} allowed-ips 10.8.0.3/32 peer {keys[2]} remove"
+    ]
+
+
+def test_queue_coalesces_concurrent_submissions():
+    batches = []
+
+    def runner(ops):
+        batches.append(list(ops))
+        return {op.public_key: True for op in ops}
+
+    q = HostApplyQueue(window=0.05, max_batch=1000, runner=runner)
+    keys = _keys(200)
+    futures = []
+    lock = threading.Lock()
+
+    def submit(k):
+        f = q.submit(PeerOp("add", k))
+        with lock:
+            futures.append(f)
+
+    threads = [threading.Thread(target=submit, args=(k,)) for k in keys]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(f.result(timeout=5) for f in futures)
+    assert sum(len(b) for b in batches) == 200
+    assert len(batches) <= 2
+    q.stop()
+
+
+def test_queue_superseded_op_reports_false():
+    q = HostApplyQueue(window=0.05, runner=lambda ops: {op.public_key: True for op in ops})
+    (k,) = _keys(1)
+    added = q.submit(PeerOp("add", k))
+    removed = q.submit(PeerOp("remove", k))
+    assert removed.result(timeout=5) is True
+    assert added.result(timeout=5) is False
+    q.stop()
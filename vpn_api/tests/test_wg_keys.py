@@ -0,0 +1,56 @@
+import base64
+import time
+
+from vpn_api import peers, wg_keys
+
+
+def test_generate_keypair_public_matches_private():
+    private, public = wg_keys.generate_keypair()
+    assert len(base64.b64decode(private)) == 32
+    assert len(base64.b64decode(public)) == 32
+    assert wg_keys.derive_public_key(private) == public
+
+
+def test_derive_public_key_known_vector():
+    # RFC 7748 section 6.1 (Alice)
+    private = bytes.fromhex("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+    public = bytes.fromhex("8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a")
+    assert wg_keys.derive_public_key(base64.b64encode(private).decode()) == (
+        base64.b64encode(public).decode()
+    )
+
+
+def test_generate_keypairs_are_distinct():
+    pairs = wg_keys.generate_keypairs(50)
+    assert len({p for p, _ in pairs}) == 50
+    assert all(wg_keys.derive_public_key(p) == pub for p, pub in pairs)
+
+
+def test_key_pool_refills_in_background_and_never_blocks_when_empty():
+    pool = wg_keys.KeyPool(size=20, low_water=5)
+    # empty pool still hands out valid pairs (generated inline)
+    private, public = pool.take()
+    assert wg_keys.derive_public_key(private) == public
+
+    deadline = time.monotonic() + 5
+    while len(pool) < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(pool) == 20
+
+    pairs = pool.take_many(18)
+    assert len({p for p, _ in pairs}) == 18
+    deadline = time.monotonic() + 5
+    while len(pool) < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(pool) == 20
+
+
+def test_disabled_pool_generates_inline():
+    pool = wg_keys.KeyPool(size=0, low_water=0)
+    assert len(pool.take_many(3)) == 3
+    assert len(pool) == 0
+
+
+def test_peers_db_policy_keypair_is_consistent():
+    private, public = peers._generate_wg_keypair()
+    assert wg_keys.derive_public_key(private) == public
@@ -1,13 +1,29 @@
 """Simple adapter for wg-easy using the MIT-licensed `wg-easy-api` package.
 
 This adapter exposes a small async API used by the rest of the project.
+`PooledWgEasyClient` is the long-lived variant used while the application is
+running: it keeps one connection-pooled aiohttp session for the lifetime of
+the app instead of logging in and opening a session per operation.
 """
 
 from __future__ import annotations
 
 import asyncio
+import json
+import logging
+import os
 from typing import TYPE_CHECKING, Optional
 
+from vpn_api.metrics import wg_easy_call
+
+logger = logging.getLogger(__name__)
+
+# Tuning for the shared, app-lifespan wg-easy session.
+WG_EASY_POOL_LIMIT = int(os.getenv("WG_EASY_POOL_LIMIT", "20"))
+WG_EASY_DNS_CACHE_TTL = int(os.getenv("WG_EASY_DNS_CACHE_TTL", "300"))
+WG_EASY_KEEPALIVE_TIMEOUT = float(os.getenv("WG_EASY_KEEPALIVE_TIMEOUT", "30"))
+WG_EASY_TIMEOUT = float(os.getenv("WG_EASY_TIMEOUT", "10"))
+
 if TYPE_CHECKING:
     # Import for type checkers only.
     from wg_easy_api import WgEasy  # type: ignore
@@ -79,6 +95,7 @@ class WgEasyAdapter:
 
             self._wg = None
 
+    @wg_easy_call("create_client")
     async def create_client(self, name: str) -> dict:  # noqa: C901
         """Create client and return server response (dict-like).
 
@@ -93,16 +110,15 @@ class WgEasyAdapter:
         # then POST /api/wireguard/client).
         last_exc: Optional[Exception] = None
         try:
-            await self._wg.create_client(name)
-            # get last created client by listing all and finding name
-            clients = await self._wg.get_clients()
-            for c in clients:
-                if getattr(c, "name", None) == name:
-                    return {
-                        "id": getattr(c, "id", None) or getattr(c, "uid", None),
-                        "publicKey": getattr(c, "publicKey", None)
-                        or getattr(c, "public_key", None),
-                    }
+            # Most wrappers already return the new client; only list all
+            # clients (O(fleet size)) when the return value carries no id.
+            created = _normalize_client(await self._wg.create_client(name), name)
+            if created is not None:
+                return created
+            for c in reversed(await self._wg.get_clients()):
+                found = _normalize_client(c, name)
+                if found is not None:
+                    return found
         except Exception as e:  # pragma: no cover - runtime fallback
             last_exc = e
 
@@ -151,36 +167,32 @@ class WgEasyAdapter:
             create_url = f"{base}/api/wireguard/client"
             list_url = f"{base}/api/wireguard/client"
 
+            async def _create(sess):
+                status, text, _resp = await _post(
+                    sess, create_url, json_payload={"name": name}, headers=headers
+                )
+                if not 200 <= status < 300:
+                    return status, text, None
+                # newer wg-easy versions answer with the client id; older ones
+                # only with {"success": true}, which needs one list lookup
+                created = _normalize_client(_json_or_none(text), name)
+                if created is None:
+                    _r_status, r_text, _r_resp = await _get(sess, list_url, headers=headers)
+                    for c in reversed(_json.loads(r_text)):
+                        created = _normalize_client(c, name)
+                        if created is not None:
+                            break
+                return status, text, created
+
             if session is None:
                 # adapter creates and manages its own session
                 async with aiohttp.ClientSession() as sess:
-                    status, text, _resp = await _post(
-                        sess, create_url, json_payload={"name": name}, headers=headers
-                    )
-                    if 200 <= status < 300:
-                        _r_status, r_text, _r_resp = await _get(sess, list_url, headers=headers)
-                        clients = _json.loads(r_text)
-                        for c in clients:
-                            if c.get("name") == name:
-                                return {
-                                    "id": c.get("id"),
-                                    "publicKey": c.get("publicKey") or c.get("public_key"),
-                                }
+                    status, text, created = await _create(sess)
             else:
                 # use externally provided session; do not close it here
-                sess = session
-                status, text, _resp = await _post(
-                    sess, create_url, json_payload={"name": name}, headers=headers
-                )
-                if 200 <= status < 300:
-                    _r_status, r_text, _r_resp = await _get(sess, list_url, headers=headers)
-                    clients = _json.loads(r_text)
-                    for c in clients:
-                        if c.get("name") == name:
-                            return {
-                                "id": c.get("id"),
-                                "publicKey": c.get("publicKey") or c.get("public_key"),
-                            }
+                status, text, created = await _create(session)
+            if created is not None:
+                return created
 
             raise RuntimeError(f"wg-easy create client failed; last status={status}; body={text}")
         except Exception:  # pragma: no cover - runtime fallback
@@ -189,10 +201,193 @@ class WgEasyAdapter:
                 raise RuntimeError("both wrapper and HTTP fallback failed") from last_exc
             raise
 
+    @wg_easy_call("delete_client")
     async def delete_client(self, client_id: str) -> None:
         assert self._wg is not None, "adapter not started (use async context)"
         await self._wg.delete_client(client_id)
 
+    @wg_easy_call("get_client_config")
     async def get_client_config(self, client_id: str) -> bytes:
         assert self._wg is not None, "adapter not started (use async context)"
         return await self._wg.get_client_config(client_id)
+
+
+def _json_or_none(text):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return None
+
+
+def _normalize_client(c, name: Optional[str] = None) -> Optional[dict]:
+    """Return ``{"id", "publicKey"}`` for a wg-easy client object or dict.
+
+    Accepts wrapper models, plain client dicts and creation responses such as
+    ``{"success": true, "clientId": ...}`` or ``{"client": {...}}``. Returns
+    None when ``c`` carries no id, or describes a client with another name.
+    """
+    if c is None:
+        return None
+    if isinstance(c, dict):
+        if isinstance(c.get("client"), dict):
+            return _normalize_client(c["client"], name)
+        get = c.get
+    else:
+
+        def get(key):
+            return getattr(c, key, None)
+
+    cid = get("id") or get("uid") or get("clientId")
+    if not cid or (name is not None and get("name") not in (None, name)):
+        return None
+    return {"id": cid, "publicKey": get("publicKey") or get("public_key")}
+
+
+class WgEasyAuthError(RuntimeError):
+    """Raised when wg-easy rejects the configured password."""
+
+
+class PooledWgEasyClient:
+    """Long-lived wg-easy HTTP client shared by all requests.
+
+    Holds a single keep-alive aiohttp session (bounded connector, DNS cache),
+    logs in once via ``POST /api/session`` and transparently logs in again
+    when the server answers 401 (for example after a wg-easy restart
+    invalidated the session cookie). Requests also carry the Authorization
+    header used by the adapter's HTTP fallback.
+    """
+
+    def __init__(self, url: str, password: str, session=None, api_key: Optional[str] = None):
+        self.url = url.rstrip("/")
+        self.password = password
+        self.api_key = api_key
+        self._session = session
+        self._owns_session = session is None
+        self._logged_in = False
+        # bumped on every successful login so concurrent 401s re-login only once
+        self._login_generation = 0
+        self._login_lock: Optional[asyncio.Lock] = None
+
+    async def start(self) -> "PooledWgEasyClient":
+        if self._session is None:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(
+                limit=WG_EASY_POOL_LIMIT,
+                ttl_dns_cache=WG_EASY_DNS_CACHE_TTL,
+                keepalive_timeout=WG_EASY_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=WG_EASY_TIMEOUT)
+            )
+            self._owns_session = True
+        self._login_lock = asyncio.Lock()
+        return self
+
+    async def close(self) -> None:
+        sess, self._session = self._session, None
+        self._logged_in = False
+        if sess is not None and self._owns_session:
+            await sess.close()
+
+    def _headers(self) -> dict:
+        # wg-easy expects the raw key/password as the header value (no "Bearer ").
+        return {"Content-Type": "application/json", "Authorization": self.api_key or self.password}
+
+    @wg_easy_call("login")
+    async def login(self, stale_generation: Optional[int] = None) -> None:
+        """Authenticate the shared session (once per generation)."""
+        assert self._session is not None, "client not started"
+        async with self._login_lock:
+            if stale_generation is not None and self._login_generation != stale_generation:
+                # another request already re-authenticated while we waited
+                return
+            async with self._session.post(
+                f"{self.url}/api/session", json={"password": self.password}
+            ) as resp:
+                if resp.status == 401:
+                    raise WgEasyAuthError("wg-easy rejected the configured password")
+                resp.raise_for_status()
+            self._logged_in = True
+            self._login_generation += 1
+
+    async def _request(self, method: str, path: str, payload: Optional[dict] = None):
+        """Send an API request, re-authenticating once on 401.
+
+        Returns the raw response body as bytes.
+        """
+        assert self._session is not None, "client not started"
+        if not self._logged_in:
+            await self.login()
+        url = f"{self.url}/api/{path}"
+        for attempt in range(2):
+            generation = self._login_generation
+            async with self._session.request(
+                method, url, json=payload, headers=self._headers()
+            ) as resp:
+                if resp.status != 401 or attempt == 1:
+                    resp.raise_for_status()
+                    return await resp.read()
+            logger.info("wg-easy session expired; re-authenticating")
+            await self.login(stale_generation=generation)
+
+    @wg_easy_call("list_clients")
+    async def list_clients(self) -> list:
+        body = await self._request("GET", "wireguard/client")
+        return json.loads(body) if body else []
+
+    @wg_easy_call("create_client")
+    async def create_client(self, name: str) -> dict:
+        """Create a client; ``publicKey`` may be None if wg-easy did not return it.
+
+        Costs one request when wg-easy answers with the new client id and one
+        extra list request (for older versions answering only ``success``).
+        """
+        body = await self._request("POST", "wireguard/client", {"name": name})
+        created = _normalize_client(_json_or_none(body), name)
+        if created is not None:
+            return created
+        # newest first: device names are not unique across users
+        for c in reversed(await self.list_clients()):
+            found = _normalize_client(c, name)
+            if found is not None:
+                return found
+        raise RuntimeError(f"wg-easy client {name!r} not found after creation")
+
+    @wg_easy_call("delete_client")
+    async def delete_client(self, client_id: str) -> None:
+        await self._request("DELETE", f"wireguard/client/{client_id}")
+
+    @wg_easy_call("get_client_config")
+    async def get_client_config(self, client_id: str) -> bytes:
+        return await self._request("GET", f"wireguard/client/{client_id}/configuration")
+
+
+# App-wide client, started and stopped by the FastAPI lifespan in main.py.
+_shared_client: Optional[PooledWgEasyClient] = None
+
+
+def get_shared_client() -> Optional[PooledWgEasyClient]:
+    """Return the running app-wide client, or None outside the app lifespan."""
+    return _shared_client
+
+
+async def start_shared_client(url: str, password: str) -> PooledWgEasyClient:
+    global _shared_client
+    if _shared_client is not None:
+        return _shared_client
+    client = await PooledWgEasyClient(url, password, api_key=os.getenv("WG_API_KEY")).start()
+    try:
+        await client.login()
+    except Exception:
+        # wg-easy may be briefly unavailable at startup; the first request retries.
+        logger.warning("wg-easy login at startup failed; will retry on first use", exc_info=True)
+    _shared_client = client
+    return client
+
+
+async def stop_shared_client() -> None:
+    global _shared_client
+    client, _shared_client = _shared_client, None
+    if client is not None:
+        await client.close()
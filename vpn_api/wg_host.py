@@ -1,9 +1,17 @@
 import logging
 import os
+import re
 import shlex
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from typing import Optional
 
+from vpn_api.metrics import WG_HOST_COMMAND, track
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,15 +21,160 @@ WG_INTERFACE = os.getenv("WG_INTERFACE", "wg0")
 WG_APPLY_SCRIPT = os.getenv("WG_APPLY_SCRIPT", "/app/scripts/wg_apply.sh")
 WG_REMOVE_SCRIPT = os.getenv("WG_REMOVE_SCRIPT", "/app/scripts/wg_remove.sh")
 WG_GEN_SCRIPT = os.getenv("WG_GEN_SCRIPT", "/app/scripts/wg_gen_key.sh")
+# Reuse one multiplexed SSH connection (OpenSSH ControlMaster) for host commands.
+WG_SSH_MULTIPLEX = os.getenv("WG_SSH_MULTIPLEX", "1") == "1"
+WG_SSH_CONTROL_DIR = os.getenv(
+    "WG_SSH_CONTROL_DIR", os.path.join(tempfile.gettempdir(), "vpn-api-ssh")
+)
+WG_SSH_CONTROL_PERSIST = os.getenv("WG_SSH_CONTROL_PERSIST", "10m")
+WG_SSH_CHECK_INTERVAL = float(os.getenv("WG_SSH_CHECK_INTERVAL", "30"))
+WG_BATCH_SCRIPT = os.getenv("WG_BATCH_SCRIPT", "/app/scripts/wg_batch.sh")
+# Coalesce host adds/removes in a background queue (see HostApplyQueue).
+WG_BATCH_ENABLED = os.getenv("WG_BATCH_ENABLED", "0") == "1"
+WG_BATCH_WINDOW_MS = int(os.getenv("WG_BATCH_WINDOW_MS", "50"))
+WG_BATCH_MAX = int(os.getenv("WG_BATCH_MAX", "500"))
+
+# Values are sent to the batch script as whitespace-separated fields, so only
+# accept well-formed keys and address lists.
+_PUBKEY_RE = re.compile(r"^[A-Za-z0-9+/]{42}[AEIMQUYcgkosw048]=$")
+_ALLOWED_IPS_RE = re.compile(r"^[0-9A-Fa-f:./,]+$")
+
+
+class SshControlMaster:
+    """Keeps one multiplexed OpenSSH connection to the WireGuard host.
+
+    Every host command runs as ``ssh -o ControlPath=... remote cmd`` and rides
+    the master connection instead of doing its own key exchange and auth.
+    ``ensure`` health-checks the master with ``ssh -O check`` (at most once
+    per ``check_interval`` seconds) and starts a new one when it is gone.
+    Commands also pass ``ControlMaster=auto``, so if the master cannot be
+    started they still work, just without reuse.
+    """
+
+    def __init__(
+        self,
+        remote: str,
+        control_dir: Optional[str] = None,
+        persist: Optional[str] = None,
+        check_interval: Optional[float] = None,
+    ):
+        self.remote = remote
+        self.control_dir = control_dir or WG_SSH_CONTROL_DIR
+        self.persist = persist or WG_SSH_CONTROL_PERSIST
+        self.check_interval = WG_SSH_CHECK_INTERVAL if check_interval is None else check_interval
+        # %C is a hash of host/port/user, keeping the socket path short
+        self.control_path = os.path.join(self.control_dir, "%C")
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._alive = False
+
+    def options(self) -> list[str]:
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={self.control_path}",
+            "-o",
+            f"ControlPersist={self.persist}",
+        ]
+
+    def _ctl(self, *args: str) -> list[str]:
+        return ["ssh", "-o", f"ControlPath={self.control_path}", *args, self.remote]
+
+    def is_alive(self) -> bool:
+        try:
+            proc = _run("ssh-check", self._ctl("-O", "check"), capture_output=True, timeout=10)
+        except Exception:
+            return False
+        return proc.returncode == 0
+
+    def start(self) -> bool:
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        cmd = [
+            "ssh",
+            "-M",
+            "-N",
+            "-f",
+            *self.options()[2:],
+            "-o",
+            "BatchMode=yes",
+            "-o",
+            "ServerAliveInterval=15",
+            "-o",
+            "ServerAliveCountMax=3",
+            self.remote,
+        ]
+        try:
+            proc = _run("ssh-master", cmd, capture_output=True, text=True, timeout=30)
+        except Exception as exc:
+            logger.warning("Failed to start SSH master for %s: %s", self.remote, exc)
+            return False
+        if proc.returncode != 0:
+            logger.warning("Failed to start SSH master for %s: %s", self.remote, proc.stderr)
+            return False
+        logger.info("SSH master connection to %s established", self.remote)
+        return True
+
+    def ensure(self) -> bool:
+        """Make sure a healthy master is running; reconnect if it died."""
+        with self._lock:
+            now = time.monotonic()
+            if self._alive and now - self._checked_at < self.check_interval:
+                return True
+            self._alive = self.is_alive()
+            if not self._alive:
+                logger.info("SSH master to %s is not running; reconnecting", self.remote)
+                self._alive = self.start()
+            self._checked_at = now
+            return self._alive
+
+    def close(self) -> None:
+        with self._lock:
+            if self._alive or self.is_alive():
+                _run("ssh-exit", self._ctl("-O", "exit"), capture_output=True, timeout=10)
+            self._alive = False
+
+
+_ssh_master: Optional[SshControlMaster] = None
+_ssh_master_lock = threading.Lock()
+
+
+def _get_ssh_master(remote: str) -> Optional[SshControlMaster]:
+    global _ssh_master
+    if not WG_SSH_MULTIPLEX:
+        return None
+    with _ssh_master_lock:
+        if _ssh_master is None or _ssh_master.remote != remote:
+            _ssh_master = SshControlMaster(remote)
+        return _ssh_master
+
+
+def close_ssh_master() -> None:
+    """Shut down the shared SSH master connection, if any."""
+    global _ssh_master
+    with _ssh_master_lock:
+        master, _ssh_master = _ssh_master, None
+    if master is not None:
+        master.close()
 
 
 def _build_ssh_cmd(remote: str, script: str, args: list[str]) -> list[str]:
     # Quote args for remote shell
     remote_args = " ".join(shlex.quote(a) for a in args)
-    cmd = ["ssh", remote, f"sudo {shlex.quote(script)} {remote_args}"]
+    master = _get_ssh_master(remote)
+    opts = master.options() if master is not None else []
+    cmd = ["ssh", *opts, remote, f"sudo {shlex.quote(script)} {remote_args}"]
     return cmd
 
 
+def _remote_cmd(script: str, args: list[str]) -> list[str]:
+    """Build the ssh command for ``script`` after health-checking the master."""
+    master = _get_ssh_master(WG_HOST_SSH)
+    if master is not None:
+        master.ensure()
+    return _build_ssh_cmd(WG_HOST_SSH, script, args)
+
+
 def apply_peer(peer) -> bool:
     """Apply a peer to the WireGuard host. Returns True if the operation was attempted.
 
@@ -40,12 +193,12 @@ def apply_peer(peer) -> bool:
 
     try:
         if WG_HOST_SSH:
-            cmd = _build_ssh_cmd(WG_HOST_SSH, WG_APPLY_SCRIPT, args)
+            cmd = _remote_cmd(WG_APPLY_SCRIPT, args)
         else:
             cmd = [WG_APPLY_SCRIPT, iface, public or "", allowed]
 
         logger.info("Applying WireGuard peer on host: %s", cmd)
-        subprocess.run(cmd, check=True, capture_output=True)
+        _run("apply", cmd, check=True, capture_output=True)
         logger.info("WireGuard peer applied successfully")
         return True
     except Exception as exc:
@@ -64,12 +217,12 @@ def remove_peer(peer) -> bool:
 
     try:
         if WG_HOST_SSH:
-            cmd = _build_ssh_cmd(WG_HOST_SSH, WG_REMOVE_SCRIPT, args)
+            cmd = _remote_cmd(WG_REMOVE_SCRIPT, args)
         else:
             cmd = [WG_REMOVE_SCRIPT, iface, public or ""]
 
         logger.info("Removing WireGuard peer on host: %s", cmd)
-        subprocess.run(cmd, check=True, capture_output=True)
+        _run("remove", cmd, check=True, capture_output=True)
         logger.info("WireGuard peer removed successfully")
         return True
     except Exception as exc:
@@ -77,11 +230,42 @@ def remove_peer(peer) -> bool:
         return False
 
 
+def _run(command: str, cmd: list[str], **kwargs) -> subprocess.CompletedProcess:
+    """Run ``cmd`` and record its duration under the ``command`` label."""
+    with track(WG_HOST_COMMAND, command=command):
+        return subprocess.run(cmd, **kwargs)
+
+
 def _run_and_capture(cmd: list[str]) -> tuple[int, str, str]:
     proc = subprocess.run(cmd, capture_output=True, text=True)
     return proc.returncode, proc.stdout.strip(), proc.stderr.strip()
 
 
+def dump_peers(iface: Optional[str] = None) -> Optional[dict[str, str]]:
+    """Return ``{public_key: allowed_ips}`` from ``wg show <iface> dump``, or None on error."""
+    iface = iface or WG_INTERFACE
+    args = ["show", iface, "dump"]
+    try:
+        cmd = _remote_cmd("wg", args) if WG_HOST_SSH else ["wg", *args]
+        with track(WG_HOST_COMMAND, command="dump"):
+            code, out, err = _run_and_capture(cmd)
+        if code != 0:
+            logger.error("wg show dump failed: %s", err)
+            return None
+    except Exception as exc:
+        logger.exception("Failed to read WireGuard peers from host: %s", exc)
+        return None
+    peers: dict[str, str] = {}
+    # first line describes the interface itself; peer lines have 8 fields:
+    # public-key preshared-key endpoint allowed-ips latest-handshake rx tx keepalive
+    for line in out.splitlines()[1:]:
+        fields = line.split("\t")
+        if len(fields) >= 4:
+            allowed = "" if fields[3] == "(none)" else fields[3]
+            peers[fields[0]] = allowed
+    return peers
+
+
 def generate_key_on_host(base_name: str, outdir: str = "/etc/wg-keys") -> Optional[dict]:
     """Generate keypair on host and return {'private': path, 'public': pubkey} or None."""
     if not WG_APPLY_ENABLED:
@@ -91,12 +275,13 @@ def generate_key_on_host(base_name: str, outdir: str = "/etc/wg-keys") -> Option
     args = [outdir, base_name]
     try:
         if WG_HOST_SSH:
-            cmd = _build_ssh_cmd(WG_HOST_SSH, WG_GEN_SCRIPT, args)
+            cmd = _remote_cmd(WG_GEN_SCRIPT, args)
         else:
             cmd = [WG_GEN_SCRIPT, outdir, base_name]
 
         logger.info("Generating WireGuard keys on host: %s", cmd)
-        code, out, err = _run_and_capture(cmd)
+        with track(WG_HOST_COMMAND, command="keygen"):
+            code, out, err = _run_and_capture(cmd)
         if code != 0:
             logger.error("Key generation failed: %s", err)
             return None
@@ -115,3 +300,213 @@ def generate_key_on_host(base_name: str, outdir: str = "/etc/wg-keys") -> Option
     except Exception as exc:
         logger.exception("Failed to generate key on host: %s", exc)
         return None
+
+
+@dataclass
+class PeerOp:
+    """One pending host change: ``op`` is "add" or "remove"."""
+
+    op: str
+    public_key: str
+    allowed_ips: str = ""
+    iface: str = field(default_factory=lambda: WG_INTERFACE)
+
+    def line(self) -> str:
+        if self.op == "add":
+            return f"add {self.public_key} {self.allowed_ips or '0.0.0.0/0'}"
+        return f"remove {self.public_key}"
+
+    def is_valid(self) -> bool:
+        if self.op not in ("add", "remove") or not _PUBKEY_RE.match(self.public_key or ""):
+            return False
+        return not self.allowed_ips or bool(_ALLOWED_IPS_RE.match(self.allowed_ips))
+
+
+def coalesce_ops(ops: list[PeerOp]) -> list[PeerOp]:
+    """Collapse ops per (interface, public key); the latest op wins."""
+    latest: dict[tuple[str, str], PeerOp] = {}
+    for op in ops:
+        key = (op.iface, op.public_key)
+        latest.pop(key, None)  # keep submission order of the winning op
+        latest[key] = op
+    return list(latest.values())
+
+
+def apply_peers(ops: list[PeerOp]) -> dict[str, bool]:
+    """Apply adds/removes for one interface in a single batch-script run.
+
+    Returns ``{public_key: applied}``. All operations share one process (one
+    SSH session when ``WG_HOST_SSH`` is set) and one ``wg set`` call. If the
+    batch fails as a whole, each op is retried individually with the
+    single-peer scripts so the caller still gets per-peer results.
+    """
+    results = {op.public_key: False for op in ops if not op.is_valid()}
+    valid = [op for op in ops if op.is_valid()]
+    for bad in results:
+        logger.error("Refusing to send malformed WireGuard peer op for key %r", bad)
+    if not valid:
+        return results
+    iface = valid[0].iface
+    stdin = "".join(f"{op.line()}\n" for op in valid)
+    if WG_HOST_SSH:
+        cmd = _remote_cmd(WG_BATCH_SCRIPT, [iface])
+    else:
+        cmd = [WG_BATCH_SCRIPT, iface]
+    try:
+        logger.info("Applying %d WireGuard peer ops on host in one batch: %s", len(valid), cmd)
+        proc = _run("batch", cmd, input=stdin, capture_output=True, text=True)
+        if proc.returncode == 0:
+            done = {
+                parts[2]
+                for parts in (ln.split() for ln in proc.stdout.splitlines())
+                if len(parts) == 3 and parts[0] == "ok"
+            }
+            results.update({op.public_key: op.public_key in done for op in valid})
+            return results
+        logger.error("Batch apply failed (%s): %s", proc.returncode, proc.stderr.strip())
+    except Exception as exc:
+        logger.exception("Batch apply failed: %s", exc)
+    # fall back to one script run per peer to find out which ops fail
+    for op in valid:
+        target = _PeerView(op.public_key, op.allowed_ips)
+        results[op.public_key] = apply_peer(target) if op.op == "add" else remove_peer(target)
+    return results
+
+
+@dataclass
+class _PeerView:
+    wg_public_key: str
+    allowed_ips: str
+
+
+class HostApplyQueue:
+    """Background queue that coalesces host adds/removes into batches.
+
+    ``submit`` returns immediately with a Future resolved to True/False once
+    the batch containing the op has run. The worker waits ``window`` seconds
+    after the first pending op so that concurrent requests share one batch.
+    """
+
+    def __init__(
+        self,
+        window: float = WG_BATCH_WINDOW_MS / 1000,
+        max_batch: int = WG_BATCH_MAX,
+        runner=None,
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self._runner = runner or apply_peers
+        self._pending: list[tuple[PeerOp, Future]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def submit(self, op: PeerOp) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            if self._stopped:
+                fut.set_result(False)
+                return fut
+            self._pending.append((op, fut))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="wg-host-apply", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return fut
+
+    def submit_peer(self, op: str, peer) -> Future:
+        return self.submit(
+            PeerOp(
+                op,
+                getattr(peer, "wg_public_key", None) or "",
+                getattr(peer, "allowed_ips", "") or "",
+            )
+        )
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush pending ops and stop the worker."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            if not self._stopped:
+                time.sleep(self.window)  # let concurrent submissions join the batch
+            with self._cond:
+                batch, self._pending = self._pending, []
+            self._flush(batch)
+
+    def _flush(self, batch: list[tuple[PeerOp, Future]]) -> None:
+        effective = coalesce_ops([op for op, _ in batch])
+        results: dict[tuple[str, str], bool] = {}
+        by_iface: dict[str, list[PeerOp]] = {}
+        for op in effective:
+            by_iface.setdefault(op.iface, []).append(op)
+        for iface, ops in by_iface.items():
+            for i in range(0, len(ops), self.max_batch):
+                chunk = ops[i : i + self.max_batch]
+                try:
+                    out = self._runner(chunk)
+                except Exception:
+                    logger.exception("WireGuard batch runner failed")
+                    out = {}
+                for op in chunk:
+                    results[(iface, op.public_key)] = bool(out.get(op.public_key))
+        winners = {(op.iface, op.public_key): op for op in effective}
+        for op, fut in batch:
+            key = (op.iface, op.public_key)
+            # a superseded op (e.g. add followed by remove) reports whether the
+            # state it asked for is what ended up on the host
+            ok = results.get(key, False) and winners[key].op == op.op
+            if not ok:
+                logger.warning("WireGuard %s for peer %s not applied", op.op, op.public_key)
+            fut.set_result(ok)
+
+
+_host_queue: Optional[HostApplyQueue] = None
+_host_queue_lock = threading.Lock()
+
+
+def host_queue() -> HostApplyQueue:
+    """Return the process-wide batching queue, creating it on first use."""
+    global _host_queue
+    with _host_queue_lock:
+        if _host_queue is None:
+            _host_queue = HostApplyQueue()
+        return _host_queue
+
+
+def stop_host_queue() -> None:
+    """Flush and stop the batching queue (called on application shutdown)."""
+    global _host_queue
+    with _host_queue_lock:
+        q, _host_queue = _host_queue, None
+    if q is not None:
+        q.stop()
+
+
+def enqueue_apply(peer) -> Future:
+    """Queue ``peer`` for the next coalesced host batch (add)."""
+    if not WG_APPLY_ENABLED:
+        fut: Future = Future()
+        fut.set_result(False)
+        return fut
+    return host_queue().submit_peer("add", peer)
+
+
+def enqueue_remove(peer) -> Future:
+    """Queue ``peer`` for the next coalesced host batch (remove)."""
+    if not WG_APPLY_ENABLED:
+        fut: Future = Future()
+        fut.set_result(False)
+        return fut
+    return host_queue().submit_peer("remove", peer)
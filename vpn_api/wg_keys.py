@@ -0,0 +1,114 @@
+"""WireGuard (Curve25519) key generation.
+
+Keys are real X25519 pairs produced with the ``cryptography`` package, so the
+public key always matches the private key and db-policy configs are usable as
+is. A small in-memory pool of pre-generated pairs is refilled by a background
+thread, keeping key generation off the request path during sign-up bursts.
+"""
+
+import base64
+import logging
+import os
+import threading
+from collections import deque
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of pre-generated key pairs kept in memory; 0 disables the pool.
+WG_KEY_POOL_SIZE = int(os.getenv("WG_KEY_POOL_SIZE", "256"))
+# Start refilling once the pool drops below this many pairs.
+WG_KEY_POOL_LOW_WATER = int(os.getenv("WG_KEY_POOL_LOW_WATER", str(WG_KEY_POOL_SIZE // 4)))
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _public_b64(private_key: X25519PrivateKey) -> str:
+    return _b64(private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw))
+
+
+def generate_keypair() -> tuple[str, str]:
+    """Generate one key pair, returned as ``(private_b64, public_b64)``."""
+    key = X25519PrivateKey.generate()
+    private = key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+    return _b64(private), _public_b64(key)
+
+
+def generate_keypairs(n: int) -> list[tuple[str, str]]:
+    """Generate ``n`` key pairs in one call."""
+    return [generate_keypair() for _ in range(n)]
+
+
+def derive_public_key(private_b64: str) -> str:
+    """Return the base64 public key for a base64 WireGuard private key (like ``wg pubkey``)."""
+    raw = base64.b64decode(private_b64, validate=True)
+    if len(raw) != 32:
+        raise ValueError("WireGuard private key must be 32 bytes")
+    return _public_b64(X25519PrivateKey.from_private_bytes(raw))
+
+
+class KeyPool:
+    """Thread-safe stock of pre-generated key pairs.
+
+    ``take`` / ``take_many`` never wait for the refill thread: when the stock
+    runs dry they generate the missing pairs inline.
+    """
+
+    def __init__(self, size: int = WG_KEY_POOL_SIZE, low_water: int = WG_KEY_POOL_LOW_WATER):
+        self.size = size
+        self.low_water = min(low_water, size)
+        self._keys: deque[tuple[str, str]] = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def start(self) -> None:
+        """Fill the pool in the background."""
+        self._schedule_refill()
+
+    def take(self) -> tuple[str, str]:
+        return self.take_many(1)[0]
+
+    def take_many(self, n: int) -> list[tuple[str, str]]:
+        with self._lock:
+            got = [self._keys.popleft() for _ in range(min(n, len(self._keys)))]
+        if len(got) < n:
+            got.extend(generate_keypairs(n - len(got)))
+        if len(self._keys) < self.low_water or not self._keys:
+            self._schedule_refill()
+        return got
+
+    def _schedule_refill(self) -> None:
+        if self.size <= 0:
+            return
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="wg-key-pool", daemon=True).start()
+
+    def _refill(self) -> None:
+        try:
+            while len(self._keys) < self.size:
+                batch = generate_keypairs(min(32, self.size - len(self._keys)))
+                with self._lock:
+                    self._keys.extend(batch)
+        except Exception:
+            logger.exception("[WG_KEYS] key pool refill failed")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+
+key_pool = KeyPool()